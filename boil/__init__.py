@@ -1,3 +1,21 @@
-from boil.boil import Boiler
-from boil.boil import Plate
-__all__ = ['Boiler', 'Plate']
+import importlib
+
+__all__ = ['Boiler', 'Plate', 'AsyncBoiler', 'Stats', 'OutputCache', 'SQLiteCatalog', 'BinaryCatalog', 'SnapshotCatalog', 'DirectoryCatalog', 'LayeredCatalog', 'SearchResult', 'write_file', 'scaffold', 'stream_requests', 'plate_layers']
+
+_SUBMODULES = ('boil', 'core', 'layers', 'search', 'aio', 'files', 'scaffold',
+               'server', 'client', 'cli')
+
+
+def __getattr__(name):
+    '''Imports public names and submodules when they are first used.'''
+
+    if name in __all__:
+        value = getattr(importlib.import_module('boil.boil'), name)
+    elif name in _SUBMODULES:
+        value = importlib.import_module('boil.' + name)
+    else:
+        raise AttributeError('module {0!r} has no attribute {1!r}'.format(
+            __name__, name))
+
+    globals()[name] = value
+    return value
@@ -0,0 +1,146 @@
+'''asyncio interface to a Boiler.'''
+
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from boil.core import Boiler
+
+
+class AsyncBoiler:
+    '''asyncio interface to a thread-safe Boiler.
+
+    Database access and generation of plates with more than
+    offload_funcs functions run on a bounded thread pool. Plates are
+    shared through the Boiler's cache, and concurrent lookups of the
+    same uncached plate wait on a single database query. Generated
+    code goes through the Boiler's output cache, if it has one.
+    '''
+
+    _DEF_OFFLOAD_FUNCS = 256
+
+    def __init__(self, template_directory=None, max_workers=4,
+                 offload_funcs=_DEF_OFFLOAD_FUNCS, **kwargs):
+        '''Creates a thread-safe Boiler. Other keyword arguments are
+        passed to Boiler.'''
+
+        kwargs['thread_safe'] = True
+        self.boiler = Boiler(template_directory, **kwargs)
+        self.offload_funcs = offload_funcs
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._pending = {}  # Lookups in progress by cache key
+        self._checked = float('-inf')   # Last catalog check
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        # Waiting for the thread pool would block the event loop
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+    def close(self):
+        '''Stops the thread pool and closes the Boiler.'''
+
+        self._executor.shutdown(wait=True)
+        self.boiler.close()
+
+    def _run(self, func, *args):
+        '''Runs func on the thread pool. Returns an awaitable.'''
+
+        return asyncio.get_running_loop().run_in_executor(
+            self._executor, func, *args)
+
+    async def get_plate(self, lang=None, ext=None):
+        '''Returns the Plate for a language or extension.'''
+
+        key = Boiler._plate_key(lang, ext)
+
+        # A changed catalog is reloaded synchronously, so check it on
+        # the thread pool, at most once every check_interval seconds
+        if self.boiler._refresh is not None:
+            now = time.monotonic()
+            if now - self._checked >= self.boiler.check_interval:
+                self._checked = now
+                await self._run(self.boiler._refresh_catalog)
+
+        cached, plate = self.boiler._cache_lookup(key)
+
+        if not cached:
+            future = self._pending.get(key)
+
+            if future is None:
+                future = asyncio.ensure_future(
+                    self._run(self.boiler._load_plate, key))
+                self._pending[key] = future
+                future.add_done_callback(
+                    lambda _: self._pending.pop(key, None))
+
+            # Cancelling one waiter must not cancel the shared lookup
+            plate = await asyncio.shield(future)
+
+        return Boiler._found(plate)
+
+    async def plate(self, lang=None, ext=None, options=None):
+        '''Creates boilerplate code for a specific language.'''
+
+        boiler = self.boiler
+
+        plate = await self.get_plate(lang=lang, ext=ext)
+        options = Boiler._generate_options(options)
+        funcs = options['funcs']
+
+        offload = not hasattr(funcs, '__len__') or len(funcs) > self.offload_funcs
+
+        # An output cache directory is only read and written on the pool
+        key = None
+        if boiler.output_cache is not None:
+            if boiler.output_cache.directory is not None:
+                offload = True
+                key, code = await self._run(boiler._output_get, plate, options)
+            else:
+                key, code = boiler._output_get(plate, options)
+
+            if code is not None:
+                return code
+
+        if offload:
+            return await self._run(boiler._generate, plate, options, key)
+
+        return boiler._generate(plate, options, key)
+
+    async def plate_many(self, requests):
+        '''Creates boilerplate code for (lang, ext, options) requests.
+
+        Returns a list of results in request order. A request whose
+        plate cannot be found gets its LookupError instead of code.
+        '''
+
+        async def plate_or_error(lang, ext, options):
+            try:
+                return await self.plate(lang=lang, ext=ext, options=options)
+            except LookupError as exception:
+                return exception
+
+        return await asyncio.gather(
+            *[plate_or_error(*request) for request in requests])
+
+    async def supported_languages(self):
+        '''Returns a sorted list of supported languages.'''
+
+        return await self._run(self.boiler.supported_languages)
+
+    async def supported_extensions(self):
+        '''Returns a sorted list of supported extensions.'''
+
+        return await self._run(self.boiler.supported_extensions)
+
+    async def search(self, term, limit=Boiler._DEF_SEARCH_LIMIT):
+        '''Returns SearchResults for languages and extensions.'''
+
+        return await self._run(self.boiler.search, term, limit)
+
+    async def split_filename(self, filename):
+        '''Returns the (name, extension) of a file name.'''
+
+        return await self._run(self.boiler.split_filename, filename)
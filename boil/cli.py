@@ -0,0 +1,319 @@
+'''Command line interface of boil.
+
+A running daemon is found with the client and layer modules alone, so
+the catalog code is only imported when plates are read locally.
+'''
+
+import os
+import sys
+import time
+import argparse
+import warnings
+
+from boil.client import BoilClient
+from boil.layers import plate_layers
+
+
+def parse():
+    '''Parses command line arguments'''
+
+    # Main parser
+    parser = argparse.ArgumentParser(
+        description='Simple boilerplate code generator.')
+
+    parser.add_argument('-E', '--lext', '--list-ext', '--list-extensions',
+                        action='store_true',
+                        help=r'List all %(prog)s\'s supported languages')
+
+    parser.add_argument('-L', '--llang', '--list-lang', '--list-languages',
+                        action='store_true',
+                        help=r'List all %(prog)s\'s supported extensions')
+
+    parser.add_argument('--search', metavar='TERM',
+                        help='Find languages and extensions similar to TERM' \
+                             ' (prefix TERM with "." to only search extensions)')
+
+    parser.add_argument('--serve', nargs='?', const=True, metavar='SOCKET',
+                        help='Run a daemon that answers requests on a Unix socket' \
+                             ' (default: $BOIL_SOCKET, or boil.sock in' \
+                             ' $XDG_RUNTIME_DIR or /tmp/boil-UID)')
+
+    parser.add_argument('--http', metavar='HOST:PORT',
+                        help='Serve plates, languages and extensions over HTTP')
+
+    parser.add_argument('--no-daemon', action='store_true',
+                        help='Do not send requests to a running daemon')
+
+    parser.add_argument('--cache-dir', metavar='DIR',
+                        default=os.environ.get('BOIL_CACHE_DIR'),
+                        help='Cache generated code in DIR, shared between runs' \
+                             ' (default: $BOIL_CACHE_DIR, or no cache)')
+
+    parser.add_argument('--stats', action='store_true',
+                        help='Print a breakdown of time spent in each stage to stderr')
+
+    # Search parser
+    searches = parser.add_argument_group('code selection')
+
+    searches.add_argument('-e', '--ext', '--extension', metavar='EXTENSION',
+                          help='Explicitly name an extension to use.')
+
+    searches.add_argument('-l', '--lang', '--language', metavar='LANGUAGE',
+                          help='Explicitly name a language to use.')
+
+    # Generation parser
+    options = parser.add_argument_group('code options')
+
+    options.add_argument('--title', '--classname', metavar='NAME',
+                         help='Specify a class name / title for languages that use one' \
+                        ' (default: uses filename without extension)')
+
+    options.add_argument('-f', '--force', action='store_true',
+                         help='Overwrite a file if one already exists' \
+                         ' (default: %(prog)s will exit with an error code of 2)')
+
+    options.add_argument('-m', '--meth', '--method', action='append',
+                         default=[],
+                         metavar='METHOD',
+                         help='Generates an empty method (can be used multiple times)')
+
+    options.add_argument('--meth-file', '--method-file',
+                         type=argparse.FileType('r'), metavar='PATH',
+                         help='Generates an empty method for each line of a file' \
+                              ' (use - for stdin)')
+
+    options.add_argument('-n', '--line', '--newline', action='store_true',
+                         default=False,
+                         help='Use a newline after a function declaration' \
+                              ' (default: single space)')
+
+    options.add_argument('-s', '--space', '--spaces', nargs='?',
+                         type=int, default=0, const=4, metavar='COUNT',
+                         help='Expand indentation into space characters' \
+                              ' (default: uses tab characters, or 4 spaces if a number is'
+                              ' not provided)')
+
+    # Output parser
+    output = parser.add_argument_group('output options')
+
+    output.add_argument('--jsonl', action='store_true',
+                        help='Read JSON requests from stdin, one per line,' \
+                             ' and write one JSON result per line to stdout')
+
+    output.add_argument('--jobs', type=int, metavar='N',
+                        help='With --jsonl, answer requests on N threads' \
+                             ' and write results as they finish')
+
+    output.add_argument('--project', type=argparse.FileType('r'),
+                        metavar='MANIFEST',
+                        help='Generate every file listed in a JSON manifest')
+
+    output.add_argument('-x', '--exec', '--executable', action='store_true',
+                        help='Attempts to make the file executable with chmod u+x')
+    output.add_argument('file', nargs='?',
+                        help='Boilerplate file to be created. Returns filename for piping' \
+                             ' (default: print code to stdout)')
+
+    return vars(parser.parse_args())
+
+def create_template_file(filepath, chunks, force=False, executable=False):
+    '''Saves chunks of text to filepath.'''
+
+    from boil.files import write_file
+
+    try:
+        write_file(filepath, chunks, force=force, executable=executable)
+    except FileExistsError:
+        print(
+            'File cannot be written because it already exists.' \
+            ' Use -f to overwrite.\n', file=sys.stderr)
+        sys.exit(2)
+
+def create_project(boiler, parser):
+    '''Generates every file listed in a project manifest.
+
+    The manifest is a JSON list of entries, or an object with
+    "files" and optional "defaults" entries. Command line code and
+    output options are used as defaults.
+    '''
+
+    import json
+    from boil.scaffold import scaffold
+
+    with parser.get('project') as manifest_file:
+        manifest = json.load(manifest_file)
+
+    if isinstance(manifest, list):
+        manifest = {'files': manifest}
+
+    defaults = {
+        'lang': parser.get('lang'),
+        'ext': parser.get('ext'),
+        'meth': parser.get('meth'),
+        'line': parser.get('line'),
+        'space': parser.get('space'),
+        'exec': parser.get('exec'),
+        'force': parser.get('force')
+    }
+    defaults.update(manifest.get('defaults', {}))
+
+    entries = [dict(defaults, **entry) if isinstance(entry, dict) else entry
+               for entry in manifest['files']]
+
+    status = 0
+    for index, (path, error) in enumerate(scaffold(boiler, entries)):
+        if path is None:
+            path = 'files[{0}]'.format(index)
+
+        if error is None:
+            print(path)
+        elif isinstance(error, LookupError):
+            print('{0}: {1}'.format(path, error), file=sys.stderr)
+            status = max(status, 1)
+        elif isinstance(error, FileExistsError):
+            print('{0}: File cannot be written because it already exists.' \
+                  ' Use -f to overwrite.'.format(path), file=sys.stderr)
+            status = max(status, 2)
+        else:
+            print('{0}: {1}'.format(path, error), file=sys.stderr)
+            status = max(status, 1)
+
+    if status:
+        sys.exit(status)
+
+def read_methods(methfile):
+    '''Yields method names from each non-empty line of a file.'''
+
+    with methfile:
+        for line in methfile:
+            line = line.strip()
+            if line:
+                yield line
+
+def create_template(boiler, parser):
+    '''Generates template from boiler with parser options.'''
+
+    filepath = parser.get('file')
+
+    name = None
+    ext = None
+
+    if parser.get('ext'):
+        ext = parser.get('ext')
+    elif filepath:
+        filename = os.path.split(filepath)[1]
+        name, ext = boiler.split_filename(filename)
+
+    if parser.get('title'):
+        name = parser.get('title')
+
+    funcs = parser.get('meth')
+    if parser.get('meth_file'):
+        from itertools import chain
+        funcs = chain(funcs, read_methods(parser.get('meth_file')))
+
+    try:
+        # Generate boilerplate code
+        chunks = boiler.plate_iter(ext=ext,
+                                   lang=parser.get('lang'),
+                                   options={
+                                       'name': name,
+                                       'funcs': funcs,
+                                       'newlines': parser.get('line'),
+                                       'spaces': parser.get('space')
+                                   })
+
+    except LookupError as exeption:
+        print(str(exeption), file=sys.stderr)
+        sys.exit(1)
+
+    recorder = getattr(boiler, 'recorder', None)
+    start = time.perf_counter()
+
+    if filepath:
+        create_template_file(filepath,
+                             chunks,
+                             force=parser.get('force'),
+                             executable=parser.get('exec'))
+        print(filepath)
+    else:
+        sys.stdout.writelines(chunks)
+
+    # Output is streamed, so exclude time spent generating chunks
+    if recorder is not None:
+        generate = recorder.snapshot()['timers'].get('generate', {})
+        recorder.record('write', time.perf_counter() - start
+                        - generate.get('seconds', 0.0))
+
+def main():
+    '''Main script to run from command line.'''
+
+    # Prepare boiler templates
+    parser = parse()
+
+    # Report skipped plate files without the source line
+    warnings.formatwarning = lambda message, *_: '{0}\n'.format(message)
+
+    # Show help page
+    if parser.get('help'):
+        parser.print_help()
+        return
+
+    if parser.get('serve'):
+        # Clean up the socket when terminated
+        import signal
+        from boil.server import serve
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+        serve(None if parser.get('serve') is True else parser.get('serve'))
+        return
+
+    if parser.get('http'):
+        from boil.server import serve_http
+        host, _, port = parser.get('http').rpartition(':')
+        serve_http((host or 'localhost', int(port)))
+        return
+
+    # Use a running daemon unless methods are streamed from a file,
+    # stats are requested, many files are generated locally or the
+    # daemon serves other plate layers
+    layers = plate_layers()
+
+    boiler = None
+    if not parser.get('no_daemon') and not parser.get('meth_file') \
+            and not parser.get('stats') and not parser.get('project') \
+            and not parser.get('jsonl'):
+        boiler = BoilClient.connect(layers=layers)
+
+    # Only a local Boiler needs the catalog code
+    if boiler is None:
+        from boil.core import Boiler, OutputCache
+
+        output_cache = None
+        if parser.get('cache_dir'):
+            output_cache = OutputCache(directory=parser.get('cache_dir'))
+
+        boiler = Boiler(layers, stats=parser.get('stats'),
+                        output_cache=output_cache,
+                        thread_safe=bool(parser.get('jobs')))
+
+    if parser.get('llang'):
+        print('\n'.join(boiler.supported_languages()))
+    elif parser.get('lext'):
+        print('\n'.join(boiler.supported_extensions()))
+    elif parser.get('search'):
+        for result in boiler.search(parser.get('search')):
+            print('.' + result.alias if result.kind == 'extension'
+                  else result.alias)
+    elif parser.get('project'):
+        create_project(boiler, parser)
+    elif parser.get('jsonl'):
+        from boil.scaffold import stream_requests
+        stream_requests(boiler, sys.stdin, sys.stdout,
+                        max_workers=parser.get('jobs'))
+    else:
+        create_template(boiler, parser)
+
+    if parser.get('stats'):
+        from boil.core import Stats
+        print(Stats.format(boiler.stats()), file=sys.stderr)
@@ -0,0 +1,195 @@
+'''Client for a running boil daemon.'''
+
+import os
+import stat
+
+
+def _socket_directory():
+    '''Returns the per-user directory of the fallback daemon socket.'''
+
+    return '/tmp/boil-{0}'.format(os.getuid())
+
+
+def default_socket_path():
+    '''Returns the Unix socket path of the boil daemon.
+
+    Uses $BOIL_SOCKET if set, otherwise a socket in $XDG_RUNTIME_DIR
+    or in a per-user directory in /tmp that only the user can access.
+    '''
+
+    if os.environ.get('BOIL_SOCKET'):
+        return os.environ['BOIL_SOCKET']
+
+    if os.environ.get('XDG_RUNTIME_DIR'):
+        return os.path.join(os.environ['XDG_RUNTIME_DIR'], 'boil.sock')
+
+    return os.path.join(_socket_directory(), 'boil.sock')
+
+
+def _is_private(path, is_type):
+    '''Returns whether path is of a type, owned by the current user and
+    inaccessible to anyone else. Symbolic links are not followed.
+    '''
+
+    info = os.lstat(path)
+
+    return is_type(info.st_mode) and info.st_uid == os.getuid() \
+        and not info.st_mode & 0o077
+
+
+def _layer_key(paths):
+    '''Returns the absolute paths of a catalog path or list of layers.'''
+
+    if not isinstance(paths, (list, tuple)):
+        paths = [paths]
+
+    return [os.path.abspath(path) for path in paths]
+
+
+class BoilClient:
+    '''Client for a boil daemon, with the same interface as Boiler.'''
+
+    def __init__(self, path=None):
+        '''Connects to the daemon listening at path.'''
+
+        import socket
+
+        self.path = default_socket_path() if path is None else path
+
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self._socket.connect(self.path)
+        except OSError:
+            self._socket.close()
+            raise
+
+        self._file = self._socket.makefile('rwb')
+
+    @classmethod
+    def connect(cls, path=None, layers=None):
+        '''Returns a client if a daemon is running, otherwise None.
+
+        Only a daemon run by the current user is used: the socket must
+        be theirs and inaccessible to others, and so must the process
+        listening on it, where the system reports it. If layers, like
+        plate_layers() returns, are given, the daemon is only used if
+        it serves the same layers.
+        '''
+
+        if path is None:
+            path = default_socket_path()
+
+        try:
+            if not _is_private(path, stat.S_ISSOCK):
+                return None
+            client = cls(path)
+        except OSError:
+            return None
+
+        try:
+            usable = client._peer_uid() in (None, os.getuid()) \
+                and (layers is None or client.layers() == _layer_key(layers))
+        except (OSError, RuntimeError):
+            usable = False
+
+        if not usable:
+            client.close()
+            return None
+
+        return client
+
+    def _peer_uid(self):
+        '''Returns the user id of the daemon process, or None if unknown.'''
+
+        import socket
+        import struct
+
+        if not hasattr(socket, 'SO_PEERCRED'):
+            return None
+
+        credentials = struct.Struct('3i')
+        _, uid, _ = credentials.unpack(self._socket.getsockopt(
+            socket.SOL_SOCKET, socket.SO_PEERCRED, credentials.size))
+
+        return uid
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        '''Closes the connection to the daemon.'''
+
+        self._file.close()
+        self._socket.close()
+
+    def _request(self, **request):
+        '''Sends a request and returns the response text.'''
+
+        import json
+
+        self._file.write(json.dumps(request).encode('utf-8') + b'\n')
+        self._file.flush()
+
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError('The boil daemon closed the connection.')
+
+        response = json.loads(line)
+
+        if 'error' in response:
+            if response['type'] == 'LookupError':
+                raise LookupError(response['error'])
+            raise RuntimeError(response['error'])
+
+        return response['text']
+
+    def layers(self):
+        '''Returns the absolute paths of the daemon's plate layers.'''
+
+        return self._request(action='layers')
+
+    def supported_languages(self):
+        '''Returns a sorted list of supported languages.'''
+
+        return self._request(action='languages')
+
+    def supported_extensions(self):
+        '''Returns a sorted list of supported extensions.'''
+
+        return self._request(action='extensions')
+
+    def search(self, term, limit=None):
+        '''Returns SearchResults for languages and extensions.
+
+        By default, the daemon's Boiler limits the number of results.
+        '''
+
+        from boil.search import SearchResult
+
+        request = {'action': 'search', 'term': term}
+        if limit is not None:
+            request['limit'] = limit
+
+        return [SearchResult(*result) for result in self._request(**request)]
+
+    def split_filename(self, filename):
+        '''Returns the (name, extension) of a file name.'''
+
+        return tuple(self._request(action='split', filename=filename))
+
+    def plate(self, lang=None, ext=None, options=None):
+        '''Creates boilerplate code for a specific language.'''
+
+        if options is not None and options.get('funcs'):
+            options = dict(options, funcs=list(options['funcs']))
+
+        return self._request(action='plate', lang=lang, ext=ext,
+                             options=options)
+
+    def plate_iter(self, lang=None, ext=None, options=None):
+        '''Returns boilerplate code as a single chunk.'''
+
+        return [self.plate(lang=lang, ext=ext, options=options)]
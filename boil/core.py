@@ -0,0 +1,2379 @@
+'''Plate catalogs, compiled plates and the Boiler that generates code.'''
+
+import re
+import os
+import errno
+import time
+import struct
+import bisect
+import weakref
+import warnings
+import threading
+from collections import OrderedDict, namedtuple
+
+from boil.layers import default_plates_path
+
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+# One loaded state of a SnapshotCatalog
+_Snapshot = namedtuple('_Snapshot', ['generation', 'signature', 'templates',
+                                     'keys', 'aliases', 'languages',
+                                     'extensions', 'postings'])
+
+# Folds ASCII case only, matching SQLite's NOCASE collation
+_NOCASE = str.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZ',
+                        'abcdefghijklmnopqrstuvwxyz')
+
+
+def _fold(text):
+    '''Returns text with ASCII case folded, like translate(_NOCASE).'''
+
+    # lower() is much faster, and only differs outside ASCII
+    return text.lower() if text.isascii() else text.translate(_NOCASE)
+
+
+def trigrams(text):
+    '''Returns the set of trigrams of an alias or search term.
+
+    Text is case folded and padded, so that the start and end of a
+    short alias still make trigrams.
+    '''
+
+    padded = '  ' + text.translate(_NOCASE) + ' '
+
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+_INCLUDE = re.compile(r'\{BP_INCLUDE\s+([^{}\s]+)\s*\}')
+
+
+def include_names(template):
+    '''Returns the names of the partials a template includes.'''
+
+    return _INCLUDE.findall(template)
+
+
+def resolve_includes(template, partial, _including=()):
+    '''Replaces {BP_INCLUDE name} placeholders with partial text.
+
+    partial returns the text of a named partial, or None. A partial's
+    final newline is dropped, so that an include can sit on a line of
+    its own. Raises ValueError for unknown or recursive partials.
+    '''
+
+    if '{BP_INCLUDE' not in template:
+        return template
+
+    def include(match):
+        name = match.group(1)
+
+        if name in _including:
+            raise ValueError('Partial "{0}" includes itself.'.format(name))
+
+        text = partial(name)
+        if text is None:
+            raise ValueError('Unknown partial "{0}".'.format(name))
+
+        if text.endswith('\n'):
+            text = text[:-1]
+
+        return resolve_includes(text, partial, _including + (name,))
+
+    return _INCLUDE.sub(include, template)
+
+
+def plate_aliases(file_name):
+    '''Returns the (names, extensions, file names) of a plate file name.
+
+    Names come before the first dot and are separated by commas.
+    Extensions are separated by dots, or by commas if an extension
+    contains a dot, as in "ts,d.ts". Entries starting with "=" are
+    whole file names, as in "=Makefile".
+
+    Raises ValueError for dotfiles and names without a language and
+    an extension, such as "README" or ".DS_Store".
+    '''
+
+    plate_name, _, file_ext = file_name.partition('.')
+    names = plate_name.split(',')
+    entries = file_ext.split(',' if ',' in file_ext else '.')
+
+    if not all(names) or not all(entry.lstrip('=') for entry in entries):
+        raise ValueError('Not a plate file name: ' + file_name)
+
+    exts = [entry for entry in entries if not entry.startswith('=')]
+    file_names = [entry[1:] for entry in entries if entry.startswith('=')]
+
+    return (names, exts, file_names)
+
+
+def decode_template(data, codec=None):
+    '''Returns the text of a stored template.
+
+    codec is None for plain text, or "zlib" or "lzma" for compressed
+    UTF-8 blobs.
+    '''
+
+    if codec is None:
+        return data
+
+    if codec == 'zlib':
+        import zlib
+        return zlib.decompress(data).decode('utf-8')
+
+    if codec == 'lzma':
+        import lzma
+        return lzma.decompress(data).decode('utf-8')
+
+    raise ValueError('Unsupported template codec: ' + codec)
+
+
+class SQLiteCatalog:
+    '''Plate catalog stored in a SQLite database.'''
+
+    # Database layout version written by prepare.py
+    SCHEMA_VERSION = 6
+
+    _QUERY = {
+        'languages': '''
+            SELECT alias
+            FROM aliases
+            WHERE kind = 'name'
+            ORDER BY alias;''',
+
+        'extensions': '''
+            SELECT '.' || alias
+            FROM aliases
+            WHERE kind = 'extension'
+            ORDER BY alias;''',
+
+        'byAlias': '''
+            SELECT t.template, t.codec
+            FROM aliases a
+            JOIN templates t ON t.id = a.template_id
+            WHERE a.kind = ? AND a.alias = ?;''',
+
+        'partial': '''
+            SELECT t.template, t.codec
+            FROM partials p
+            JOIN templates t ON t.id = p.template_id
+            WHERE p.name = ?;''',
+
+        'suffixes': '''
+            SELECT kind, alias
+            FROM aliases
+            WHERE kind IN ('extension', 'filename');''',
+
+        'byKind': '''
+            SELECT alias
+            FROM aliases
+            WHERE kind = ?
+            ORDER BY alias;''',
+
+        'byPrefix': '''
+            SELECT alias
+            FROM aliases
+            WHERE kind = ? AND alias >= ? AND alias < ?
+            ORDER BY alias
+            LIMIT ?;''',
+
+        'trigramCounts': '''
+            SELECT trigram, count
+            FROM trigram_counts
+            WHERE trigram IN ({0});''',
+
+        'byTrigrams': '''
+            SELECT DISTINCT kind, alias
+            FROM trigrams
+            WHERE trigram IN ({0});''',
+
+        'partials': '''
+            SELECT p.name, t.template, t.codec
+            FROM partials p
+            JOIN templates t ON t.id = p.template_id;''',
+
+        'aliasTemplates': '''
+            SELECT id, template, codec
+            FROM templates
+            WHERE id IN (SELECT template_id FROM aliases);''',
+
+        'aliases': '''
+            SELECT kind, alias, template_id
+            FROM aliases;'''
+    }
+
+    def __init__(self, path, thread_safe=False, pool_size=8):
+        '''Opens a read-only connection to the database at path.
+
+        If thread_safe is True, each query checks out its own
+        connection from a pool that keeps up to pool_size idle
+        connections.
+        '''
+
+        self.path = path
+        self.thread_safe = thread_safe
+        self.pool_size = pool_size
+
+        self.con = None         # Database connection
+        self._pool = []         # Idle connections in thread-safe mode
+        self._lock = threading.Lock()
+        self._closed = False
+
+        con = self._connect()
+
+        version = con.execute('PRAGMA user_version').fetchone()[0]
+        if version != SQLiteCatalog.SCHEMA_VERSION:
+            con.close()
+            raise ValueError('Plate database {0} has layout version {1}, not'
+                             ' {2}. Rebuild it with prepare.py.'.format(
+                                 path, version, SQLiteCatalog.SCHEMA_VERSION))
+
+        if thread_safe:
+            self._pool.append(con)
+        else:
+            self.con = con
+
+    def close(self):
+        '''Closes all database connections.'''
+
+        with self._lock:
+            self._closed = True
+            connections = self._pool + [self.con]
+            self._pool = []
+            self.con = None
+
+        for con in connections:
+            if con is not None:
+                con.close()
+
+    def _connect(self):
+        '''Opens a read-only connection to the plate database.'''
+
+        import sqlite3
+
+        # Only these are special in a URI file name, and escaping them
+        # here saves importing urllib at startup
+        path = os.path.abspath(self.path)
+        for char, escape in (('%', '%25'), ('?', '%3f'), ('#', '%23')):
+            path = path.replace(char, escape)
+
+        uri = 'file:{0}?mode=ro'.format(path)
+
+        return sqlite3.connect(uri, uri=True,
+                               check_same_thread=not self.thread_safe)
+
+    def _acquire(self):
+        '''Returns a connection for the current query.'''
+
+        if not self.thread_safe:
+            if self.con is None:
+                import sqlite3
+                raise sqlite3.ProgrammingError('Cannot operate on a closed catalog.')
+            return self.con
+
+        with self._lock:
+            if self._closed:
+                import sqlite3
+                raise sqlite3.ProgrammingError('Cannot operate on a closed catalog.')
+            if self._pool:
+                return self._pool.pop()
+
+        return self._connect()
+
+    def _release(self, con):
+        '''Returns a connection to the pool.'''
+
+        if not self.thread_safe:
+            return
+
+        with self._lock:
+            if not self._closed and len(self._pool) < self.pool_size:
+                self._pool.append(con)
+                return
+
+        con.close()
+
+    def _get_query(self, query, *args, sql=None):
+        '''Returns all rows of a query, or of sql if given.
+
+        Statements are prepared once per connection by sqlite3's
+        statement cache.
+        '''
+
+        con = self._acquire()
+
+        try:
+            return con.execute(sql or SQLiteCatalog._QUERY[query],
+                               args).fetchall()
+        finally:
+            self._release(con)
+
+    def languages(self):
+        '''Returns a sorted list of language names.'''
+
+        return list(x[0] for x in self._get_query('languages'))
+
+    def extensions(self):
+        '''Returns a sorted list of dotted extensions.'''
+
+        return list(x[0] for x in self._get_query('extensions'))
+
+    def template(self, lang=None, ext=None):
+        '''Returns the template for a language or undotted extension.
+
+        A language match takes precedence over an extension match, and
+        ext may also be a whole file name. Included partials are
+        resolved.
+        '''
+
+        for kind, alias in (('name', lang), ('extension', ext),
+                            ('filename', ext)):
+            if alias is not None:
+                rows = self._get_query('byAlias', kind, alias)
+                if rows:
+                    return resolve_includes(decode_template(*rows[0]),
+                                            self.partial)
+
+        return None
+
+    def suffixes(self):
+        '''Returns the (kind, alias) pairs of extensions and file names.'''
+
+        return self._get_query('suffixes')
+
+    def aliases(self, kind):
+        '''Returns the sorted aliases of a kind.'''
+
+        return [x[0] for x in self._get_query('byKind', kind)]
+
+    def partial(self, name):
+        '''Returns the unresolved text of a partial, or None.'''
+
+        rows = self._get_query('partial', name)
+
+        return decode_template(*rows[0]) if rows else None
+
+    def complete(self, kind, prefix, limit):
+        '''Returns up to limit sorted aliases of a kind starting with prefix.'''
+
+        # Every UTF-8 string with the prefix sorts below this bound
+        return [x[0] for x in self._get_query(
+            'byPrefix', kind, prefix, prefix + '\U0010ffff', limit)]
+
+    def _get_trigram_query(self, query, grams):
+        '''Returns all rows of a query over a list of trigrams.'''
+
+        grams = sorted(grams)
+        sql = SQLiteCatalog._QUERY[query].format(', '.join('?' * len(grams)))
+
+        return self._get_query(None, *grams, sql=sql)
+
+    def trigram_counts(self, grams):
+        '''Returns the number of aliases containing each of grams.'''
+
+        counts = dict.fromkeys(grams, 0)
+        counts.update(self._get_trigram_query('trigramCounts', grams))
+
+        return counts
+
+    def trigram_aliases(self, grams):
+        '''Returns the (kind, alias) pairs containing any of grams.'''
+
+        return self._get_trigram_query('byTrigrams', grams)
+
+    def entries(self):
+        '''Returns a (kind, alias, template) tuple for every alias.
+
+        Templates are resolved, and aliases of the same template text
+        share one string. All rows are read in a single transaction.
+        '''
+
+        con = self._acquire()
+
+        try:
+            con.execute('BEGIN')
+            try:
+                partials = {name: decode_template(template, codec)
+                            for name, template, codec in
+                            con.execute(SQLiteCatalog._QUERY['partials'])}
+
+                texts = {}
+                templates = {}
+                for template_id, template, codec in con.execute(
+                        SQLiteCatalog._QUERY['aliasTemplates']):
+                    text = resolve_includes(decode_template(template, codec),
+                                            partials.get)
+                    templates[template_id] = texts.setdefault(text, text)
+
+                return [(kind, alias, templates[template_id])
+                        for kind, alias, template_id in
+                        con.execute(SQLiteCatalog._QUERY['aliases'])]
+            finally:
+                con.rollback()
+        finally:
+            self._release(con)
+
+
+class _IndexedCatalog:
+    '''Base of catalogs whose aliases are indexed in memory.
+
+    Subclasses keep a _Snapshot in self._snapshot, and look up its
+    templates mapping of kind to {folded alias: entry}.
+    '''
+
+    # Alias kinds, in lookup order
+    _KINDS = ('name', 'extension', 'filename')
+
+    @staticmethod
+    def _index(generation, signature, entries):
+        '''Returns a _Snapshot of (kind, alias, entry) tuples.
+
+        The first entry of an alias is kept, ignoring ASCII case.
+        '''
+
+        templates = {kind: {} for kind in _IndexedCatalog._KINDS}
+        spellings = {kind: {} for kind in _IndexedCatalog._KINDS}
+
+        for kind, alias, entry in entries:
+            folded = _fold(alias)
+            if folded not in templates[kind]:
+                templates[kind][folded] = entry
+                spellings[kind][folded] = alias
+
+        # Folded aliases sort like SQLite's NOCASE collation
+        keys = {kind: sorted(spellings[kind]) for kind in _IndexedCatalog._KINDS}
+        aliases = {kind: tuple(spellings[kind][key] for key in keys[kind])
+                   for kind in _IndexedCatalog._KINDS}
+
+        return _Snapshot(generation, signature, templates, keys, aliases,
+                         aliases['name'],
+                         tuple('.' + alias for alias in aliases['extension']),
+                         {})
+
+    def _entry(self, lang=None, ext=None):
+        '''Returns the entry of a language or undotted extension, or None.
+
+        A language match takes precedence over an extension match, and
+        ext may also be a whole file name.
+        '''
+
+        templates = self._snapshot.templates
+
+        for kind, alias in (('name', lang), ('extension', ext),
+                            ('filename', ext)):
+            if alias is not None:
+                entry = templates[kind].get(_fold(alias))
+                if entry is not None:
+                    return entry
+
+        return None
+
+    def languages(self):
+        '''Returns a sorted tuple of language names.'''
+
+        return self._snapshot.languages
+
+    def extensions(self):
+        '''Returns a sorted tuple of dotted extensions.'''
+
+        return self._snapshot.extensions
+
+    def suffixes(self):
+        '''Returns the (kind, alias) pairs of extensions and file names.'''
+
+        aliases = self._snapshot.aliases
+
+        return [(kind, alias) for kind in ('extension', 'filename')
+                for alias in aliases[kind]]
+
+    def aliases(self, kind):
+        '''Returns the sorted aliases of a kind.'''
+
+        return self._snapshot.aliases[kind]
+
+    def complete(self, kind, prefix, limit):
+        '''Returns up to limit sorted aliases of a kind starting with prefix.'''
+
+        snapshot = self._snapshot
+        keys = snapshot.keys[kind]
+        prefix = prefix.translate(_NOCASE)
+
+        start = bisect.bisect_left(keys, prefix)
+        end = bisect.bisect_left(keys, prefix + '\U0010ffff', start)
+
+        return list(snapshot.aliases[kind][start:min(end, start + limit)])
+
+    @staticmethod
+    def _postings(snapshot):
+        '''Returns the snapshot's (kind, alias) pairs by trigram.
+
+        The index is built on first use.
+        '''
+
+        postings = snapshot.postings
+
+        if not postings:
+            built = {}
+            for kind, aliases in snapshot.aliases.items():
+                for alias in aliases:
+                    for gram in trigrams(alias):
+                        built.setdefault(gram, []).append((kind, alias))
+            postings.update(built)
+
+        return postings
+
+    def trigram_counts(self, grams):
+        '''Returns the number of aliases containing each of grams.'''
+
+        postings = _IndexedCatalog._postings(self._snapshot)
+
+        return {gram: len(postings.get(gram, ())) for gram in grams}
+
+    def trigram_aliases(self, grams):
+        '''Returns the (kind, alias) pairs containing any of grams.'''
+
+        postings = _IndexedCatalog._postings(self._snapshot)
+
+        return list({pair for gram in grams for pair in postings.get(gram, ())})
+
+
+class SnapshotCatalog(_IndexedCatalog):
+    '''Plate catalog held in memory, loaded eagerly from a database.
+
+    Every alias and its resolved template are read into dictionaries
+    when the catalog opens, so lookups never query the database.
+    refresh() notices when the database file is rebuilt or updated, by
+    its inode, size and modification time, and swaps in a new snapshot.
+    '''
+
+    _DEF_CHECK_INTERVAL = 1.0
+
+    def __init__(self, path, check_interval=_DEF_CHECK_INTERVAL):
+        '''Loads a snapshot of the database at path.
+
+        refresh() checks the database file at most once every
+        check_interval seconds.
+        '''
+
+        self.path = path
+        self.check_interval = check_interval
+
+        self._reloading = threading.Lock()
+        self._checked = time.monotonic()
+        self._snapshot = self._load(0)
+
+    def close(self):
+        '''Does nothing. The database is only open while loading.'''
+
+    @property
+    def generation(self):
+        '''The number of snapshots swapped in since the catalog opened.'''
+
+        return self._snapshot.generation
+
+    def _signature(self):
+        '''Returns the identity, size and modification time of the file.'''
+
+        info = os.stat(self.path)
+
+        return (info.st_dev, info.st_ino, info.st_size, info.st_mtime_ns)
+
+    def _load(self, generation):
+        '''Returns a new _Snapshot of the database.'''
+
+        # Taken before reading, so a change made while loading is
+        # picked up by the next refresh
+        signature = self._signature()
+
+        source = SQLiteCatalog(self.path)
+        try:
+            entries = source.entries()
+        finally:
+            source.close()
+
+        return _IndexedCatalog._index(generation, signature, entries)
+
+    def refresh(self, force=False):
+        '''Swaps in a new snapshot if the database file has changed.
+
+        The file is checked at most once every check_interval seconds,
+        unless force is True. One thread loads the new snapshot while
+        others keep reading the current one, and the swap is a single
+        assignment. If loading fails, the current snapshot is kept and
+        the load is retried at the next check. Returns the generation
+        of the current snapshot.
+        '''
+
+        snapshot = self._snapshot
+        now = time.monotonic()
+
+        if not force and now - self._checked < self.check_interval:
+            return snapshot.generation
+
+        self._checked = now
+
+        try:
+            changed = self._signature() != snapshot.signature
+        except OSError:
+            # The file is being replaced
+            changed = False
+
+        if changed and self._reloading.acquire(blocking=False):
+            import sqlite3
+
+            try:
+                if self._snapshot is snapshot:
+                    self._snapshot = self._load(snapshot.generation + 1)
+            except (OSError, ValueError, sqlite3.Error):
+                pass
+            finally:
+                self._reloading.release()
+
+        return self._snapshot.generation
+
+    def template(self, lang=None, ext=None):
+        '''Returns the template for a language or undotted extension.
+
+        A language match takes precedence over an extension match, and
+        ext may also be a whole file name.
+        '''
+
+        return self._entry(lang, ext)
+
+
+class DirectoryCatalog(_IndexedCatalog):
+    '''Plate catalog read straight from a plates directory.
+
+    Plate file names are indexed when the catalog opens, following
+    plate_aliases(). Template files are only read, and their partials
+    resolved, the first time they are looked up, so opening a
+    directory takes time in its number of files, not their size.
+    Files whose names are not plate names, such as dotfiles and editor
+    swap files, are skipped with a warning. refresh() notices when
+    plate or partial files are added, removed or changed, by their
+    size and modification time, and indexes the directory again.
+    '''
+
+    # Directory of partials, relative to the plates directory
+    PARTIALS_DIR = 'partials'
+
+    def __init__(self, path, check_interval=SnapshotCatalog._DEF_CHECK_INTERVAL):
+        '''Indexes the plate files in the directory at path.
+
+        refresh() checks the files at most once every check_interval
+        seconds.
+        '''
+
+        self.path = path
+        self.check_interval = check_interval
+
+        self._reloading = threading.Lock()
+        self._checked = time.monotonic()
+        self._load(0)
+
+    @property
+    def generation(self):
+        '''The number of times the directory was indexed again.'''
+
+        return self._snapshot.generation
+
+    def _signature(self):
+        '''Returns the (name, size, modification time) of the plate files
+        and of the partial files.
+        '''
+
+        def files(directory):
+            return tuple(sorted(
+                (entry.name, info.st_size, info.st_mtime_ns)
+                for entry in os.scandir(directory) if entry.is_file()
+                for info in [entry.stat()]))
+
+        partials_path = os.path.join(self.path, DirectoryCatalog.PARTIALS_DIR)
+
+        return (files(self.path),
+                files(partials_path) if os.path.isdir(partials_path) else ())
+
+    def _load(self, generation):
+        '''Indexes the directory and swaps in a new snapshot.'''
+
+        signature = self._signature()
+        plates, partials = signature
+
+        # When plates share an alias, the first file name keeps it
+        entries = []
+        for file_name, _, _ in plates:
+            try:
+                found = plate_aliases(file_name)
+            except ValueError as error:
+                warnings.warn('{0}: {1}'.format(self.path, error),
+                              stacklevel=3)
+                continue
+
+            entries.extend((kind, alias, file_name) for kind, aliases
+                           in zip(_IndexedCatalog._KINDS, found)
+                           for alias in aliases)
+
+        self._partial_names = frozenset(name for name, _, _ in partials)
+        self._templates = {}    # Resolved templates by file name
+        self._partials = {}     # Partial text by name
+        self._snapshot = _IndexedCatalog._index(generation, signature, entries)
+
+    def refresh(self, force=False):
+        '''Indexes the directory again if its files have changed.
+
+        The files are checked at most once every check_interval
+        seconds, unless force is True. Returns the generation of the
+        current index.
+        '''
+
+        snapshot = self._snapshot
+        now = time.monotonic()
+
+        if not force and now - self._checked < self.check_interval:
+            return snapshot.generation
+
+        self._checked = now
+
+        if self._reloading.acquire(blocking=False):
+            try:
+                if self._snapshot is snapshot \
+                        and self._signature() != snapshot.signature:
+                    self._load(snapshot.generation + 1)
+            except OSError:
+                # The directory is being changed
+                pass
+            finally:
+                self._reloading.release()
+
+        return self._snapshot.generation
+
+    def close(self):
+        '''Does nothing. Files are only open while being read.'''
+
+    @staticmethod
+    def _read(path):
+        '''Returns the text of a plate or partial file.'''
+
+        with open(path, 'rb') as plate_file:
+            return plate_file.read().decode('utf-8')
+
+    def partial(self, name):
+        '''Returns the unresolved text of a partial, or None.'''
+
+        if name not in self._partial_names:
+            return None
+
+        text = self._partials.get(name)
+        if text is None:
+            try:
+                text = DirectoryCatalog._read(os.path.join(
+                    self.path, DirectoryCatalog.PARTIALS_DIR, name))
+            except FileNotFoundError:
+                # Deleted since the directory was indexed
+                self.refresh(force=True)
+                return None
+            self._partials[name] = text
+
+        return text
+
+    def template(self, lang=None, ext=None):
+        '''Returns the template for a language or undotted extension.
+
+        A language match takes precedence over an extension match, and
+        ext may also be a whole file name. Included partials are
+        resolved. A plate file deleted since the directory was indexed
+        is a miss, and the directory is indexed again.
+        '''
+
+        file_name = self._entry(lang, ext)
+        if file_name is None:
+            return None
+
+        template = self._templates.get(file_name)
+        if template is None:
+            try:
+                text = DirectoryCatalog._read(os.path.join(self.path, file_name))
+            except FileNotFoundError:
+                self.refresh(force=True)
+                return None
+
+            template = self._templates[file_name] = resolve_includes(
+                text, self.partial)
+
+        return template
+
+
+class LayeredCatalog(_IndexedCatalog):
+    '''Stack of plate catalogs, where higher layers override lower ones.
+
+    The aliases of every layer are merged into one index when the stack
+    opens, so a lookup only asks the layer that owns the alias, however
+    many layers there are. A layer's partials are only included by its
+    own plates.
+    '''
+
+    def __init__(self, layers):
+        '''Stacks open catalogs, highest precedence first.'''
+
+        self.layers = list(layers)
+
+        # Snapshot catalogs among the layers, which may change
+        self._refreshes = [layer.refresh for layer in self.layers
+                           if hasattr(layer, 'refresh')]
+        self._merging = threading.Lock()
+        self._snapshot = self._merge(0)
+
+    def close(self):
+        '''Closes every layer.'''
+
+        for layer in self.layers:
+            layer.close()
+
+    @property
+    def generation(self):
+        '''The number of times the layers were merged again.'''
+
+        return self._snapshot.generation
+
+    def _merge(self, generation):
+        '''Returns a _Snapshot mapping each alias to its top layer.'''
+
+        signature = tuple(layer.generation for layer in self.layers
+                          if hasattr(layer, 'refresh'))
+
+        entries = [(kind, alias, layer) for layer in self.layers
+                   for kind in _IndexedCatalog._KINDS
+                   for alias in layer.aliases(kind)]
+
+        return _IndexedCatalog._index(generation, signature, entries)
+
+    def refresh(self, force=False):
+        '''Refreshes snapshot layers, and merges them again if any changed.
+
+        Returns the generation of the merged index.
+        '''
+
+        snapshot = self._snapshot
+
+        if not self._refreshes:
+            return snapshot.generation
+
+        signature = tuple(refresh(force) for refresh in self._refreshes)
+
+        if signature != snapshot.signature \
+                and self._merging.acquire(blocking=False):
+            try:
+                if self._snapshot is snapshot:
+                    self._snapshot = self._merge(snapshot.generation + 1)
+            finally:
+                self._merging.release()
+
+        return self._snapshot.generation
+
+    def template(self, lang=None, ext=None):
+        '''Returns the template for a language or undotted extension.
+
+        A language match in any layer takes precedence over an
+        extension match, and ext may also be a whole file name.
+        '''
+
+        templates = self._snapshot.templates
+
+        for kind, alias in (('name', lang), ('extension', ext),
+                            ('filename', ext)):
+            if alias is not None:
+                layer = templates[kind].get(_fold(alias))
+                if layer is not None:
+                    if kind == 'name':
+                        return layer.template(lang=alias)
+                    return layer.template(ext=alias)
+
+        return None
+
+
+class BinaryCatalog:
+    '''Plate catalog stored in a compact binary snapshot.
+
+    The file is a header, a template table, sorted name, extension
+    and file name indexes, a sorted trigram index, and UTF-8 string
+    and posting data. It is read through a single mmap, and templates are only
+    decoded when requested.
+    '''
+
+    MAGIC = b'BOILCAT\0'
+    VERSION = 3
+
+    # magic, version, reserved, template, name, extension, file name and
+    # trigram counts
+    _HEADER = struct.Struct('<8sHHIIIII')
+
+    # Alias kinds, in index order
+    _KINDS = ('name', 'extension', 'filename')
+
+    # Template (offset, length), alias (offset, length, template) and
+    # trigram (offset, length, postings offset, postings count)
+    _TEMPLATE = struct.Struct('<II')
+    _ALIAS = struct.Struct('<III')
+    _TRIGRAM = struct.Struct('<IIII')
+
+    # Postings are alias numbers, counted across the alias indexes in order
+    _POSTING = struct.Struct('<I')
+
+    def __init__(self, path):
+        '''Maps the catalog at path into memory.'''
+
+        import mmap
+
+        self.path = path
+
+        with open(path, 'rb') as catalog_file:
+            self._map = mmap.mmap(catalog_file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+
+        magic, version, _, templates, names, exts, files, grams = \
+            BinaryCatalog._HEADER.unpack_from(self._map)
+
+        if magic != BinaryCatalog.MAGIC or version != BinaryCatalog.VERSION:
+            self._map.close()
+            raise ValueError('Unsupported plate catalog: ' + path)
+
+        self._templates = (BinaryCatalog._HEADER.size, templates)
+        self._names = (self._templates[0]
+                       + templates * BinaryCatalog._TEMPLATE.size, names)
+        self._exts = (self._names[0] + names * BinaryCatalog._ALIAS.size, exts)
+        self._files = (self._exts[0] + exts * BinaryCatalog._ALIAS.size, files)
+        self._grams = (self._files[0] + files * BinaryCatalog._ALIAS.size, grams)
+
+        # Alias (start, count) indexes by kind
+        self._indexes = dict(zip(BinaryCatalog._KINDS,
+                                 (self._names, self._exts, self._files)))
+
+    def close(self):
+        '''Unmaps the catalog.'''
+
+        self._map.close()
+
+    @classmethod
+    def write(cls, path, templates, names, extensions, file_names=()):
+        '''Writes a catalog to path.
+
+        templates is a list of template text. names, extensions and
+        file_names are lists of (alias, template index) pairs.
+        '''
+
+        indexes = [sorted(aliases, key=lambda a: a[0].translate(_NOCASE))
+                   for aliases in (names, extensions, file_names)]
+        aliases = [alias for index in indexes for alias, _ in index]
+
+        # Map each trigram to the numbers of the aliases that contain it
+        postings = {}
+        for number, alias in enumerate(aliases):
+            for gram in trigrams(alias):
+                postings.setdefault(gram, []).append(number)
+
+        data = bytearray()
+        data_start = cls._HEADER.size \
+            + len(templates) * cls._TEMPLATE.size \
+            + len(aliases) * cls._ALIAS.size \
+            + len(postings) * cls._TRIGRAM.size
+
+        def add_string(text):
+            offset = data_start + len(data)
+            encoded = text.encode('utf-8')
+            data.extend(encoded)
+            return offset, len(encoded)
+
+        header = [cls._HEADER.pack(cls.MAGIC, cls.VERSION, 0, len(templates),
+                                   *(len(index) for index in indexes),
+                                   len(postings))]
+
+        for template in templates:
+            header.append(cls._TEMPLATE.pack(*add_string(template)))
+
+        for index in indexes:
+            for alias, template in index:
+                header.append(cls._ALIAS.pack(*add_string(alias), template))
+
+        for gram in sorted(postings):
+            numbers = postings[gram]
+            offset = add_string(gram)
+            header.append(cls._TRIGRAM.pack(*offset, data_start + len(data),
+                                            len(numbers)))
+            for number in numbers:
+                data.extend(cls._POSTING.pack(number))
+
+        # Replace any existing catalog atomically
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as catalog_file:
+            catalog_file.writelines(header)
+            catalog_file.write(data)
+        os.replace(temp_path, path)
+
+    def _string(self, offset, length):
+        return self._map[offset:offset + length].decode('utf-8')
+
+    def _alias(self, index, i):
+        '''Returns the (alias, template index) of an index entry.'''
+
+        offset, length, template = BinaryCatalog._ALIAS.unpack_from(
+            self._map, index[0] + i * BinaryCatalog._ALIAS.size)
+
+        return self._string(offset, length), template
+
+    def _lower_bound(self, index, key):
+        '''Returns the first entry of an alias index not below a folded key.'''
+
+        low, high = 0, index[1]
+
+        while low < high:
+            mid = (low + high) // 2
+
+            if self._alias(index, mid)[0].translate(_NOCASE) < key:
+                low = mid + 1
+            else:
+                high = mid
+
+        return low
+
+    def _find(self, index, key):
+        '''Binary searches an alias index. Returns a template index.'''
+
+        key = key.translate(_NOCASE)
+        i = self._lower_bound(index, key)
+
+        if i < index[1]:
+            alias, template = self._alias(index, i)
+            if alias.translate(_NOCASE) == key:
+                return template
+
+        return None
+
+    def _postings(self, gram):
+        '''Binary searches the trigram index.
+
+        Returns the (offset, count) of the gram's postings.
+        '''
+
+        low, high = 0, self._grams[1]
+
+        while low < high:
+            mid = (low + high) // 2
+            offset, length, postings, count = BinaryCatalog._TRIGRAM.unpack_from(
+                self._map, self._grams[0] + mid * BinaryCatalog._TRIGRAM.size)
+            found = self._string(offset, length)
+
+            if found < gram:
+                low = mid + 1
+            elif found > gram:
+                high = mid
+            else:
+                return postings, count
+
+        return 0, 0
+
+    def languages(self):
+        '''Returns a sorted list of language names.'''
+
+        return [self._alias(self._names, i)[0] for i in range(self._names[1])]
+
+    def extensions(self):
+        '''Returns a sorted list of dotted extensions.'''
+
+        return ['.' + self._alias(self._exts, i)[0]
+                for i in range(self._exts[1])]
+
+    def template(self, lang=None, ext=None):
+        '''Returns the template for a language or undotted extension.'''
+
+        index = None
+
+        if lang is not None:
+            index = self._find(self._names, lang)
+
+        if index is None and ext is not None:
+            index = self._find(self._exts, ext)
+
+        if index is None and ext is not None:
+            index = self._find(self._files, ext)
+
+        if index is None:
+            return None
+
+        offset, length = BinaryCatalog._TEMPLATE.unpack_from(
+            self._map, self._templates[0] + index * BinaryCatalog._TEMPLATE.size)
+
+        return self._string(offset, length)
+
+    def complete(self, kind, prefix, limit):
+        '''Returns up to limit sorted aliases of a kind starting with prefix.'''
+
+        index = self._indexes[kind]
+        prefix = prefix.translate(_NOCASE)
+        aliases = []
+
+        i = self._lower_bound(index, prefix)
+        while i < index[1] and len(aliases) < limit:
+            alias = self._alias(index, i)[0]
+            if not alias.translate(_NOCASE).startswith(prefix):
+                break
+            aliases.append(alias)
+            i += 1
+
+        return aliases
+
+    def trigram_counts(self, grams):
+        '''Returns the number of aliases containing each of grams.'''
+
+        return {gram: self._postings(gram)[1] for gram in grams}
+
+    def trigram_aliases(self, grams):
+        '''Returns the (kind, alias) pairs containing any of grams.'''
+
+        numbers = set()
+        for gram in grams:
+            offset, count = self._postings(gram)
+            numbers.update(number for number, in BinaryCatalog._POSTING.iter_unpack(
+                self._map[offset:offset + count * BinaryCatalog._POSTING.size]))
+
+        results = []
+        for number in sorted(numbers):
+            for kind in BinaryCatalog._KINDS:
+                index = self._indexes[kind]
+                if number < index[1]:
+                    results.append((kind, self._alias(index, number)[0]))
+                    break
+                number -= index[1]
+
+        return results
+
+    def suffixes(self):
+        '''Returns the (kind, alias) pairs of extensions and file names.'''
+
+        return [(kind, self._alias(self._indexes[kind], i)[0])
+                for kind in ('extension', 'filename')
+                for i in range(self._indexes[kind][1])]
+
+    def aliases(self, kind):
+        '''Returns the sorted aliases of a kind.'''
+
+        index = self._indexes[kind]
+
+        return [self._alias(index, i)[0] for i in range(index[1])]
+
+
+class Stats:
+    '''Stage timers and counters for an instrumented Boiler.
+
+    If a hook is given, it is called as hook(kind, name, value) for
+    every timing ("timer", stage, seconds) and counter increment
+    ("counter", name, amount), so they can be exported elsewhere.
+    '''
+
+    def __init__(self, hook=None):
+        self.hook = hook
+        self._timers = {}       # [calls, seconds] by stage
+        self._counters = {}     # Totals by name
+        self._lock = threading.Lock()
+
+    def count(self, name, amount=1):
+        '''Adds amount to a counter.'''
+
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+        if self.hook is not None:
+            self.hook('counter', name, amount)
+
+    def record(self, stage, seconds):
+        '''Adds one timed call of a stage.'''
+
+        with self._lock:
+            timer = self._timers.setdefault(stage, [0, 0.0])
+            timer[0] += 1
+            timer[1] += seconds
+
+        if self.hook is not None:
+            self.hook('timer', stage, seconds)
+
+    def time(self, stage):
+        '''Returns a context manager that times a stage.'''
+
+        return _StageTimer(self, stage)
+
+    def snapshot(self):
+        '''Returns a dict of {"timers": {stage: {"calls", "seconds"}},
+        "counters": {name: total}}.'''
+
+        with self._lock:
+            return {
+                'timers': {stage: {'calls': calls, 'seconds': seconds}
+                           for stage, (calls, seconds) in self._timers.items()},
+                'counters': dict(self._counters)
+            }
+
+    def reset(self):
+        '''Clears all timers and counters.'''
+
+        with self._lock:
+            self._timers.clear()
+            self._counters.clear()
+
+    @staticmethod
+    def format(snapshot):
+        '''Returns a snapshot as a human-readable breakdown.'''
+
+        lines = ['{0:<10} {1:>8} {2:>12}'.format('stage', 'calls', 'ms')]
+
+        for stage, timer in snapshot['timers'].items():
+            lines.append('{0:<10} {1:>8} {2:>12.3f}'.format(
+                stage, timer['calls'], timer['seconds'] * 1000))
+
+        for name, total in sorted(snapshot['counters'].items()):
+            lines.append('{0:<19} {1:>12}'.format(name, total))
+
+        return '\n'.join(lines)
+
+
+class _StageTimer:
+    '''Context manager that records the time spent in a stage.'''
+
+    def __init__(self, stats, stage):
+        self.stats = stats
+        self.stage = stage
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.stats.record(self.stage, time.perf_counter() - self.start)
+
+
+class OutputCache:
+    '''LRU cache of generated code, bounded by total UTF-8 size.
+
+    Entries are keyed on a plate's template digest and its normalized
+    generate options. If a directory is given, entries are also
+    written there, so separate processes can share them. The
+    directory is bounded by max_bytes too: when it grows past them,
+    the least recently used entries, by modification time, are
+    removed until it is back under 3/4 of max_bytes.
+    '''
+
+    _DEF_MAX_BYTES = 16 * 1024 * 1024
+
+    def __init__(self, max_bytes=_DEF_MAX_BYTES, directory=None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+
+        self._entries = OrderedDict()   # (text, size) by key
+        self._bytes = 0
+        self._disk_bytes = None # Directory size, measured on first write
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(plate, options):
+        '''Returns the cache key of a plate and Plate.generate options.'''
+
+        import json
+        import hashlib
+
+        normalized = json.dumps([plate.digest, options['name'],
+                                 list(options['funcs']),
+                                 bool(options['newlines']), options['spaces']])
+
+        return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key[2:])
+
+    def get(self, key):
+        '''Returns cached text, or None.'''
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return entry[0]
+
+        text = None
+        if self.directory is not None:
+            path = self._path(key)
+            try:
+                with open(path, 'rb') as cache_file:
+                    text = cache_file.read().decode('utf-8')
+                # Mark the entry as recently used
+                os.utime(path)
+            except OSError:
+                pass
+
+        with self._lock:
+            if text is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+
+        self._remember(key, text)
+
+        return text
+
+    def put(self, key, text):
+        '''Caches text under key.'''
+
+        data = self._remember(key, text)
+
+        if self.directory is not None and len(data) <= self.max_bytes:
+            path = self._path(key)
+            temp_path = '{0}.{1}.{2}.tmp'.format(path, os.getpid(),
+                                                 threading.get_ident())
+
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(temp_path, 'wb') as cache_file:
+                    cache_file.write(data)
+                os.replace(temp_path, path)
+            except OSError:
+                return
+
+            self._grow(len(data))
+
+    def _entry_files(self):
+        '''Returns the (modification time, size, path) of entry files.'''
+
+        files = []
+
+        for directory in os.scandir(self.directory):
+            if not directory.is_dir(follow_symlinks=False):
+                continue
+
+            for entry in os.scandir(directory.path):
+                if entry.name.endswith('.tmp'):
+                    continue
+                try:
+                    info = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                files.append((info.st_mtime_ns, info.st_size, entry.path))
+
+        return files
+
+    def _grow(self, size):
+        '''Counts a written entry, and evicts old entries from the
+        directory if it grew past max_bytes.
+
+        Other processes may write to the directory too, so its size is
+        measured again before evicting.
+        '''
+
+        with self._lock:
+            if self._disk_bytes is not None:
+                self._disk_bytes += size
+                if self._disk_bytes <= self.max_bytes:
+                    return
+
+            # Only one thread measures and evicts at a time
+            self._disk_bytes = 0
+
+        try:
+            files = self._entry_files()
+        except OSError:
+            return
+
+        total = sum(size for _, size, _ in files)
+
+        if total > self.max_bytes:
+            files.sort()
+            for _, size, path in files:
+                if total <= self.max_bytes * 3 // 4:
+                    break
+                try:
+                    os.unlink(path)
+                except OSError:
+                    continue
+                total -= size
+
+        with self._lock:
+            self._disk_bytes += total
+
+    def _remember(self, key, text):
+        '''Stores text in memory, evicting old entries. Returns its UTF-8.'''
+
+        data = text.encode('utf-8')
+
+        with self._lock:
+            if len(data) > self.max_bytes:
+                return data
+
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+
+            self._entries[key] = (text, len(data))
+            self._bytes += len(data)
+
+            while self._bytes > self.max_bytes:
+                self._bytes -= self._entries.popitem(last=False)[1][1]
+
+        return data
+
+    def info(self):
+        '''Returns a dict of hits, misses, entries and bytes in memory.'''
+
+        with self._lock:
+            return {'hits': self._hits, 'misses': self._misses,
+                    'entries': len(self._entries), 'bytes': self._bytes}
+
+    def clear(self):
+        '''Clears the in-memory cache and its statistics.'''
+
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._hits = 0
+            self._misses = 0
+
+
+class Boiler:
+    '''Boilerplate code template manager.'''
+
+    _DEF_CACHE_SIZE = 128
+
+    _DEF_POOL_SIZE = 8
+
+    _DEF_SEARCH_LIMIT = 10
+
+    # Number of suggestions in an unknown plate error
+    _SUGGESTIONS = 3
+
+    # Reversed-suffix trie end markers
+    _EXT_END = 1
+    _FILE_END = 2
+
+    @staticmethod
+    def _get_default_plates_path():
+        '''Returns the default path to the plates database.'''
+
+        return default_plates_path()
+
+    @classmethod
+    def from_directory(cls, path, **kwargs):
+        '''Returns a Boiler reading plates straight from a directory.
+
+        The directory is laid out like the one prepare.py builds a
+        database from, with partials in a "partials" subdirectory.
+        Only file names are read up front. Other keyword arguments are
+        passed to the constructor.
+        '''
+
+        if not os.path.isdir(path):
+            raise NotADirectoryError(errno.ENOTDIR, os.strerror(errno.ENOTDIR),
+                                     path)
+
+        return cls(path, **kwargs)
+
+    def __init__(self, template_directory=None, cache_size=_DEF_CACHE_SIZE,
+                 thread_safe=False, pool_size=_DEF_POOL_SIZE, stats=False,
+                 stats_hook=None, output_cache=None, snapshot=False,
+                 check_interval=SnapshotCatalog._DEF_CHECK_INTERVAL):
+        '''Boiler constructor. Opens connection to plate database.
+
+        Up to cache_size plates are cached by language and extension.
+        A cache_size of None is unbounded, and 0 disables caching.
+
+        If thread_safe is True, the Boiler may be shared between
+        threads. Each database query then checks out its own read-only
+        connection from a pool that keeps up to pool_size idle
+        connections.
+
+        If stats is True or a stats_hook is given, stage timings and
+        counters are recorded and returned by stats().
+
+        If an OutputCache is given, generated code is looked up there
+        before generating it.
+
+        If snapshot is True, a plate database is loaded into memory as a
+        SnapshotCatalog, which is checked for changes at most once every
+        check_interval seconds. Plate directories are checked as often.
+        Cached plates are dropped when a rebuilt database or a changed
+        directory is swapped in.
+        '''
+
+        self.plates_path = None # Absolute path to boilerplate templates
+        self.catalog = None     # Template storage
+
+        # Instrumentation, or None when disabled
+        self.recorder = Stats(stats_hook) if stats or stats_hook else None
+
+        self.output_cache = output_cache
+
+        self.thread_safe = thread_safe
+        self.pool_size = pool_size
+        self.snapshot = snapshot
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+
+        self._refresh = None    # Catalog refresh, or None
+        self._generation = 0    # Catalog generation of the cached plates
+
+        self.cache_size = cache_size
+        self._cache = OrderedDict() # Plates (or LookupErrors) by (lang, ext)
+        self._cache_hits = 0
+        self._cache_misses = 0
+
+        self._suffixes = None   # Reversed-suffix trie, built on first use
+
+        self.load_templates(template_directory)
+
+    def __del__(self):
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        '''Closes the template catalog.'''
+
+        if self.catalog is not None:
+            self.catalog.close()
+
+    def load_templates(self, path=None):
+        '''Loads boilerplate code template file info.
+
+        If a path is not provided, it will default to the "paths"
+        folder located in the source code directory. Paths ending in
+        ".cat" are loaded as binary catalogs, directories as plate
+        directories, and other paths as snapshot catalogs in snapshot
+        mode. A list of paths, like plate_layers() returns, is loaded
+        as a LayeredCatalog with the first path on top.
+        '''
+
+        if path is None:
+            self.plates_path = Boiler._get_default_plates_path()
+        else:
+            self.plates_path = path
+
+        self.close()
+
+        start = time.perf_counter()
+
+        if isinstance(self.plates_path, (list, tuple)):
+            layers = []
+            try:
+                for layer_path in self.plates_path:
+                    layers.append(self._open_catalog(layer_path))
+            except BaseException:
+                for layer in layers:
+                    layer.close()
+                raise
+
+            self.catalog = layers[0] if len(layers) == 1 \
+                else LayeredCatalog(layers)
+        else:
+            self.catalog = self._open_catalog(self.plates_path)
+
+        if self.recorder is not None:
+            self.recorder.record('open', time.perf_counter() - start)
+
+        self._refresh = getattr(self.catalog, 'refresh', None)
+        self._generation = 0
+        self._suffixes = None
+        self.cache_clear()
+
+    def _open_catalog(self, path):
+        '''Opens the catalog at a path.'''
+
+        if path.endswith('.cat'):
+            return BinaryCatalog(path)
+
+        if os.path.isdir(path):
+            return DirectoryCatalog(path, check_interval=self.check_interval)
+
+        if self.snapshot:
+            return SnapshotCatalog(path, check_interval=self.check_interval)
+
+        return SQLiteCatalog(path, thread_safe=self.thread_safe,
+                             pool_size=self.pool_size)
+
+    def stats(self):
+        '''Returns recorded stage timings and counters.
+
+        Timers are {stage: {"calls", "seconds"}} for the open, lookup,
+        compile and generate stages. Counters include lookups, cache
+        hits and misses, and bytes generated. Returns None if
+        instrumentation is disabled.
+        '''
+
+        if self.recorder is None:
+            return None
+
+        return self.recorder.snapshot()
+
+    def cache_info(self):
+        '''Returns plate cache statistics.'''
+
+        return CacheInfo(self._cache_hits, self._cache_misses,
+                         self.cache_size, len(self._cache))
+
+    def cache_clear(self):
+        '''Clears the plate cache and its statistics.'''
+
+        with self._lock:
+            self._cache.clear()
+            self._cache_hits = 0
+            self._cache_misses = 0
+
+    def _refresh_catalog(self):
+        '''Swaps in a changed snapshot catalog or plates directory.
+
+        Plates cached from an older snapshot are dropped.
+        '''
+
+        if self._refresh is None:
+            return
+
+        generation = self._refresh()
+
+        if generation != self._generation:
+            with self._lock:
+                if generation > self._generation:
+                    self._cache.clear()
+                    self._suffixes = None
+                    self._generation = generation
+
+    def supported_languages(self):
+        '''Returns a sorted list of supported languages.
+
+        A snapshot catalog returns a shared tuple instead.
+        '''
+
+        self._refresh_catalog()
+
+        return self.catalog.languages()
+
+    def supported_extensions(self):
+        '''Returns a sorted list of supported extensions.
+
+        A snapshot catalog returns a shared tuple instead.
+        '''
+
+        self._refresh_catalog()
+
+        return self.catalog.extensions()
+
+    def _suffix_trie(self):
+        '''Returns a reversed-suffix trie of extensions and file names.
+
+        The trie is built from the catalog on first use. Each node maps
+        a case folded character to the next node, reading names from
+        their end, and "" to the _EXT_END and _FILE_END markers of the
+        dotted extensions and whole file names that end there.
+        '''
+
+        self._refresh_catalog()
+
+        generation = self._generation
+        trie = self._suffixes
+
+        if trie is None:
+            trie = {}
+
+            for kind, alias in self.catalog.suffixes():
+                if kind == 'extension':
+                    suffix, end = '.' + alias, Boiler._EXT_END
+                else:
+                    suffix, end = alias, Boiler._FILE_END
+
+                node = trie
+                for char in reversed(suffix.translate(_NOCASE)):
+                    node = node.setdefault(char, {})
+                node[''] = node.get('', 0) | end
+
+            with self._lock:
+                if generation == self._generation:
+                    self._suffixes = trie
+
+        return trie
+
+    def split_filename(self, filename):
+        '''Returns the (name, extension) of a file name.
+
+        The extension is the longest supported extension that ends the
+        file name, as in ("types", "d.ts") for "types.d.ts". A supported
+        whole file name, like "Makefile", is its own name and
+        extension. Other file names are split at their last dot, and
+        the extension is None if there is none. Takes time in the
+        length of the file name, not the number of extensions.
+        '''
+
+        node = self._suffix_trie()
+        folded = filename.translate(_NOCASE)
+        match = None
+
+        for i in range(len(folded) - 1, -1, -1):
+            node = node.get(folded[i])
+            if node is None:
+                break
+
+            end = node.get('', 0)
+            if i == 0 and end & Boiler._FILE_END:
+                return filename, filename
+            if i > 0 and end & Boiler._EXT_END:
+                match = i
+
+        if match is None:
+            match = filename.rfind('.')
+            if match <= 0:
+                return filename, None
+
+        return filename[:match], filename[match + 1:]
+
+    def search(self, term, limit=_DEF_SEARCH_LIMIT):
+        '''Returns up to limit SearchResults for languages and extensions.
+
+        Aliases starting with term rank first, then aliases that share
+        enough trigrams with it. A term starting with "." only matches
+        extensions. See boil.search.
+        '''
+
+        from boil.search import search
+
+        return search(self, term, limit)
+
+    def _unknown(self, key):
+        '''Returns the LookupError of an unknown plate key.
+
+        The message suggests the closest languages and extensions.
+        '''
+
+        lang, ext = key
+        suggestions = []
+
+        for term in (lang, None if ext is None else '.' + ext):
+            if term:
+                for result in self.search(term, Boiler._SUGGESTIONS):
+                    alias = '.' + result.alias if result.kind == 'extension' \
+                        else result.alias
+                    if alias not in suggestions:
+                        suggestions.append(alias)
+
+        message = 'Unknown language or extension.'
+        if suggestions:
+            message += ' Did you mean {0}?'.format(
+                ', '.join(suggestions[:Boiler._SUGGESTIONS]))
+
+        return LookupError(message)
+
+    def _get_template(self, lang=None, ext=None):
+        '''Returns the contents of a boilerplate template.
+
+        First searches for a language match, and then extension
+        '''
+
+        template_text = None
+
+        if ext is not None:
+            ext = ext.lstrip('.')
+
+        if lang is not None or ext is not None:
+            template_text = self.catalog.template(lang, ext)
+
+        return template_text
+
+    @staticmethod
+    def _cache_key(lang=None, ext=None):
+        '''Returns a normalized (lang, ext) pair.'''
+
+        if lang is not None:
+            lang = lang.translate(_NOCASE)
+
+        if ext is not None:
+            ext = ext.lstrip('.').translate(_NOCASE)
+
+        return (lang, ext)
+
+    @staticmethod
+    def _plate_key(lang=None, ext=None):
+        '''Returns the cache key of a plate request.'''
+
+        if (lang or ext) is None:
+            raise LookupError('Cannot generate boilerplate from info' \
+                ' provided. An extension or language is required.')
+
+        return Boiler._cache_key(lang, ext)
+
+    @staticmethod
+    def _found(plate):
+        '''Returns plate, or raises it again if it is a LookupError.'''
+
+        if isinstance(plate, LookupError):
+            # A new exception for each raise, so that threads raising the
+            # same cached error do not share a traceback
+            raise LookupError(*plate.args)
+
+        return plate
+
+    def _cache_get(self, key):
+        '''Returns (cached, plate) for a cache key.'''
+
+        self._refresh_catalog()
+
+        return self._cache_lookup(key)
+
+    def _cache_lookup(self, key):
+        '''Returns (cached, plate) for a cache key, without checking the
+        catalog for changes.
+        '''
+
+        with self._lock:
+            try:
+                plate = self._cache[key]
+            except KeyError:
+                self._cache_misses += 1
+                cached = False
+                plate = None
+            else:
+                self._cache_hits += 1
+                self._cache.move_to_end(key)
+                cached = True
+
+        if self.recorder is not None:
+            self.recorder.count('lookups')
+            self.recorder.count('cache_hits' if cached else 'cache_misses')
+
+        return cached, plate
+
+    @staticmethod
+    def _compile(template):
+        '''Returns the shared Plate of a template, or None.'''
+
+        if template is None:
+            return None
+
+        return Plate.shared(template)
+
+    def _load_plate(self, key):
+        '''Looks up and compiles a plate, and caches it.
+
+        Returns the Plate, or the LookupError of an unknown key. The
+        error suggests similar aliases, and is cached with the key, so
+        repeated misses do not search the catalog again.
+        '''
+
+        recorder = self.recorder
+        generation = self._generation
+
+        if recorder is None:
+            template = self._get_template(*key)
+            plate = self._compile(template)
+        else:
+            with recorder.time('lookup'):
+                template = self._get_template(*key)
+            with recorder.time('compile'):
+                plate = self._compile(template)
+
+        if plate is None:
+            plate = self._unknown(key)
+
+        # Unknown keys are cached as their error, unless a newer snapshot was
+        # swapped in during the lookup
+        if self.cache_size != 0:
+            with self._lock:
+                if generation != self._generation:
+                    return plate
+                self._cache[key] = plate
+                if self.cache_size is not None \
+                        and len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        return plate
+
+    def get_plate(self, lang=None, ext=None):
+        '''Returns the Plate for a language or extension.'''
+
+        key = Boiler._plate_key(lang, ext)
+
+        cached, plate = self._cache_get(key)
+        if not cached:
+            plate = self._load_plate(key)
+
+        return Boiler._found(plate)
+
+    @staticmethod
+    def _generate_options(options=None):
+        '''Returns Plate.generate keyword arguments from plate options.'''
+
+        if options is None:
+            options = {}
+        funcs = options['funcs'] if options.get('funcs') else []
+        name = options['name'] if options.get('name') else None
+        newlines = options['newlines'] if options.get('newlines') else False
+        spaces = options['spaces'] if options.get('spaces') else 0
+
+        return {
+            'name': name,
+            'funcs': funcs,
+            'newlines': newlines,
+            'spaces': spaces
+        }
+
+    def plate(self, lang=None, ext=None, options=None):
+        '''Creates boilerplate code for a specific language.'''
+
+        plate = self.get_plate(lang=lang, ext=ext)
+        options = Boiler._generate_options(options)
+
+        key, boilerplate_code = self._output_get(plate, options)
+        if boilerplate_code is not None:
+            return boilerplate_code
+
+        return self._generate(plate, options, key)
+
+    def _output_get(self, plate, options):
+        '''Returns (cache key, cached code or None) for generate options.
+
+        The key is None if there is no output cache.
+        '''
+
+        if self.output_cache is None:
+            return None, None
+
+        options['funcs'] = tuple(options['funcs'])
+        key = OutputCache.key(plate, options)
+        boilerplate_code = self.output_cache.get(key)
+
+        if self.recorder is not None:
+            self.recorder.count('output_hits' if boilerplate_code is not None
+                                else 'output_misses')
+
+        return key, boilerplate_code
+
+    def _generate(self, plate, options, key=None):
+        '''Generates code, recording it and caching it under key.'''
+
+        if self.recorder is not None:
+            with self.recorder.time('generate'):
+                boilerplate_code = plate.generate(**options)
+            self.recorder.count('bytes', len(boilerplate_code.encode('utf-8')))
+        else:
+            # Get text from plate
+            boilerplate_code = plate.generate(**options)
+
+        if key is not None:
+            self.output_cache.put(key, boilerplate_code)
+
+        return boilerplate_code
+
+    def plate_iter(self, lang=None, ext=None, options=None):
+        '''Returns an iterator over chunks of boilerplate code.
+
+        Lookup errors are raised immediately rather than on iteration.
+        Output is cached like plate() unless funcs is a lazy iterator,
+        which is streamed instead.
+        '''
+
+        if self.output_cache is not None and options is not None \
+                and isinstance(options.get('funcs') or (), (list, tuple)):
+            return [self.plate(lang=lang, ext=ext, options=options)]
+
+        plate = self.get_plate(lang=lang, ext=ext)
+        chunks = plate.generate_iter(**Boiler._generate_options(options))
+
+        if self.recorder is not None:
+            chunks = self._record_chunks(chunks)
+
+        return chunks
+
+    def _record_chunks(self, chunks):
+        '''Yields chunks, recording generation time and bytes.'''
+
+        chunks = iter(chunks)
+        size = 0
+        elapsed = 0.0
+
+        while True:
+            start = time.perf_counter()
+            chunk = next(chunks, None)
+            elapsed += time.perf_counter() - start
+
+            if chunk is None:
+                break
+
+            size += len(chunk.encode('utf-8'))
+            yield chunk
+
+        self.recorder.record('generate', elapsed)
+        self.recorder.count('bytes', size)
+
+    def plate_many(self, requests, max_workers=None, chunksize=256):
+        '''Creates boilerplate code for (lang, ext, options) requests.
+
+        Returns a list of results in request order. A request whose
+        plate cannot be found gets its LookupError instead of code.
+        Requests are grouped by plate, and if max_workers is given,
+        batches larger than chunksize are generated in a process pool.
+        '''
+
+        results = []
+        groups = OrderedDict() # (plate, [(index, options)]) by plate id
+
+        for index, (lang, ext, options) in enumerate(requests):
+            try:
+                plate = self.get_plate(lang=lang, ext=ext)
+            except LookupError as exception:
+                results.append(exception)
+                continue
+
+            results.append(None)
+            groups.setdefault(id(plate), (plate, []))[1].append(
+                (index, Boiler._generate_options(options)))
+
+        # Split each plate's requests into chunks
+        chunks = []
+        for plate, group in groups.values():
+            for start in range(0, len(group), chunksize):
+                chunks.append((plate, group[start:start + chunksize]))
+
+        start = time.perf_counter()
+
+        if max_workers is not None and len(results) > chunksize:
+            from concurrent.futures import ProcessPoolExecutor
+
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                futures = [(group, executor.submit(
+                    _generate_many, plate, [o for _, o in group]))
+                           for plate, group in chunks]
+                generated = [(group, future.result())
+                             for group, future in futures]
+        else:
+            generated = [(group, _generate_many(plate, [o for _, o in group]))
+                         for plate, group in chunks]
+
+        for group, texts in generated:
+            for (index, _), text in zip(group, texts):
+                results[index] = text
+
+        if self.recorder is not None:
+            self.recorder.record('generate', time.perf_counter() - start)
+            self.recorder.count('bytes', sum(
+                len(text.encode('utf-8'))
+                for _, texts in generated for text in texts))
+
+        return results
+def _generate_many(plate, options):
+    '''Generates a plate for each dict of Plate.generate arguments.'''
+
+    return [plate.generate(**kwargs) for kwargs in options]
+
+
+class Plate:
+    '''Boilerplate code generator.
+
+    Plates are not modified after they are compiled, so one Plate can
+    be shared by every Boiler in a process through Plate.shared().
+    '''
+
+    __slots__ = ('template', 'function', '_parts', '_function_parts',
+                 '_digest', '__weakref__')
+
+    _regex = {
+        'name': re.compile(r'\{BP_NAME\}'),
+        'fname': re.compile(r'\{BP_FNAME\}'),
+        'func': re.compile(
+            r'\n?\{BP_FUNC_BEG\}(.*?)\{BP_FUNC_END\}\n?', re.DOTALL),
+        'break': re.compile(
+            r'\{BP_BREAK_BEG\}\s*?\{BP_ALT_BEG\}(.*?)\{BP_ALT_END\}' \
+            r'\s*?\{BP_LINE_BEG\}(.*?)\{BP_LINE_END\}\s*?\{BP_BREAK_END\}',
+            re.DOTALL),
+        'break_line': re.compile(r'\{BP_LINE_BEG\}(.*?)\{BP_LINE_END\}')
+    }
+
+    default_classname = 'DEFAULT_NAME'
+
+    # Compiled placeholder segments
+    _NAME = ('name',)
+    _FNAME = ('fname',)
+    _FUNCS = ('funcs',)
+    _BREAK = 'break'
+
+    # Live plates by template text, shared across Boilers
+    _registry = weakref.WeakValueDictionary()
+    _registry_lock = threading.Lock()
+
+    def __init__(self, template):
+        '''Convert template into a useful object.'''
+
+        self.template = template
+        self._digest = None
+
+        # Extract function template
+        match = Plate._regex['func'].search(template)
+        self.function = match.groups()[0] if match else None
+
+        # Compile template and function into segments
+        segments = Plate.compile(template)
+        function_segments = Plate.compile(self.function or '',
+                                          placeholder='fname')
+
+        # Flatten segments for each newline mode, indexed by newlines
+        self._parts = tuple(tuple(Plate._flatten(segments, newlines))
+                            for newlines in (False, True))
+
+        # Function parts are split around {BP_FNAME}
+        self._function_parts = tuple(
+            Plate._split_function(function_segments, newlines)
+            for newlines in (False, True))
+
+    @property
+    def digest(self):
+        '''SHA-256 hex digest of the template text.'''
+
+        if self._digest is None:
+            import hashlib
+            self._digest = hashlib.sha256(self.template.encode('utf-8')).hexdigest()
+
+        return self._digest
+
+    def __reduce__(self):
+        '''Pickles the template only, since segments rely on identity.'''
+
+        return (Plate.shared, (self.template,))
+
+    @classmethod
+    def shared(cls, template):
+        '''Returns the process-wide Plate of a template.
+
+        Plates are registered by template text and compiled once while
+        any Boiler or caller still holds them. Unused plates are
+        collected, since the registry only keeps weak references.
+        '''
+
+        with Plate._registry_lock:
+            plate = Plate._registry.get(template)
+
+        if plate is None:
+            plate = Plate(template)
+            with Plate._registry_lock:
+                plate = Plate._registry.setdefault(template, plate)
+
+        return plate
+
+    @classmethod
+    def compile(cls, template, placeholder='name'):
+        '''Parses template text into a list of segments.
+
+        Literal text is kept as strings. Placeholders become
+        _NAME, _FNAME or _FUNCS, and breaks become tuples of
+        (_BREAK, alt segments, line segments).
+        '''
+
+        segments = []
+        start = 0
+
+        if placeholder == 'name':
+            for match in Plate._regex['func'].finditer(template):
+                segments += cls._compile_breaks(
+                    template[start:match.start()], placeholder)
+                segments.append(Plate._FUNCS)
+                start = match.end()
+
+        segments += cls._compile_breaks(template[start:], placeholder)
+
+        return segments
+
+    @classmethod
+    def _compile_breaks(cls, text, placeholder):
+        '''Parses breaks and placeholders out of text.'''
+
+        segments = []
+        start = 0
+
+        for match in Plate._regex['break'].finditer(text):
+            segments += cls._compile_placeholders(
+                text[start:match.start()], placeholder)
+            segments.append((
+                Plate._BREAK,
+                cls._compile_placeholders(match.group(1), placeholder),
+                cls._compile_placeholders(match.group(2), placeholder)))
+            start = match.end()
+
+        segments += cls._compile_placeholders(text[start:], placeholder)
+
+        return segments
+
+    @staticmethod
+    def _compile_placeholders(text, placeholder):
+        '''Splits text around a name or function name placeholder.'''
+
+        segment = Plate._NAME if placeholder == 'name' else Plate._FNAME
+        segments = []
+
+        for i, literal in enumerate(Plate._regex[placeholder].split(text)):
+            if i:
+                segments.append(segment)
+            if literal:
+                segments.append(literal)
+
+        return segments
+
+    @staticmethod
+    def _flatten(segments, newlines):
+        '''Resolves breaks and joins adjacent literal segments.'''
+
+        parts = []
+
+        for segment in segments:
+            if type(segment) is tuple and segment[0] is Plate._BREAK:
+                expanded = Plate._flatten(segment[2 if newlines else 1],
+                                          newlines)
+            else:
+                expanded = [segment]
+
+            for part in expanded:
+                if type(part) is str and parts and type(parts[-1]) is str:
+                    parts[-1] += part
+                else:
+                    parts.append(part)
+
+        return parts
+
+    @staticmethod
+    def _split_function(segments, newlines):
+        '''Returns the literal function text around each {BP_FNAME}.'''
+
+        literals = ['']
+
+        for part in Plate._flatten(segments, newlines):
+            if part is Plate._FNAME:
+                literals.append('')
+            else:
+                literals[-1] += part
+
+        return tuple(literals)
+
+    def new_template(self, name):
+        '''Returns a template with the name filled in.'''
+
+        if name is None:
+            name = Plate.default_classname
+
+        return Plate._regex['name'].sub(name, self.template)
+
+    def new_function(self, name):
+        '''Creates an empty function with the name filled in.'''
+
+        return Plate._regex['fname'].sub(name, self.function)
+
+    def insert_functions(self, template, funcs):
+        '''Insert functions into template.'''
+
+        functions = ''.join(self.new_function(f) for f in funcs)
+
+        return Plate._regex['func'].sub(functions, template)
+
+    @classmethod
+    def insert_breaks(cls, template, newlines=False):
+        '''Inserts breakpoints into template.'''
+
+        replace = r'\2' if newlines else r'\1'
+
+        return Plate._regex['break'].sub(replace, template)
+
+    @classmethod
+    def replace_tabs(cls, template, spaces=4):
+        '''Replaces template tab characters with spaces.'''
+
+        return template.expandtabs(spaces)
+
+    def generate(self, name=None, funcs=None, newlines=False, spaces=0):
+        '''Returns a custom boilerplate template.'''
+
+        if name is None:
+            name = Plate.default_classname
+
+        # Every function block is filled with the same functions
+        function = self._function_parts[bool(newlines)]
+        functions = ''.join([f.join(function) for f in funcs]) \
+            if funcs else ''
+
+        template = ''.join([
+            name if part is Plate._NAME else
+            functions if part is Plate._FUNCS else
+            part for part in self._parts[bool(newlines)]])
+
+        if spaces:
+            template = self.replace_tabs(template, spaces)
+
+        return template
+
+    def generate_iter(self, name=None, funcs=None, newlines=False, spaces=0):
+        '''Yields a custom boilerplate template in chunks.
+
+        Functions are generated one at a time, so funcs may be any
+        iterable, including a lazy one.
+        '''
+
+        chunks = self._generate_chunks(name, funcs, newlines)
+
+        if spaces:
+            chunks = Plate._expand_tabs(chunks, spaces)
+
+        return chunks
+
+    def generate_to(self, fileobj, name=None, funcs=None, newlines=False,
+                    spaces=0):
+        '''Writes a custom boilerplate template to a file object.'''
+
+        for chunk in self.generate_iter(name=name,
+                                        funcs=funcs,
+                                        newlines=newlines,
+                                        spaces=spaces):
+            fileobj.write(chunk)
+
+    def _generate_chunks(self, name, funcs, newlines):
+        '''Yields template parts with placeholders filled in.'''
+
+        if name is None:
+            name = Plate.default_classname
+
+        if funcs is None:
+            funcs = ()
+
+        parts = self._parts[bool(newlines)]
+        function = self._function_parts[bool(newlines)]
+
+        # Iterators can only fill one function block
+        if parts.count(Plate._FUNCS) > 1 and iter(funcs) is funcs:
+            funcs = list(funcs)
+
+        for part in parts:
+            if part is Plate._NAME:
+                yield name
+            elif part is Plate._FUNCS:
+                for func in funcs:
+                    yield func.join(function)
+            else:
+                yield part
+
+    @staticmethod
+    def _expand_tabs(chunks, spaces):
+        '''Expands tabs across chunks, tracking the current column.'''
+
+        column = 0
+
+        for chunk in chunks:
+            if '\t' in chunk:
+                indent = column % spaces if spaces > 0 else 0
+                chunk = (' ' * indent + chunk).expandtabs(spaces)[indent:]
+
+            line_start = max(chunk.rfind('\n'), chunk.rfind('\r')) + 1
+            if line_start:
+                column = len(chunk) - line_start
+            else:
+                column += len(chunk)
+
+            yield chunk
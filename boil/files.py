@@ -0,0 +1,105 @@
+'''Writes generated code to files.'''
+
+import os
+import stat
+import errno
+import threading
+
+
+def _copy_exclusive(source, path, mode):
+    '''Copies a file to a new file at path, created with mode.
+
+    Raises FileExistsError if path exists.
+    '''
+
+    import shutil
+
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, mode)
+    try:
+        with open(source, 'rb') as source_file, open(fd, 'wb') as new_file:
+            shutil.copyfileobj(source_file, new_file)
+    except BaseException:
+        os.unlink(path)
+        raise
+
+
+def write_file(path, chunks, force=False, executable=False):
+    '''Atomically writes text or an iterable of text chunks to path.
+
+    Missing parent directories are created. The text is written to a
+    temporary file in the same directory, created with its final
+    permission bits, and then renamed into place. Raises
+    FileExistsError if path exists and force is False. On file
+    systems without hard links, the temporary file is then copied
+    into a newly created file instead.
+
+    When force is True, symbolic links are followed, and an existing
+    file keeps its permission bits and, where allowed, its owner. A
+    file with other hard links is written in place, so every link
+    sees the new text.
+    '''
+
+    if isinstance(chunks, str):
+        chunks = (chunks,)
+
+    existing = None
+    if force:
+        path = os.path.realpath(path)
+        try:
+            existing = os.stat(path)
+        except FileNotFoundError:
+            pass
+
+    if existing is not None and existing.st_nlink > 1:
+        with open(path, 'w') as textfile:
+            textfile.writelines(chunks)
+
+        if executable:
+            os.chmod(path, stat.S_IMODE(existing.st_mode) | stat.S_IXUSR)
+        return
+
+    directory, filename = os.path.split(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    temp_path = os.path.join(directory, '.{0}.{1}.{2}.tmp'.format(
+        filename, os.getpid(), threading.get_ident()))
+
+    # Make file executable for user
+    mode = 0o666 | (stat.S_IXUSR if executable else 0)
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, mode)
+
+    try:
+        with open(fd, 'w') as textfile:
+            if existing is not None:
+                info = os.fstat(fd)
+                if (info.st_uid, info.st_gid) != (existing.st_uid,
+                                                  existing.st_gid):
+                    try:
+                        os.fchown(fd, existing.st_uid, existing.st_gid)
+                    except PermissionError:
+                        pass
+
+                os.fchmod(fd, stat.S_IMODE(existing.st_mode)
+                          | (stat.S_IXUSR if executable else 0))
+
+            textfile.writelines(chunks)
+
+        if force:
+            os.replace(temp_path, path)
+        else:
+            # Linking fails instead of replacing an existing file
+            try:
+                os.link(temp_path, path)
+            except FileExistsError:
+                raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST),
+                                      path) from None
+            except OSError:
+                # No hard links on this file system, so copy the text
+                # into a new file instead
+                _copy_exclusive(temp_path, path, mode)
+            os.unlink(temp_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
@@ -0,0 +1,112 @@
+'''Locations of the plate catalogs to stack.'''
+
+import os
+
+
+_DEF_PLATE_DIR = 'plates.db'
+
+_DEF_CATALOG = 'plates.cat'
+
+# Plates directory of a source checkout, next to the package
+_DEF_PLATES_SOURCE = 'plates'
+
+_LAYER_FILES = (_DEF_CATALOG, _DEF_PLATE_DIR, _DEF_PLATES_SOURCE)
+
+
+def default_plates_path():
+    '''Returns the default path to the plates database.
+
+    A binary catalog is preferred over the database if one exists.
+    Without either, the plates directory of a source checkout is
+    used.
+    '''
+
+    # Get directory of current code
+    source_dir = os.path.dirname(os.path.realpath(__file__))
+
+    # Get directory of boilerplate templates
+    catalog_path = os.path.join(source_dir, _DEF_CATALOG)
+    if os.path.exists(catalog_path):
+        return catalog_path
+
+    db_path = os.path.join(source_dir, _DEF_PLATE_DIR)
+    plates_path = os.path.join(os.path.dirname(source_dir),
+                               _DEF_PLATES_SOURCE)
+    if not os.path.exists(db_path) and os.path.isdir(plates_path):
+        return plates_path
+
+    return db_path
+
+
+def _layer_path(directory):
+    '''Returns the plate catalog in a layer directory, or None.
+
+    A layer directory holds a plates.cat catalog, a plates.db database
+    or a plates directory, which are preferred in that order.
+    '''
+
+    for name in _LAYER_FILES:
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            return path
+
+    return None
+
+
+def project_layer(directory=None):
+    '''Returns the project plate catalog, or None.
+
+    This is the catalog in the nearest ".boil" layer directory in
+    directory, by default the current directory, or its parents.
+    '''
+
+    directory = os.path.abspath(directory or os.getcwd())
+
+    while True:
+        layer_dir = os.path.join(directory, '.boil')
+        if os.path.isdir(layer_dir):
+            path = _layer_path(layer_dir)
+            if path is not None:
+                return path
+
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return None
+        directory = parent
+
+
+def plate_layers(directory=None):
+    '''Returns the paths of the plate catalogs to stack, highest first.
+
+    $BOIL_PATH lists layers separated by os.pathsep, each a catalog,
+    database, plates directory or layer directory. Otherwise the layers are the project
+    layer of project_layer(), a user layer in $XDG_DATA_HOME/boil
+    (default ~/.local/share/boil) and system layers in the boil
+    directory of each of $XDG_DATA_DIRS (default /usr/local/share and
+    /usr/share), where they exist. The bundled plates come last.
+    '''
+
+    environ = os.environ
+
+    if environ.get('BOIL_PATH'):
+        layers = [(_layer_path(path) if os.path.isdir(path) else None) or path
+                  for path in environ['BOIL_PATH'].split(os.pathsep) if path]
+    else:
+        data_home = environ.get('XDG_DATA_HOME') \
+            or os.path.join(os.path.expanduser('~'), '.local', 'share')
+        data_dirs = (environ.get('XDG_DATA_DIRS')
+                     or '/usr/local/share:/usr/share').split(':')
+
+        layers = [project_layer(directory)]
+        layers += [_layer_path(os.path.join(data_dir, 'boil'))
+                   for data_dir in [data_home] + data_dirs if data_dir]
+
+    layers = [path for path in layers if path is not None]
+    layers.append(default_plates_path())
+
+    # A layer found twice keeps its highest place
+    unique = {}
+    for path in layers:
+        unique.setdefault(os.path.abspath(path), path)
+
+    return list(unique.values())
@@ -0,0 +1,153 @@
+'''Generation of many files, from manifests and JSON request streams.'''
+
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from boil.files import write_file
+
+
+def _entry_options(entry, name):
+    '''Returns the Boiler.plate options of a scaffold or stream entry.'''
+
+    funcs = entry.get('meth')
+    if isinstance(funcs, str):
+        funcs = [funcs]
+    elif funcs is not None and not isinstance(funcs, list):
+        raise ValueError('"meth" must be a method name or a list of them.')
+
+    return {
+        'name': entry.get('title') or name,
+        'funcs': funcs,
+        'newlines': entry.get('line'),
+        'spaces': entry.get('space')
+    }
+
+
+def scaffold(boiler, entries, max_workers=None):
+    '''Generates and writes many files from one Boiler.
+
+    Each entry is a dict with a "path" and optional "lang", "ext",
+    "title", "meth", "line", "space", "exec" and "force" keys, named
+    like the command line options. Plates are generated in a batch,
+    and files are written concurrently with write_file(). Returns a
+    list of (path, exception or None) in entry order. An invalid
+    entry only fails itself, with a ValueError and its path, if any.
+    '''
+
+    paths = []
+    requests = []
+
+    for entry in entries:
+        path = entry.get('path') if isinstance(entry, dict) else None
+        paths.append(path)
+
+        try:
+            if not isinstance(entry, dict):
+                raise ValueError('File entries must be objects.')
+            if not isinstance(path, str) or not path:
+                raise ValueError('File entries need a "path" string.')
+
+            name, ext = boiler.split_filename(os.path.basename(path))
+            requests.append((entry.get('lang'), entry.get('ext') or ext,
+                             _entry_options(entry, name)))
+        except ValueError as error:
+            requests.append(error)
+
+    valid = [request for request in requests
+             if not isinstance(request, ValueError)]
+    texts = iter(boiler.plate_many(valid))
+    texts = [request if isinstance(request, ValueError) else next(texts)
+             for request in requests]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [None if isinstance(text, Exception) else
+                   executor.submit(write_file, path, text,
+                                   force=bool(entry.get('force')),
+                                   executable=bool(entry.get('exec')))
+                   for entry, path, text in zip(entries, paths, texts)]
+
+        results = []
+        for path, text, future in zip(paths, texts, futures):
+            error = text if future is None else future.exception()
+            results.append((path, error))
+
+    return results
+
+
+def _stream_response(boiler, line):
+    '''Answers one JSON-lines request. Returns the response dict.'''
+
+    request = None
+
+    try:
+        request = json.loads(line)
+
+        path = request.get('file')
+        name, ext = None, request.get('ext')
+        if path and not ext:
+            name, ext = boiler.split_filename(os.path.basename(path))
+
+        text = boiler.plate(lang=request.get('lang'), ext=ext,
+                            options=_entry_options(request, name))
+
+        if path:
+            write_file(path, text, force=bool(request.get('force')),
+                       executable=bool(request.get('exec')))
+            response = {'file': path}
+        else:
+            response = {'text': text}
+
+    except Exception as exception:
+        response = {'error': str(exception), 'type': type(exception).__name__}
+
+    if isinstance(request, dict) and 'id' in request:
+        response['id'] = request['id']
+
+    return response
+
+
+def stream_requests(boiler, lines, output, max_workers=None):
+    '''Answers JSON requests read one per line from lines.
+
+    Requests take the keys of scaffold() entries, with an optional
+    "file" in place of "path", and an "id" that is copied to the
+    response. Each response is written to output as one line of JSON
+    as soon as it is ready: {"text"} for generated code, {"file"} for
+    a written file, or {"error", "type"}.
+
+    Responses are in request order, unless max_workers is given. Then
+    requests are answered on a pool of max_workers threads and
+    responses are written as they finish. Only 2 * max_workers
+    requests are read ahead, so memory use does not grow with the
+    length of the stream.
+    '''
+
+    def respond(response):
+        output.write(json.dumps(response) + '\n')
+        output.flush()
+
+    if not max_workers:
+        for line in lines:
+            if line.strip():
+                respond(_stream_response(boiler, line))
+        return
+
+    pending = set()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for line in lines:
+            if not line.strip():
+                continue
+
+            if len(pending) >= 2 * max_workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    respond(future.result())
+
+            pending.add(executor.submit(_stream_response, boiler, line))
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                respond(future.result())
@@ -0,0 +1,144 @@
+'''Prefix and fuzzy search of plate languages and extensions.'''
+
+import heapq
+from collections import namedtuple
+
+from boil.core import trigrams, _NOCASE
+
+
+SearchResult = namedtuple('SearchResult', ['alias', 'kind', 'prefix', 'score'])
+
+# Lowest trigram similarity of a fuzzy search match
+_MIN_SIMILARITY = 0.3
+
+
+def similarity(term, alias):
+    '''Returns how similar an alias is to a search term, from 0 to 1.
+
+    This is the larger of their trigram similarity and their edit
+    similarity, which also counts transposed letters as one edit.
+    '''
+
+    term = term.translate(_NOCASE)
+    alias = alias.translate(_NOCASE)
+
+    term_grams = trigrams(term)
+    alias_grams = trigrams(alias)
+    shared = len(term_grams & alias_grams)
+    score = shared / (len(term_grams) + len(alias_grams) - shared)
+
+    longest = max(len(term), len(alias))
+
+    # A common prefix and suffix do not change the distance
+    start = 0
+    while start < len(term) and start < len(alias) \
+            and term[start] == alias[start]:
+        start += 1
+    end = 0
+    while end < min(len(term), len(alias)) - start \
+            and term[-1 - end] == alias[-1 - end]:
+        end += 1
+    term = term[start:len(term) - end]
+    alias = alias[start:len(alias) - end]
+
+    # Optimal string alignment distance, keeping the last two rows
+    before, last = None, list(range(len(alias) + 1))
+    for i, char in enumerate(term, 1):
+        row = [i]
+        for j, alias_char in enumerate(alias, 1):
+            row.append(min(last[j] + 1, row[j - 1] + 1,
+                           last[j - 1] + (char != alias_char)))
+            if i > 1 and j > 1 and char == alias[j - 2] \
+                    and term[i - 2] == alias_char:
+                row[j] = min(row[j], before[j - 2] + 1)
+        before, last = last, row
+
+    return max(score, 1 - last[-1] / longest)
+
+
+def search(boiler, term, limit):
+    '''Returns up to limit SearchResults for languages and extensions.
+
+    Aliases starting with term rank first, then aliases that share
+    enough trigrams with it, by similarity(). Only the catalog's
+    prefix and trigram indexes are read. A term starting with "."
+    only matches extensions.
+    '''
+
+    kinds = ('name', 'extension', 'filename')
+    if term.startswith('.'):
+        kinds = ('extension',)
+        term = term.lstrip('.')
+
+    if not term:
+        return []
+
+    boiler._refresh_catalog()
+
+    found = {}
+
+    for kind in kinds:
+        for alias in boiler.catalog.complete(kind, term, limit):
+            found[(kind, alias.translate(_NOCASE))] = (alias, True)
+
+    # Prefix matches rank first, so fuzzy matches are only needed
+    # if there are fewer than limit of them. Only the candidates
+    # sharing the most trigrams are scored by similarity().
+    if len(found) < limit:
+        for kind, alias in _similar(boiler.catalog, term, limit, kinds):
+            found.setdefault((kind, alias.translate(_NOCASE)),
+                             (alias, False))
+
+    results = []
+    for (kind, _), (alias, prefix) in found.items():
+        score = similarity(term, alias)
+
+        if prefix or score >= _MIN_SIMILARITY:
+            results.append(SearchResult(alias, kind, prefix, score))
+
+    results.sort(key=lambda result: (not result.prefix, -result.score,
+                                     result.alias.translate(_NOCASE),
+                                     result.kind))
+
+    return results[:limit]
+
+
+def _similar(catalog, term, count, kinds):
+    '''Returns up to count (kind, alias) pairs of kinds sharing the
+    most trigrams with term, most first.
+
+    Candidates must share _MIN_SIMILARITY of the term's trigrams.
+    Postings are read from the rarest trigram up, and reading stops
+    once count candidates share at least as many trigrams as an
+    alias that is only in the unread postings could.
+    '''
+
+    grams = trigrams(term)
+    min_shared = max(1, int(_MIN_SIMILARITY * len(grams) + 0.999))
+
+    counts = catalog.trigram_counts(grams)
+    order = sorted(grams, key=counts.get)
+
+    shared = {}     # Trigrams shared with term, by candidate
+    best = []       # Heap of the count highest shared counts
+
+    for read, gram in enumerate(order):
+        unread = len(order) - read
+        if unread < min_shared or (len(best) == count and best[0] >= unread):
+            break
+
+        for pair in catalog.trigram_aliases([gram]):
+            if pair not in shared and pair[0] in kinds:
+                padded = '  ' + pair[1].translate(_NOCASE) + ' '
+                found = shared[pair] = sum(map(padded.__contains__, grams))
+
+                if len(best) < count:
+                    heapq.heappush(best, found)
+                elif found > best[0]:
+                    heapq.heapreplace(best, found)
+
+    # Of candidates sharing as many trigrams, those closer in length
+    # to the term can be fewer edits away
+    return heapq.nlargest(
+        count, (pair for pair in shared if shared[pair] >= min_shared),
+        key=lambda pair: (shared[pair], -abs(len(pair[1]) - len(term))))
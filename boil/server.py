@@ -0,0 +1,422 @@
+'''The boil daemon and HTTP API.'''
+
+import os
+import json
+import stat
+import time
+import errno
+import socket
+import hashlib
+import selectors
+import threading
+import http.server
+import socketserver
+from urllib.parse import urlsplit, parse_qs
+from concurrent.futures import ThreadPoolExecutor
+
+from boil.core import Boiler
+from boil.client import default_socket_path, _socket_directory, _is_private, \
+    _layer_key
+from boil.layers import plate_layers
+
+
+def _private_directory(path):
+    '''Creates a directory that only the current user can access.
+
+    Raises PermissionError if the directory already exists but belongs
+    to someone else or is accessible to them.
+    '''
+
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+
+    if not _is_private(path, stat.S_ISDIR):
+        raise PermissionError(errno.EACCES, 'Not a private directory', path)
+
+
+def _handle_request(boiler, request):
+    '''Answers a daemon request dict with a response dict.'''
+
+    try:
+        action = request.get('action')
+
+        if action == 'plate':
+            return {'text': boiler.plate(lang=request.get('lang'),
+                                         ext=request.get('ext'),
+                                         options=request.get('options'))}
+        elif action == 'languages':
+            return {'text': boiler.supported_languages()}
+        elif action == 'extensions':
+            return {'text': boiler.supported_extensions()}
+        elif action == 'split':
+            return {'text': boiler.split_filename(request['filename'])}
+        elif action == 'search':
+            return {'text': boiler.search(request['term'],
+                                          request.get('limit',
+                                                      Boiler._DEF_SEARCH_LIMIT))}
+        elif action == 'layers':
+            return {'text': _layer_key(boiler.plates_path)}
+        else:
+            return {'error': 'Unknown action.', 'type': 'ValueError'}
+
+    except LookupError as exception:
+        return {'error': str(exception), 'type': 'LookupError'}
+
+    except Exception as exception:
+        return {'error': str(exception), 'type': type(exception).__name__}
+
+
+def make_server(path=None, boiler=None):
+    '''Returns a daemon server bound to a Unix socket at path.
+
+    Requests and responses are single lines of JSON, and a client may
+    send any number of requests over one connection. The socket is
+    only accessible to the current user. The default Boiler keeps the
+    catalog in memory, and picks up a rebuilt database on its own.
+    '''
+
+    if path is None:
+        path = default_socket_path()
+
+    # Nobody else may create the fallback socket, or replace it
+    if os.path.dirname(path) == _socket_directory():
+        _private_directory(_socket_directory())
+
+    if boiler is None:
+        boiler = Boiler(plate_layers(), thread_safe=True, snapshot=True)
+
+    # Remove a socket left behind by a daemon that is no longer running
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except OSError:
+            os.unlink(path)
+        else:
+            raise OSError('A boil daemon is already listening on ' + path)
+        finally:
+            probe.close()
+
+    class Handler(socketserver.StreamRequestHandler):
+        '''Answers JSON line requests until the client disconnects.'''
+
+        def handle(self):
+            for line in self.rfile:
+                try:
+                    response = _handle_request(boiler, json.loads(line))
+                except ValueError as exception:
+                    response = {'error': str(exception), 'type': 'ValueError'}
+
+                self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+                self.wfile.flush()
+
+    class Server(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+
+        def server_close(self):
+            super().server_close()
+            if os.path.exists(self.server_address):
+                os.unlink(self.server_address)
+
+    umask = os.umask(0o177)
+    try:
+        server = Server(path, Handler)
+    finally:
+        os.umask(umask)
+
+    server.boiler = boiler
+
+    return server
+
+
+def serve(path=None, boiler=None):
+    '''Runs a boil daemon on a Unix socket until interrupted.'''
+
+    server = make_server(path, boiler)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def make_http_server(address, boiler=None, max_workers=16, timeout=5,
+                     verbose=False):
+    '''Returns an HTTP API server bound to a (host, port) address.
+
+    GET /plate?lang=&ext=&title=&meth=&line=&space= returns plate text,
+    GET /languages and /extensions return JSON lists, and
+    GET /search?q=&limit= returns a JSON list of matches. Responses
+    carry ETags and honor If-None-Match. Connections are kept alive
+    for up to timeout idle seconds. Requests are answered by a pool of
+    max_workers threads, and an idle connection does not hold one.
+    The default Boiler keeps the catalog in memory, and picks up a
+    rebuilt database on its own.
+    '''
+
+    if boiler is None:
+        boiler = Boiler(plate_layers(), thread_safe=True, snapshot=True)
+
+    def true(value):
+        return value.lower() not in ('', '0', 'false', 'no', 'off')
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        '''Maps API endpoints onto the Boiler.'''
+
+        protocol_version = 'HTTP/1.1'
+
+        # Headers and body are written separately, so avoid Nagle delays
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            if verbose:
+                super().log_message(*args)
+
+        def send_body(self, status, body, content_type):
+            body = body.encode('utf-8')
+            etag = '"{0}"'.format(hashlib.sha1(body).hexdigest())
+
+            if status == 200 and self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+            self.send_response(status)
+            self.send_header('Content-Type', content_type + '; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            if status == 200:
+                self.send_header('ETag', etag)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            query = parse_qs(url.query)
+
+            def get(name, default=None):
+                return query[name][-1] if name in query else default
+
+            try:
+                if url.path == '/plate':
+                    text = boiler.plate(lang=get('lang'), ext=get('ext'), options={
+                        'name': get('title'),
+                        'funcs': query.get('meth', []),
+                        'newlines': true(get('line', '')),
+                        'spaces': int(get('space', 0))
+                    })
+                    self.send_body(200, text, 'text/plain')
+                elif url.path == '/languages':
+                    self.send_body(200, json.dumps(boiler.supported_languages()),
+                                   'application/json')
+                elif url.path == '/extensions':
+                    self.send_body(200, json.dumps(boiler.supported_extensions()),
+                                   'application/json')
+                elif url.path == '/search':
+                    limit = int(get('limit', Boiler._DEF_SEARCH_LIMIT))
+                    if limit < 1:
+                        raise ValueError('limit must be a positive integer.')
+
+                    results = boiler.search(get('q', ''), limit)
+                    self.send_body(200, json.dumps(
+                        [result._asdict() for result in results]),
+                        'application/json')
+                else:
+                    self.send_body(404, 'Not found.\n', 'text/plain')
+
+            except LookupError as exception:
+                status = 404 if (get('lang') or get('ext')) else 400
+                self.send_body(status, str(exception) + '\n', 'text/plain')
+
+            except ValueError as exception:
+                self.send_body(400, str(exception) + '\n', 'text/plain')
+
+        def handle(self):
+            '''Answers one request. The server watches a kept-alive
+            connection for the next one.
+            '''
+
+            self.close_connection = True
+            self.handle_one_request()
+
+        def finish(self):
+            '''Keeps a kept-alive connection open between requests.'''
+
+            if self.close_connection:
+                super().finish()
+
+        def pending(self):
+            '''Returns whether the next request can be read without waiting.'''
+
+            self.connection.settimeout(0)
+            try:
+                return bool(self.rfile.peek(1))
+            except OSError:
+                return True
+            finally:
+                self.connection.settimeout(self.timeout)
+
+    Handler.timeout = timeout
+
+    class Server(http.server.HTTPServer):
+        '''HTTP server that answers requests on a thread pool.
+
+        A connection only holds a worker while one of its requests is
+        answered. Before its first request and between kept-alive
+        requests, it waits in a selector watched by a single thread,
+        which hands it to the pool when a request arrives and closes
+        it after timeout idle seconds.
+        '''
+
+        def __init__(self, *args):
+            self.executor = ThreadPoolExecutor(max_workers=max_workers)
+            self._closed = False
+
+            # The watcher thread owns the selector. Other threads queue
+            # (connection, answer, close) and wake it through a socket
+            # pair.
+            self._idle = selectors.DefaultSelector()
+            self._waiting = []
+            self._waiting_lock = threading.Lock()
+            self._wake, self._waker = socket.socketpair()
+            self._idle.register(self._wake, selectors.EVENT_READ)
+
+            super().__init__(*args)
+
+            self._watcher = threading.Thread(target=self._watch, daemon=True)
+            self._watcher.start()
+
+        def process_request(self, request, client_address):
+            if self._closed:
+                self.shutdown_request(request)
+                return
+
+            self._wait(request,
+                       lambda: self.process_request_thread(request,
+                                                           client_address),
+                       lambda: self.shutdown_request(request))
+
+        def process_request_thread(self, request, client_address):
+            try:
+                handler = self.RequestHandlerClass(request, client_address,
+                                                   self)
+            except Exception:
+                self.handle_error(request, client_address)
+                self.shutdown_request(request)
+            else:
+                self._release(handler)
+
+        def _answer(self, handler):
+            '''Answers the next request on a kept-alive connection.'''
+
+            try:
+                handler.handle()
+            except Exception:
+                self.handle_error(handler.request, handler.client_address)
+                handler.close_connection = True
+
+            handler.finish()
+            self._release(handler)
+
+        def _release(self, handler):
+            '''Closes a connection, or watches it for its next request.'''
+
+            if handler.close_connection or self._closed:
+                self._close(handler)
+            elif handler.pending():
+                # Pipelined requests are already buffered
+                try:
+                    self.executor.submit(self._answer, handler)
+                except RuntimeError:
+                    self._close(handler)
+            else:
+                self._wait(handler.connection,
+                           lambda: self._answer(handler),
+                           lambda: self._close(handler))
+
+        def _wait(self, connection, answer, close):
+            '''Watches a connection, calling answer on the pool once it is
+            readable, or close if it stays idle.
+            '''
+
+            with self._waiting_lock:
+                self._waiting.append((connection, answer, close))
+            self._waker.send(b'\0')
+
+        def _close(self, handler):
+            handler.close_connection = True
+            handler.finish()
+            self.shutdown_request(handler.request)
+
+        def _watch(self):
+            '''Hands readable connections to the pool until the server closes.'''
+
+            while not self._closed:
+                with self._waiting_lock:
+                    waiting, self._waiting = self._waiting, []
+
+                for connection, answer, close in waiting:
+                    self._idle.register(connection, selectors.EVENT_READ,
+                                        (answer, close,
+                                         time.monotonic() + timeout))
+
+                deadlines = [key.data[2] for key in self._idle.get_map().values()
+                             if key.data is not None]
+                wait = max(0, min(deadlines) - time.monotonic()) \
+                    if deadlines else None
+
+                for key, _ in self._idle.select(wait):
+                    if key.data is None:
+                        self._wake.recv(4096)
+                    else:
+                        self._idle.unregister(key.fileobj)
+                        self.executor.submit(key.data[0])
+
+                now = time.monotonic()
+                for key in list(self._idle.get_map().values()):
+                    if key.data is not None and key.data[2] <= now:
+                        self._idle.unregister(key.fileobj)
+                        key.data[1]()
+
+            for key in list(self._idle.get_map().values()):
+                if key.data is not None:
+                    key.data[1]()
+
+        def server_close(self):
+            super().server_close()
+
+            self._closed = True
+            self._waker.send(b'\0')
+            self._watcher.join()
+            self.executor.shutdown(wait=True)
+
+            # Connections queued while the watcher was stopping
+            for _, _, close in self._waiting:
+                close()
+
+            self._idle.close()
+            self._wake.close()
+            self._waker.close()
+
+    server = Server(address, Handler)
+    server.boiler = boiler
+
+    return server
+
+
+def serve_http(address, boiler=None, max_workers=16):
+    '''Runs the HTTP API on a (host, port) address until interrupted.'''
+
+    server = make_http_server(address, boiler, max_workers=max_workers)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,10 @@
+{BP_FUNC_BEG}
+def {BP_FNAME}():
+	pass
+{BP_FUNC_END}
+
+def main():
+	pass
+
+if __name__ == '__main__':
+	main()
@@ -1,12 +1,3 @@
 #!/usr/bin/env python3
 
-{BP_FUNC_BEG}
-def {BP_FNAME}():
-	pass
-{BP_FUNC_END}
-
-def main():
-	pass
-
-if __name__ == '__main__':
-	main()
+{BP_INCLUDE python.py}
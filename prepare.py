@@ -1,9 +1,30 @@
 #!/usr/bin/env python3
 
 import os
+import sys
 import sqlite3
-from itertools import cycle
+import hashlib
+import argparse
 from inspect import getsourcefile
+from concurrent.futures import ThreadPoolExecutor
+
+from boil.boil import SQLiteCatalog, DirectoryCatalog, _NOCASE
+
+
+# Database layout version, stored in PRAGMA user_version
+SCHEMA_VERSION = SQLiteCatalog.SCHEMA_VERSION
+
+# Compression codecs for stored templates
+CODECS = ('zlib', 'lzma')
+
+# Directory of partials, relative to the plates directory
+PARTIALS_DIR = DirectoryCatalog.PARTIALS_DIR
+
+# Alias kinds for plate names, extensions and whole file names
+ALIAS_KINDS = ('name', 'extension', 'filename')
+
+# Folds ASCII case only, matching SQLite's NOCASE collation
+NOCASE = _NOCASE
 
 
 def createDatabase(path):
@@ -12,23 +33,61 @@ def createDatabase(path):
     con = sqlite3.connect(path)
     cur = con.cursor()
 
-    # Replace templates table
+    # Replace templates table. Templates are stored once per SHA-256 hash
+    # of their text, as TEXT or compressed UTF-8 BLOBs if codec is set
     cur.execute('DROP TABLE IF EXISTS templates')
-    cur.execute('CREATE TABLE templates(id INTEGER PRIMARY KEY, template TEXT NOT NULL)')
+    cur.execute(
+        '''CREATE TABLE templates(id INTEGER PRIMARY KEY,
+                                  hash TEXT NOT NULL UNIQUE,
+                                  template NOT NULL,
+                                  codec TEXT)''')
+
+    # Replace partial tables: partials by name, and the partial names
+    # each template includes
+    cur.execute('DROP TABLE IF EXISTS partials')
+    cur.execute(
+        '''CREATE TABLE partials(name TEXT PRIMARY KEY,
+                                 template_id INTEGER NOT NULL REFERENCES templates(id))
+           WITHOUT ROWID''')
+    cur.execute('DROP TABLE IF EXISTS includes')
+    cur.execute(
+        '''CREATE TABLE includes(template_id INTEGER NOT NULL REFERENCES templates(id),
+                                 name TEXT NOT NULL,
+                                 PRIMARY KEY(template_id, name)) WITHOUT ROWID''')
 
-    # Replace names table
+    # Replace alias table, clustered on (kind, alias) so that lookups
+    # are covered by the primary key
     cur.execute('DROP TABLE IF EXISTS names')
-    cur.execute(
-        '''CREATE TABLE names(id INTEGER PRIMARY KEY,
-                              name TEXT UNIQUE COLLATE NOCASE,
-                              template_id REFERENCES templates(id))''')
-    
-    # Replace extensions table
     cur.execute('DROP TABLE IF EXISTS extensions')
+    cur.execute('DROP TABLE IF EXISTS aliases')
     cur.execute(
-        '''CREATE TABLE extensions(id INTEGER PRIMARY KEY,
-                                   extension TEXT UNIQUE COLLATE NOCASE,
-                                   template_id REFERENCES templates(id))''')
+        '''CREATE TABLE aliases(kind TEXT NOT NULL,
+                                alias TEXT NOT NULL COLLATE NOCASE,
+                                template_id INTEGER NOT NULL REFERENCES templates(id),
+                                PRIMARY KEY(kind, alias)) WITHOUT ROWID''')
+
+    # Replace trigram index of aliases, used for fuzzy search
+    cur.execute('DROP TABLE IF EXISTS trigrams')
+    cur.execute(
+        '''CREATE TABLE trigrams(trigram TEXT NOT NULL,
+                                 kind TEXT NOT NULL,
+                                 alias TEXT NOT NULL COLLATE NOCASE,
+                                 PRIMARY KEY(trigram, kind, alias)) WITHOUT ROWID''')
+    cur.execute('DROP TABLE IF EXISTS trigram_counts')
+    cur.execute(
+        '''CREATE TABLE trigram_counts(trigram TEXT PRIMARY KEY,
+                                       count INTEGER NOT NULL) WITHOUT ROWID''')
+
+    # Replace plate file state table
+    cur.execute('DROP TABLE IF EXISTS plate_files')
+    cur.execute(
+        '''CREATE TABLE plate_files(file_name TEXT PRIMARY KEY,
+                                    mtime INTEGER NOT NULL,
+                                    size INTEGER NOT NULL,
+                                    hash TEXT NOT NULL,
+                                    template_id REFERENCES templates(id))''')
+
+    cur.execute('PRAGMA user_version = {0}'.format(SCHEMA_VERSION))
 
     con.commit()
     cur.close()
@@ -36,65 +95,427 @@ def createDatabase(path):
     return con
 
 
+def hasPlateState(con):
+    '''Returns whether a database has the current schema and plate state.'''
+
+    return con.execute('PRAGMA user_version').fetchone()[0] == SCHEMA_VERSION
+
+
 def extractTemplateInfo(file_name):
-    ''' Returns a tuple of template (names, extensions).'''
+    ''' Returns a tuple of template (names, extensions, file names).
 
-    file_name, file_ext = file_name.split('.', 1)
-    names = file_name.split(',')
-    exts = file_ext.split('.')
+    Extensions are separated by dots, or by commas if an extension
+    contains a dot, as in "ts,d.ts". Entries starting with "=" are
+    whole file names, as in "=Makefile". Boilers built straight from
+    a plates directory share this grammar.
+    '''
 
-    return (names, exts)
+    from boil.boil import plate_aliases
 
+    return plate_aliases(file_name)
 
-def addTemplate(cursor, template, names, extensions):
-    '''Adds a template to the cursor's database.'''
 
-    # Insert template
-    if template is not None:
-        cursor.execute('INSERT INTO templates(template) VALUES(?)', [template])
-        template_id = cursor.lastrowid
+def scanPlates(plates_path):
+    '''Returns the stat results of plate and partial files by file name.
+
+    Partials are named by their path relative to plates_path. Files
+    whose names are not plate names, such as dotfiles, are skipped.
+    '''
+
+    files = {}
+    for entry in os.scandir(plates_path):
+        if not entry.is_file():
+            continue
 
-    # Insert names
-    if names:
-        try:
-            cursor.executemany(
-                'INSERT INTO names(name, template_id) VALUES(?, ?)', 
-                zip(names, cycle([template_id])))
-        except sqlite3.IntegrityError:
-            pass
-
-    # Insert extensions
-    if extensions:
         try:
-            cursor.executemany(
-                'INSERT INTO extensions(extension, template_id) VALUES(?, ?)',
-                zip(extensions, cycle([template_id])))
-        except sqlite3.IntegrityError:
-            pass
+            extractTemplateInfo(entry.name)
+        except ValueError as error:
+            print('Skipping {0}: {1}'.format(entry.path, error), file=sys.stderr)
+            continue
+
+        files[entry.name] = entry.stat()
+
+    partials_path = os.path.join(plates_path, PARTIALS_DIR)
+    if os.path.isdir(partials_path):
+        files.update((PARTIALS_DIR + '/' + entry.name, entry.stat())
+                     for entry in os.scandir(partials_path) if entry.is_file())
+
+    return files
+
+
+def partialName(file_name):
+    '''Returns the name of a partial file, or None for a plate file.'''
+
+    directory, _, name = file_name.rpartition('/')
+
+    return name if directory == PARTIALS_DIR else None
+
+
+def readPlate(path):
+    '''Returns the (text, hash) of a plate file.'''
+
+    with open(path, 'rb') as plate_file:
+        data = plate_file.read()
+
+    return data.decode('utf-8'), hashlib.sha256(data).hexdigest()
+
+
+def encodeTemplate(template, codec=None):
+    '''Returns a template as stored with codec.'''
+
+    if codec is None:
+        return template
+
+    data = template.encode('utf-8')
+
+    if codec == 'zlib':
+        import zlib
+        return zlib.compress(data, 9)
+
+    if codec == 'lzma':
+        import lzma
+        return lzma.compress(data)
+
+    raise ValueError('Unsupported template codec: ' + codec)
 
 
-def makeTemplates(plates_path, base_path):
-    '''Loads code templates from plates_path into database.'''
+def readPlates(plates_path, file_names):
+    '''Reads plate files in parallel. Returns a list of (text, hash).'''
 
-    # Initialize database
-    with createDatabase(base_path) as con:
-        cur = con.cursor()
+    paths = [os.path.join(plates_path, file_name) for file_name in file_names]
 
-        file_names = os.listdir(plates_path)
-        file_names.sort()
+    if len(paths) < 2:
+        return [readPlate(path) for path in paths]
 
-        for file_name in file_names:
-            template = open(os.path.join(plates_path, file_name)).read()
+    with ThreadPoolExecutor() as executor:
+        return list(executor.map(readPlate, paths))
 
-            names, extensions = extractTemplateInfo(file_name)
 
-            addTemplate(cur, template, names, extensions)
+def syncTemplates(cur, plates_path, codec=None):
+    '''Updates the database to match the plate files in plates_path.
 
-        cur.close()
-        con.commit()
+    Files whose size and modification time are unchanged are not
+    read. Templates are stored once per content hash, compressed with
+    codec if given. Returns the number of (added, updated, removed)
+    plate and partial files.
+    '''
+
+    from boil.boil import include_names
+
+    state = {row[0]: row[1:] for row in cur.execute(
+        'SELECT file_name, mtime, size, hash, template_id FROM plate_files')}
+    files = scanPlates(plates_path)
+
+    # Remove deleted plates
+    removed = sorted(set(state) - set(files))
+    for file_name in removed:
+        del state[file_name]
+    cur.executemany('DELETE FROM plate_files WHERE file_name = ?',
+                    [(file_name,) for file_name in removed])
+
+    # Read new and possibly changed plates
+    stale = [file_name for file_name in sorted(files)
+             if state.get(file_name, (None, None))[:2]
+             != (files[file_name].st_mtime_ns, files[file_name].st_size)]
+    plates = readPlates(plates_path, stale)
+
+    if not removed and not stale:
+        return 0, 0, 0
+
+    # Template ids by content hash
+    ids = dict(cur.execute('SELECT hash, id FROM templates'))
+    next_id = max(ids.values(), default=0) + 1
+
+    new_templates = []
+    new_includes = []
+    new_files = []
+    changed_files = []
+    added = updated = 0
+
+    for file_name, (template, digest) in zip(stale, plates):
+        stats = files[file_name]
+        old = state.get(file_name)
+
+        if digest not in ids:
+            ids[digest] = next_id
+            new_templates.append((next_id, digest,
+                                  encodeTemplate(template, codec), codec))
+            new_includes.extend((next_id, name)
+                                for name in set(include_names(template)))
+            next_id += 1
+
+        row = (stats.st_mtime_ns, stats.st_size, digest, ids[digest])
+        state[file_name] = row
+
+        if old is None:
+            added += 1
+            new_files.append((file_name,) + row)
+        else:
+            updated += old[2] != digest
+            changed_files.append(row + (file_name,))
+
+    cur.executemany('INSERT INTO templates(id, hash, template, codec) VALUES(?, ?, ?, ?)',
+                    new_templates)
+    cur.executemany('INSERT INTO includes(template_id, name) VALUES(?, ?)',
+                    new_includes)
+    cur.executemany('INSERT INTO plate_files VALUES(?, ?, ?, ?, ?)', new_files)
+    cur.executemany(
+        '''UPDATE plate_files SET mtime = ?, size = ?, hash = ?, template_id = ?
+           WHERE file_name = ?''', changed_files)
+
+    # Replace the partials map
+    cur.execute('DELETE FROM partials')
+    cur.executemany('INSERT INTO partials(name, template_id) VALUES(?, ?)',
+                    [(partialName(file_name), row[3])
+                     for file_name, row in sorted(state.items())
+                     if partialName(file_name) is not None])
+
+    for alias, kept, dropped in syncAliases(
+            cur, {file_name: row[3] for file_name, row in state.items()
+                  if partialName(file_name) is None}):
+        print('Alias "{0}" of {1} is already used by {2}'.format(
+            alias, dropped, kept), file=sys.stderr)
+
+    # Remove templates no file has anymore
+    cur.execute('DELETE FROM templates WHERE id NOT IN'
+                ' (SELECT template_id FROM plate_files)')
+    cur.execute('DELETE FROM includes WHERE template_id NOT IN'
+                ' (SELECT id FROM templates)')
+
+    checkIncludes(cur)
+
+    return added, updated, len(removed)
+
+
+def checkIncludes(cur):
+    '''Raises ValueError if a plate or partial includes an unknown
+    partial, or if partials include each other in a cycle.
+    '''
+
+    for file_name, name in cur.execute(
+            '''SELECT f.file_name, i.name
+               FROM includes i
+               JOIN plate_files f ON f.template_id = i.template_id
+               WHERE i.name NOT IN (SELECT name FROM partials)
+               ORDER BY f.file_name, i.name'''):
+        raise ValueError('{0} includes unknown partial "{1}"'.format(
+            file_name, name))
+
+    graph = {}
+    for partial, name in cur.execute(
+            '''SELECT p.name, i.name
+               FROM partials p
+               JOIN includes i ON i.template_id = p.template_id
+               ORDER BY p.name, i.name'''):
+        graph.setdefault(partial, []).append(name)
+
+    # Depth-first search, with the partials being visited on a stack
+    done = set()
+
+    def visit(name, stack):
+        if name in stack:
+            cycle = stack[stack.index(name):] + [name]
+            raise ValueError('Partials include each other: ' + ' -> '.join(cycle))
+        if name not in done:
+            for included in graph.get(name, ()):
+                visit(included, stack + [name])
+            done.add(name)
+
+    for name in sorted(graph):
+        visit(name, [])
+
+
+def syncAliases(cur, template_ids):
+    '''Updates aliases and their trigrams from plate file names.
+
+    template_ids maps plate file names to template ids. When plates
+    share an alias, the first file name in sorted order keeps it.
+    Returns a list of (alias, kept file name, dropped file name) for
+    each collision.
+    '''
+
+    from boil.boil import trigrams
+
+    wanted = tuple({} for _ in ALIAS_KINDS)
+    owners = tuple({} for _ in ALIAS_KINDS)
+    collisions = []
+
+    for file_name in sorted(template_ids):
+        for aliases, found, owner in zip(extractTemplateInfo(file_name),
+                                         wanted, owners):
+            for alias in aliases:
+                key = alias.translate(NOCASE)
+
+                if key in found:
+                    if owner[key] != file_name:
+                        collisions.append((alias, owner[key], file_name))
+                    continue
+
+                found[key] = (alias, template_ids[file_name])
+                owner[key] = file_name
+
+    changed_grams = set()
+
+    for kind, found in zip(ALIAS_KINDS, wanted):
+        current = {alias.translate(NOCASE): (alias, template_id)
+                   for alias, template_id in cur.execute(
+                       'SELECT alias, template_id FROM aliases WHERE kind = ?',
+                       [kind])}
+
+        stale = [(kind, row[0]) for key, row in current.items()
+                 if found.get(key) != row]
+        new = [(kind,) + found[key] for key in sorted(found)
+               if current.get(key) != found[key]]
+
+        cur.executemany('DELETE FROM aliases WHERE kind = ? AND alias = ?', stale)
+        cur.executemany(
+            'INSERT INTO aliases(kind, alias, template_id) VALUES(?, ?, ?)', new)
+
+        stale_grams = [(gram, kind, alias)
+                       for _, alias in stale for gram in trigrams(alias)]
+        new_grams = [(gram, kind, alias)
+                     for _, alias, _ in new for gram in trigrams(alias)]
+
+        cur.executemany(
+            'DELETE FROM trigrams WHERE trigram = ? AND kind = ? AND alias = ?',
+            stale_grams)
+        cur.executemany(
+            'INSERT INTO trigrams(trigram, kind, alias) VALUES(?, ?, ?)', new_grams)
+
+        changed_grams.update(row[0] for row in stale_grams + new_grams)
+
+    # Refresh the alias counts of changed trigrams
+    changed_grams = [(gram,) for gram in sorted(changed_grams)]
+    cur.executemany('DELETE FROM trigram_counts WHERE trigram = ?', changed_grams)
+    cur.executemany(
+        '''INSERT INTO trigram_counts(trigram, count)
+           SELECT trigram, COUNT(*) FROM trigrams WHERE trigram = ?
+           GROUP BY trigram''', changed_grams)
+
+    return collisions
+
+
+def hasCodec(con, codec):
+    '''Returns whether every template in a database is stored with codec.'''
+
+    return con.execute('SELECT NOT EXISTS(SELECT 1 FROM templates'
+                       ' WHERE codec IS NOT ?)', [codec]).fetchone()[0] == 1
+
+
+def makeTemplates(plates_path, base_path, full=False, codec=None):
+    '''Loads code templates from plates_path into database.
+
+    Templates are compressed with codec, if given. Only plates that
+    changed since the last run are loaded, unless full is True, the
+    database does not record plate file state or its templates are
+    stored with a different codec.
+    Full builds are written to a temporary file without journaling
+    and then moved over base_path. Raises ValueError, leaving the
+    database unchanged, if includes cannot be resolved.
+    Returns the number of (added, updated, removed) plates.
+    '''
+
+    if not os.path.exists(base_path):
+        full = True
+    elif not full:
+        con = sqlite3.connect(base_path)
+        full = not hasPlateState(con) or not hasCodec(con, codec)
+        con.close()
+
+    build_path = base_path + '.tmp' if full else base_path
+
+    if full:
+        if os.path.exists(build_path):
+            os.remove(build_path)
+        con = createDatabase(build_path)
+        con.execute('PRAGMA journal_mode = OFF')
+        con.execute('PRAGMA synchronous = OFF')
+    else:
+        con = sqlite3.connect(build_path)
+
+    try:
+        with con:
+            cur = con.cursor()
+
+            changes = syncTemplates(cur, plates_path, codec)
+
+            cur.close()
+    except BaseException:
+        con.close()
+        if full:
+            os.remove(build_path)
+        raise
+
+    con.close()
+
+    if full:
+        os.replace(build_path, base_path)
+
+    return changes
+
+
+def makeCatalog(base_path, catalog_path):
+    '''Writes the templates in a database to a binary catalog.'''
+
+    from boil.boil import BinaryCatalog, decode_template, resolve_includes
+
+    con = sqlite3.connect(base_path)
+
+    partials = {name: decode_template(template, codec)
+                for name, template, codec in con.execute(
+                    '''SELECT p.name, t.template, t.codec
+                       FROM partials p
+                       JOIN templates t ON t.id = p.template_id''')}
+
+    # Catalog templates are resolved, and stored once per text
+    ids = {}
+    indexes = {}
+    templates = []
+    for template_id, template, codec in con.execute(
+            '''SELECT id, template, codec
+               FROM templates
+               WHERE id IN (SELECT template_id FROM aliases)
+               ORDER BY id'''):
+        template = resolve_includes(decode_template(template, codec),
+                                    partials.get)
+        if template not in indexes:
+            indexes[template] = len(templates)
+            templates.append(template)
+        ids[template_id] = indexes[template]
+
+    names, extensions, file_names = (
+        [(alias, ids[template_id]) for alias, template_id in
+         con.execute('SELECT alias, template_id FROM aliases'
+                     ' WHERE kind = ?', [kind])]
+        for kind in ALIAS_KINDS)
+
+    con.close()
+
+    BinaryCatalog.write(catalog_path, templates, names, extensions, file_names)
+
+
+def parse():
+    '''Parses command line arguments'''
+
+    parser = argparse.ArgumentParser(
+        description='Builds the boil plate database.')
+
+    parser.add_argument('--catalog', action='store_true',
+                        help='Also write a binary catalog, which boil loads' \
+                             ' in place of the database')
+
+    parser.add_argument('--compress', choices=CODECS,
+                        help='Store templates compressed with a codec')
+
+    parser.add_argument('--full', action='store_true',
+                        help='Rebuild every plate instead of only changed ones')
+
+    return vars(parser.parse_args())
 
 
 def main():
+    args = parse()
+
     source_file = os.path.realpath(getsourcefile(lambda:None))
 
     source_dir = os.path.split(source_file)[0]
@@ -103,7 +524,20 @@ def main():
 
     dest_path = os.path.join(source_dir, 'boil/plates.db')
 
-    makeTemplates(plates_path, dest_path)
+    catalog_path = os.path.join(source_dir, 'boil/plates.cat')
+
+    try:
+        makeTemplates(plates_path, dest_path, full=args['full'],
+                      codec=args['compress'])
+    except ValueError as exception:
+        print(str(exception), file=sys.stderr)
+        sys.exit(1)
+
+    if args['catalog']:
+        makeCatalog(dest_path, catalog_path)
+    elif os.path.exists(catalog_path):
+        # Remove the stale catalog so boil reads the new database
+        os.remove(catalog_path)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+'''Runs boil benchmarks and writes machine-readable results.
+
+Usage: python3 -m tests.bench [--quick] [-o FILE] [--compare OLD.json]
+'''
+
+import sys
+import json
+import argparse
+
+from tests.bench import bench
+from tests.bench import benchmarks  # Registers benchmarks
+
+
+def parse():
+    '''Parses command line arguments'''
+
+    parser = argparse.ArgumentParser(
+        prog='python3 -m tests.bench',
+        description='Runs boil benchmarks.')
+
+    parser.add_argument('--quick', action='store_true',
+                        help='Use smaller inputs')
+
+    parser.add_argument('--only', action='append', metavar='NAME',
+                        help='Only run the named benchmark (can be used multiple times)')
+
+    parser.add_argument('-o', '--output', metavar='FILE',
+                        help='Write JSON results to FILE (default: stdout)')
+
+    parser.add_argument('--compare', metavar='FILE',
+                        help='Compare against JSON results from an earlier run')
+
+    return vars(parser.parse_args())
+
+
+def main():
+    args = parse()
+
+    results = bench.run(quick=args['quick'], only=args['only'])
+
+    if args['output']:
+        with open(args['output'], 'w') as output:
+            json.dump(results, output, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if args['compare']:
+        with open(args['compare']) as old_file:
+            old = json.load(old_file)
+
+        print('\n'.join(bench.compare(old, results)), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
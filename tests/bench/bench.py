@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+'''Benchmark registry, timing helpers and result comparison.'''
+
+import os
+import sys
+import json
+import timeit
+import platform
+import statistics
+import subprocess
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+PLATES_DIR = os.path.join(ROOT_DIR, 'plates')
+PLATES_DB = os.path.join(ROOT_DIR, 'boil', 'plates.db')
+BOIL_SCRIPT = os.path.join(ROOT_DIR, 'boil', 'boil.py')
+
+BENCHMARKS = []
+
+
+def benchmark(func):
+    '''Registers a benchmark function.
+
+    Benchmarks take a quick flag and yield (params, seconds) pairs,
+    where seconds is the time of a single operation.
+    '''
+
+    BENCHMARKS.append(func)
+
+    return func
+
+
+def measure(func, repeat=5, min_time=0.05):
+    '''Returns the median time of one call to func.'''
+
+    timer = timeit.Timer(func)
+    number = 1
+
+    # Find a loop count that takes at least min_time
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time:
+            break
+        number *= 10 if elapsed * 10 < min_time else 2
+
+    return statistics.median(
+        timer.repeat(repeat=repeat, number=number)) / number
+
+
+def measure_process(args, repeat=10):
+    '''Returns the median wall time of running a command.'''
+
+    times = []
+
+    for _ in range(repeat):
+        start = timeit.default_timer()
+        subprocess.run(args, stdout=subprocess.DEVNULL, check=True)
+        times.append(timeit.default_timer() - start)
+
+    return statistics.median(times)
+
+
+def make_plates(path, count, template=None):
+    '''Writes count synthetic plates into the directory path.'''
+
+    if template is None:
+        with open(os.path.join(PLATES_DIR, 'java.java')) as plate_file:
+            template = plate_file.read()
+
+    os.makedirs(path, exist_ok=True)
+
+    for i in range(count):
+        file_name = 'lang{0},alias{0}.e{0}.x{0}'.format(i)
+        with open(os.path.join(path, file_name), 'w') as plate_file:
+            plate_file.write(template)
+
+
+def git_revision():
+    '''Returns the current git commit, or None.'''
+
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT_DIR,
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                              check=True, universal_newlines=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(quick=False, only=None):
+    '''Runs benchmarks. Returns a JSON-serializable results dict.'''
+
+    results = []
+
+    for func in BENCHMARKS:
+        name = func.__name__[len('bench_'):]
+
+        if only and name not in only:
+            continue
+
+        for params, seconds in func(quick):
+            result = {'name': name, 'params': params, 'seconds': seconds}
+            print(format_result(result), file=sys.stderr)
+            results.append(result)
+
+    return {
+        'commit': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'quick': quick,
+        'results': results
+    }
+
+
+def result_key(result):
+    return (result['name'], json.dumps(result['params'], sort_keys=True))
+
+
+def format_result(result):
+    params = ' '.join('{0}={1}'.format(k, v)
+                      for k, v in sorted(result['params'].items()))
+    return '{0:<20} {1:<40} {2:>12.3f} us'.format(
+        result['name'], params, result['seconds'] * 1e6)
+
+
+def compare(old, new):
+    '''Returns lines comparing two results dicts.'''
+
+    old_results = {result_key(r): r for r in old['results']}
+    lines = []
+
+    for result in new['results']:
+        previous = old_results.get(result_key(result))
+        if previous is None:
+            continue
+
+        ratio = result['seconds'] / previous['seconds']
+        lines.append('{0} {1:>7.2f}x'.format(format_result(result), ratio))
+
+    return lines
@@ -0,0 +1,502 @@
+#!/usr/bin/env python3
+
+'''Benchmarks for lookup, generation, catalog builds and CLI startup.'''
+
+import os
+import sys
+import shutil
+import sqlite3
+import tempfile
+import contextlib
+
+import boil
+import prepare
+from tests import codetester
+from tests.bench.bench import benchmark, measure, measure_process, make_plates
+from tests.bench.bench import PLATES_DB, PLATES_DIR, BOIL_SCRIPT
+
+
+@benchmark
+def bench_boiler_init(quick):
+    '''Boiler construction and teardown.'''
+
+    def construct():
+        boil.Boiler(PLATES_DB).close()
+
+    yield {}, measure(construct)
+
+
+@benchmark
+def bench_plate(quick):
+    '''Boiler.plate() per language, with and without the plate cache.'''
+
+    for cache_size in (0, 128):
+        with boil.Boiler(PLATES_DB, cache_size=cache_size) as boiler:
+            for tester in codetester.LANG.values():
+                yield {'lang': tester['lang'], 'cache_size': cache_size}, \
+                    measure(lambda: boiler.plate(lang=tester['lang'],
+                                                 options=codetester.OPTIONS))
+
+
+@benchmark
+def bench_generate(quick):
+    '''Plate.generate() with a growing number of functions.'''
+
+    with boil.Boiler(PLATES_DB) as boiler:
+        plate = boiler.get_plate(lang='java')
+
+    for count in (1, 10, 100, 1000, 10000) if quick else \
+            (1, 10, 100, 1000, 10000, 100000):
+        funcs = ['method{0}'.format(i) for i in range(count)]
+        yield {'funcs': count}, \
+            measure(lambda: plate.generate(funcs=funcs, newlines=True, spaces=4),
+                    repeat=3)
+
+
+@benchmark
+def bench_prepare(quick):
+    '''Full and no-op prepare.makeTemplates() on synthetic catalogs.'''
+
+    for count in (10, 100, 1000) if quick else (10, 100, 1000, 10000):
+        temp_dir = tempfile.mkdtemp()
+
+        try:
+            plates_path = os.path.join(temp_dir, 'plates')
+            db_path = os.path.join(temp_dir, 'plates.db')
+            make_plates(plates_path, count)
+
+            yield {'plates': count, 'mode': 'full'}, measure(
+                lambda: prepare.makeTemplates(plates_path, db_path, full=True),
+                repeat=3, min_time=0)
+
+            yield {'plates': count, 'mode': 'incremental'}, measure(
+                lambda: prepare.makeTemplates(plates_path, db_path),
+                repeat=3, min_time=0)
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+@benchmark
+def bench_cli(quick):
+    '''End-to-end cold start of the boil command.'''
+
+    for args in (['-l', 'python'], ['-L']):
+        yield {'args': ' '.join(args)}, measure_process(
+            [sys.executable, BOIL_SCRIPT, '--no-daemon'] + args,
+            repeat=5 if quick else 20)
+
+
+# Lookup query used before plates were stored in a single alias table
+LEGACY_LOOKUP = '''
+    SELECT t.template
+    FROM templates t, (
+        SELECT template_id, 1 AS filter
+        FROM names
+        WHERE name = ?
+        UNION
+        SELECT template_id, 2 AS filter
+        FROM extensions
+        WHERE extension = ?
+    ) n
+    WHERE t.id = n.template_id
+    LIMIT 1;'''
+
+
+def make_legacy_database(db_path, legacy_path):
+    '''Copies a plate database into the names/extensions layout.'''
+
+    legacy = sqlite3.connect(legacy_path)
+    legacy.execute('ATTACH DATABASE ? AS current', [db_path])
+
+    with legacy:
+        legacy.execute('CREATE TABLE templates AS SELECT id, template FROM current.templates')
+        legacy.execute(
+            '''CREATE TABLE names(id INTEGER PRIMARY KEY,
+                                  name TEXT UNIQUE COLLATE NOCASE,
+                                  template_id REFERENCES templates(id))''')
+        legacy.execute(
+            '''CREATE TABLE extensions(id INTEGER PRIMARY KEY,
+                                       extension TEXT UNIQUE COLLATE NOCASE,
+                                       template_id REFERENCES templates(id))''')
+        legacy.execute('''INSERT INTO names(name, template_id)
+                          SELECT alias, template_id FROM current.aliases
+                          WHERE kind = 'name' ''')
+        legacy.execute('''INSERT INTO extensions(extension, template_id)
+                          SELECT alias, template_id FROM current.aliases
+                          WHERE kind = 'extension' ''')
+
+    legacy.execute('DETACH DATABASE current')
+
+    return legacy
+
+
+@benchmark
+def bench_lookup(quick):
+    '''Template lookup with the legacy UNION query and alias point queries.'''
+
+    count = 1000 if quick else 10000
+    temp_dir = tempfile.mkdtemp()
+
+    try:
+        plates_path = os.path.join(temp_dir, 'plates')
+        db_path = os.path.join(temp_dir, 'plates.db')
+        make_plates(plates_path, count)
+        prepare.makeTemplates(plates_path, db_path)
+
+        legacy = make_legacy_database(db_path, os.path.join(temp_dir, 'legacy.db'))
+        catalog = boil.SQLiteCatalog(db_path)
+
+        last = count - 1
+        cases = {
+            'name': ('lang{0}'.format(last), None),
+            'extension': (None, 'e{0}'.format(last)),
+            'both': ('LANG{0}'.format(last), 'x0'),
+            'miss': ('missing', 'missing')
+        }
+
+        for case, (lang, ext) in cases.items():
+            yield {'plates': count, 'query': 'union', 'case': case}, measure(
+                lambda: legacy.execute(LEGACY_LOOKUP, (lang, ext)).fetchall())
+            yield {'plates': count, 'query': 'alias', 'case': case}, measure(
+                lambda: catalog.template(lang, ext))
+
+        legacy.close()
+        catalog.close()
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+LICENSE = '''\
+/*
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+'''
+
+
+@benchmark
+def bench_compression(quick):
+    '''Database size and template lookup with each storage codec.'''
+
+    count = 100 if quick else 1000
+    temp_dir = tempfile.mkdtemp()
+
+    try:
+        # Large plates: a license header in front of a class skeleton
+        with open(os.path.join(PLATES_DIR, 'java.java')) as plate_file:
+            template = LICENSE * 4 + plate_file.read()
+
+        plates_path = os.path.join(temp_dir, 'plates')
+        make_plates(plates_path, count, template)
+
+        for codec in (None,) + prepare.CODECS:
+            db_path = os.path.join(temp_dir, '{0}.db'.format(codec))
+            prepare.makeTemplates(plates_path, db_path, codec=codec)
+            db_kb = os.path.getsize(db_path) // 1024
+
+            catalog = boil.SQLiteCatalog(db_path)
+            lang = 'lang{0}'.format(count - 1)
+            assert catalog.template(lang) == template
+            yield {'plates': count, 'codec': codec, 'db_kb': db_kb}, \
+                measure(lambda: catalog.template(lang))
+            catalog.close()
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+@benchmark
+def bench_search(quick):
+    '''Boiler.search() prefix and fuzzy matches on a large catalog.'''
+
+    count = 1000 if quick else 10000
+    temp_dir = tempfile.mkdtemp()
+
+    try:
+        plates_path = os.path.join(temp_dir, 'plates')
+        db_path = os.path.join(temp_dir, 'plates.db')
+        catalog_path = os.path.join(temp_dir, 'plates.cat')
+        make_plates(plates_path, count)
+        prepare.makeTemplates(plates_path, db_path)
+        prepare.makeCatalog(db_path, catalog_path)
+
+        last = count - 1
+        cases = {
+            'prefix': 'lang{0}'.format(last // 10),
+            'fuzzy': 'lnag{0}'.format(last),
+            'miss': 'qqqq'
+        }
+
+        for path in (db_path, catalog_path):
+            with boil.Boiler(path) as boiler:
+                for case, term in cases.items():
+                    yield {'plates': count, 'catalog': path.rsplit('.', 1)[1],
+                           'case': case}, measure(lambda: boiler.search(term))
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+@benchmark
+def bench_partials(quick):
+    '''Database size and template lookup with copied and included bodies.'''
+
+    count = 100 if quick else 1000
+
+    with open(os.path.join(PLATES_DIR, 'partials', 'python.py')) as plate_file:
+        body = LICENSE + plate_file.read()
+
+    for storage in ('copies', 'partials'):
+        temp_dir = tempfile.mkdtemp()
+
+        try:
+            # Plates that only differ in their first line
+            plates_path = os.path.join(temp_dir, 'plates')
+            os.makedirs(os.path.join(plates_path, 'partials'))
+            with open(os.path.join(plates_path, 'partials', 'body'), 'w') as plate_file:
+                plate_file.write(body)
+
+            for i in range(count):
+                with open(os.path.join(plates_path, 'lang{0}.e{0}'.format(i)),
+                          'w') as plate_file:
+                    plate_file.write('#!/usr/bin/env python{0}\n\n'.format(i))
+                    plate_file.write(body if storage == 'copies'
+                                     else '{BP_INCLUDE body}\n')
+
+            db_path = os.path.join(temp_dir, 'plates.db')
+            prepare.makeTemplates(plates_path, db_path)
+            db_kb = os.path.getsize(db_path) // 1024
+
+            catalog = boil.SQLiteCatalog(db_path)
+            yield {'plates': count, 'storage': storage, 'db_kb': db_kb}, \
+                measure(lambda: catalog.template('lang0'))
+            catalog.close()
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+@benchmark
+def bench_split_filename(quick):
+    '''Boiler.split_filename() against a scan of every extension.'''
+
+    temp_dir = tempfile.mkdtemp()
+
+    try:
+        for count in (10, 1000) if quick else (10, 1000, 10000):
+            plates_path = os.path.join(temp_dir, str(count))
+            db_path = os.path.join(temp_dir, '{0}.db'.format(count))
+            make_plates(plates_path, count)
+            prepare.makeTemplates(plates_path, db_path)
+
+            with boil.Boiler(db_path) as boiler:
+                extensions = [ext[1:] for ext in boiler.supported_extensions()]
+                file_name = 'component.x{0}'.format(count - 1)
+
+                def scan():
+                    matches = [ext for ext in extensions
+                               if file_name.lower().endswith('.' + ext.lower())]
+                    return max(matches, key=len, default=None)
+
+                yield {'plates': count, 'method': 'build'}, \
+                    measure(lambda: (setattr(boiler, '_suffixes', None),
+                                     boiler.split_filename(file_name)), repeat=3)
+                yield {'plates': count, 'method': 'trie'}, \
+                    measure(lambda: boiler.split_filename(file_name))
+                yield {'plates': count, 'method': 'scan'}, measure(scan)
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+@benchmark
+def bench_jsonl(quick):
+    '''Requests per process against one boil --jsonl stream.'''
+
+    import json
+    import subprocess
+
+    count = 20 if quick else 200
+    request = json.dumps({'lang': 'java', 'title': 'Blue', 'meth': ['green']})
+
+    def processes():
+        for _ in range(count):
+            subprocess.run([sys.executable, BOIL_SCRIPT, '--no-daemon', '-l', 'java',
+                            '--title', 'Blue', '-m', 'green'],
+                           stdout=subprocess.DEVNULL, check=True)
+
+    def stream(*args):
+        subprocess.run([sys.executable, BOIL_SCRIPT, '--jsonl'] + list(args),
+                       input='\n'.join([request] * count * 50), text=True,
+                       stdout=subprocess.DEVNULL, check=True)
+
+    yield {'mode': 'process'}, measure(processes, repeat=1, min_time=0) / count
+    yield {'mode': 'jsonl'}, measure(stream, repeat=3, min_time=0) / (count * 50)
+    yield {'mode': 'jsonl --jobs 4'}, \
+        measure(lambda: stream('--jobs', '4'), repeat=3, min_time=0) / (count * 50)
+
+
+@benchmark
+def bench_snapshot(quick):
+    '''Opening, plate() and listings with database and snapshot catalogs.'''
+
+    count = 1000 if quick else 10000
+    temp_dir = tempfile.mkdtemp()
+
+    try:
+        plates_path = os.path.join(temp_dir, 'plates')
+        db_path = os.path.join(temp_dir, 'plates.db')
+        make_plates(plates_path, count)
+        prepare.makeTemplates(plates_path, db_path)
+
+        lang = 'lang{0}'.format(count - 1)
+
+        for snapshot in (False, True):
+            catalog = 'snapshot' if snapshot else 'database'
+
+            yield {'plates': count, 'catalog': catalog, 'call': 'open'}, \
+                measure(lambda: boil.Boiler(db_path, snapshot=snapshot).close(),
+                        repeat=3)
+
+            with boil.Boiler(db_path, snapshot=snapshot) as boiler:
+                yield {'plates': count, 'catalog': catalog, 'call': 'lookup'}, \
+                    measure(lambda: boiler.catalog.template(lang))
+                yield {'plates': count, 'catalog': catalog, 'call': 'plate'}, \
+                    measure(lambda: boiler.plate(lang))
+                yield {'plates': count, 'catalog': catalog,
+                       'call': 'supported_languages'}, \
+                    measure(boiler.supported_languages)
+
+                if snapshot:
+                    yield {'plates': count, 'catalog': catalog,
+                           'call': 'refresh'}, \
+                        measure(lambda: boiler.catalog.refresh(force=True))
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+@benchmark
+def bench_shared_plates(quick):
+    '''Memory of many warm Boilers with shared and per-Boiler plates.'''
+
+    import gc
+    import time
+    import tracemalloc
+    from unittest import mock
+
+    count = 100 if quick else 1000
+    langs = [tester['lang'] for tester in codetester.LANG.values()]
+
+    def unshared(template):
+        return None if template is None else boil.Plate(template)
+
+    for plates in ('shared', 'per-boiler'):
+        with contextlib.ExitStack() as stack:
+            if plates == 'per-boiler':
+                stack.enter_context(mock.patch.object(
+                    boil.Boiler, '_compile', staticmethod(unshared)))
+
+            boilers = [stack.enter_context(boil.Boiler(PLATES_DB))
+                       for _ in range(count)]
+
+            gc.collect()
+            tracemalloc.start()
+            start = time.perf_counter()
+
+            for boiler in boilers:
+                for lang in langs:
+                    boiler.get_plate(lang)
+
+            elapsed = time.perf_counter() - start
+            gc.collect()
+            kb = tracemalloc.get_traced_memory()[0] // 1024
+            tracemalloc.stop()
+
+            yield {'boilers': count, 'plates': plates, 'kb': kb}, \
+                elapsed / (count * len(langs))
+
+
+@benchmark
+def bench_from_directory(quick):
+    '''Boiler.from_directory() startup by plate count and template size.'''
+
+    temp_dir = tempfile.mkdtemp()
+
+    try:
+        with open(os.path.join(PLATES_DIR, 'java.java')) as plate_file:
+            small = plate_file.read()
+
+        for count in (100, 1000) if quick else (100, 1000, 10000):
+            for size, template in (('small', small),
+                                   ('large', LICENSE * 64 + small)):
+                plates_path = os.path.join(temp_dir, '{0}-{1}'.format(count, size))
+                make_plates(plates_path, count, template)
+                lang = 'lang{0}'.format(count - 1)
+
+                def first_plate():
+                    with boil.Boiler.from_directory(plates_path) as boiler:
+                        boiler.plate(lang)
+
+                yield {'plates': count, 'size': size, 'step': 'open'}, \
+                    measure(lambda: boil.Boiler.from_directory(plates_path).close(),
+                            repeat=3)
+                yield {'plates': count, 'size': size, 'step': 'first plate'}, \
+                    measure(first_plate, repeat=3)
+
+                if size == 'small':
+                    db_path = plates_path + '.db'
+                    yield {'plates': count, 'size': size, 'step': 'prepare'}, \
+                        measure(lambda: prepare.makeTemplates(
+                            plates_path, db_path, full=True), repeat=3, min_time=0)
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+@benchmark
+def bench_layers(quick):
+    '''Lookup through stacks of layers against asking each layer in turn.'''
+
+    count = 1000 if quick else 10000
+    temp_dir = tempfile.mkdtemp()
+
+    try:
+        # Every layer overrides the same plates, and adds one of its own
+        paths = []
+        for i in range(8):
+            plates_path = os.path.join(temp_dir, str(i))
+            make_plates(plates_path, count)
+            with open(os.path.join(plates_path, 'only{0}.only{0}'.format(i)),
+                      'w') as plate_file:
+                plate_file.write('layer {0}'.format(i))
+
+            paths.append(plates_path + '.db')
+            prepare.makeTemplates(plates_path, paths[-1])
+
+        for layers in (1, 2, 4, 8):
+            bottom = 'only{0}'.format(layers - 1)
+
+            yield {'plates': count, 'layers': layers, 'case': 'open'}, \
+                measure(lambda: boil.Boiler(paths[:layers]).close(), repeat=3)
+
+            with boil.Boiler(paths[:layers]) as boiler:
+                catalog = boiler.catalog
+
+                def scan():
+                    for layer in getattr(catalog, 'layers', [catalog]):
+                        template = layer.template(bottom)
+                        if template is not None:
+                            return template
+
+                yield {'plates': count, 'layers': layers, 'case': 'top'}, \
+                    measure(lambda: catalog.template('lang0'))
+                yield {'plates': count, 'layers': layers, 'case': 'bottom'}, \
+                    measure(lambda: catalog.template(bottom))
+                yield {'plates': count, 'layers': layers, 'case': 'scan'}, \
+                    measure(scan)
+    finally:
+        shutil.rmtree(temp_dir)
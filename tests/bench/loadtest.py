@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+
+'''Load test for the boil HTTP API.
+
+Usage: python3 -m tests.bench.loadtest [--url HOST:PORT] [--concurrency N]
+                                       [--workers N] [--duration SECONDS]
+                                       [--path PATH]
+
+Without --url, an HTTP server with --workers threads is started in this
+process on a free port. Each client thread keeps one connection alive
+for the whole run, so more clients than workers shows whether kept-alive
+connections share the workers.
+Reports requests per second and latency percentiles as JSON.
+'''
+
+import sys
+import json
+import time
+import argparse
+import threading
+import http.client
+
+import boil.boil
+
+
+def client(host, port, paths, deadline, latencies, errors):
+    '''Sends requests over one keep-alive connection until deadline.'''
+
+    con = http.client.HTTPConnection(host, port)
+    i = 0
+
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        con.request('GET', paths[i % len(paths)])
+        response = con.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - start)
+
+        if response.status != 200:
+            errors.append(response.status)
+        i += 1
+
+    con.close()
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run(host, port, paths, concurrency, duration):
+    '''Runs the load test. Returns a results dict.'''
+
+    latencies = []
+    errors = []
+    deadline = time.perf_counter() + duration
+
+    threads = [threading.Thread(target=client, args=(
+        host, port, paths, deadline, latencies, errors))
+               for _ in range(concurrency)]
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'concurrency': concurrency,
+        'requests_per_second': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000
+    }
+
+
+def parse():
+    '''Parses command line arguments'''
+
+    parser = argparse.ArgumentParser(
+        prog='python3 -m tests.bench.loadtest',
+        description='Load tests the boil HTTP API.')
+
+    parser.add_argument('--url', metavar='HOST:PORT',
+                        help='Server to test (default: start one in process)')
+    parser.add_argument('--concurrency', type=int, default=32, metavar='N')
+    parser.add_argument('--workers', type=int, default=4, metavar='N',
+                        help='Threads of the in-process server')
+    parser.add_argument('--duration', type=float, default=5, metavar='SECONDS')
+    parser.add_argument('--path', action='append', metavar='PATH',
+                        help='Request path (can be used multiple times)')
+
+    return vars(parser.parse_args())
+
+
+def main():
+    args = parse()
+
+    paths = args['path'] or ['/plate?lang=java&meth=green&line=1&space=2',
+                             '/plate?ext=py', '/languages']
+
+    server = None
+    if args['url']:
+        host, _, port = args['url'].rpartition(':')
+        port = int(port)
+    else:
+        server = boil.boil.make_http_server(('localhost', 0),
+                                            max_workers=args['workers'])
+        host, port = server.server_address[:2]
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    try:
+        results = run(host, port, paths, args['concurrency'], args['duration'])
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+    json.dump(results, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
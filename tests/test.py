@@ -2,9 +2,33 @@
 
 '''Unit tests for boil.py'''
 
+import io
+import re
+import json
+import errno
+import http.client
+import asyncio
+import contextlib
+import os
+import shutil
+import socket
+import sqlite3
+import itertools
+import subprocess
+import sys
+import tempfile
+import threading
 import unittest
+import warnings
+from unittest import mock
 from tests import codetester
 import boil
+import prepare
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLATES_DIR = os.path.join(ROOT_DIR, 'plates')
+PLATES_DB = os.path.join(ROOT_DIR, 'boil', 'plates.db')
 
 
 class TestBoil(unittest.TestCase):
@@ -72,5 +96,1355 @@ class TestBoil(unittest.TestCase):
         with self.subTest('bad lang data'):
             self.assertRaises(LookupError, boiler.plate, lang='asdf')
 
+        with self.subTest('suggestions'):
+            with self.assertRaisesRegex(LookupError, r'Did you mean python\b'):
+                boiler.plate(lang='pyhton')
+            with self.assertRaisesRegex(LookupError, r'Did you mean \.java\?'):
+                boiler.plate(ext='jav')
+
+        with self.subTest('cached errors'):
+            self.assertRaises(LookupError, boiler.plate, lang='pyhtn')
+
+            with mock.patch.object(boiler.catalog, '_get_query',
+                                   wraps=boiler.catalog._get_query) as query:
+                for _ in range(3):
+                    with self.assertRaisesRegex(LookupError, r'Did you mean python\b'):
+                        boiler.plate(lang='pyhtn')
+
+            self.assertEqual(query.call_count, 0)
+
+    def test_stream_requests(self):
+        '''JSON-lines requests are answered in order or on a pool'''
+
+        boiler = boil.Boiler(thread_safe=True)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'src', 'Blue.java')
+            lines = [
+                json.dumps({'lang': 'python2', 'title': 'Blue', 'meth': ['green'],
+                            'line': True, 'space': 2, 'id': 1}),
+                '',
+                '{',
+                json.dumps({'ext': 'asdf', 'id': 'x'}),
+                json.dumps({'file': path})
+            ]
+
+            output = io.StringIO()
+            boil.stream_requests(boiler, lines, output)
+            responses = [json.loads(line) for line in output.getvalue().splitlines()]
+
+            self.assertEqual(responses[1]['type'], 'JSONDecodeError')
+            del responses[1]
+            self.assertEqual(responses, [
+                {'text': boiler.plate(lang='python2', options=codetester.OPTIONS),
+                 'id': 1},
+                {'error': 'Unknown language or extension.', 'type': 'LookupError',
+                 'id': 'x'},
+                {'file': path}])
+
+            with open(path) as java_file:
+                self.assertEqual(java_file.read(),
+                                 boiler.plate(lang='java', options={'name': 'Blue'}))
+
+        with self.subTest('meth'):
+            output = io.StringIO()
+            boil.stream_requests(boiler, [
+                json.dumps({'lang': 'c', 'meth': 'abc'}),
+                json.dumps({'lang': 'c', 'meth': 1})], output)
+            responses = [json.loads(line) for line in output.getvalue().splitlines()]
+
+            self.assertEqual(responses[0]['text'],
+                             boiler.plate(lang='c', options={'funcs': ['abc']}))
+            self.assertEqual(responses[1]['type'], 'ValueError')
+
+        with self.subTest('workers'):
+            output = io.StringIO()
+
+            def requests():
+                for i in range(100):
+                    # Read-ahead is bounded by the number of workers
+                    self.assertLessEqual(i - output.getvalue().count('\n'), 4)
+                    yield json.dumps({'lang': 'c', 'meth': [str(i)], 'id': i})
+
+            boil.stream_requests(boiler, requests(), output, max_workers=2)
+
+            responses = [json.loads(line) for line in output.getvalue().splitlines()]
+            self.assertEqual(sorted(response['id'] for response in responses),
+                             list(range(100)))
+            for response in responses:
+                self.assertEqual(response['text'], boiler.plate(
+                    lang='c', options={'funcs': [str(response['id'])]}))
+
+    def test_split_filename(self):
+        '''File names match their longest supported extension'''
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            plates_path = os.path.join(temp_dir, 'plates')
+            db_path = os.path.join(temp_dir, 'plates.db')
+            catalog_path = os.path.join(temp_dir, 'plates.cat')
+            os.mkdir(plates_path)
+
+            for file_name in ('js.js', 'ts.ts', 'dts.d.ts,D.TS.X',
+                              'jest.spec.js,test.js', 'make.=Makefile.=GNUmakefile'):
+                with open(os.path.join(plates_path, file_name), 'w') as plate_file:
+                    plate_file.write(file_name)
+
+            prepare.makeTemplates(plates_path, db_path)
+            prepare.makeCatalog(db_path, catalog_path)
+
+            for path in (db_path, catalog_path):
+                with self.subTest(path), boil.Boiler(path) as boiler:
+                    cases = {
+                        'types.d.ts': ('types', 'd.ts'),
+                        'Types.D.TS': ('Types', 'D.TS'),
+                        'x.spec.js': ('x', 'spec.js'),
+                        'x.other.js': ('x.other', 'js'),
+                        'd.ts': ('d', 'ts'),
+                        'Makefile': ('Makefile', 'Makefile'),
+                        'makefile': ('makefile', 'makefile'),
+                        'x.Makefile': ('x', 'Makefile'),
+                        'a.b.unknown': ('a.b', 'unknown'),
+                        'README': ('README', None),
+                        '.js': ('.js', None)
+                    }
+
+                    for file_name, expected in cases.items():
+                        self.assertEqual(boiler.split_filename(file_name),
+                                         expected, file_name)
+
+                    self.assertEqual(boiler.plate(ext='d.ts'), 'dts.d.ts,D.TS.X')
+                    self.assertEqual(boiler.plate(ext='d.ts.x'), 'dts.d.ts,D.TS.X')
+                    self.assertEqual(boiler.plate(ext='makefile'),
+                                     'make.=Makefile.=GNUmakefile')
+                    self.assertEqual(boiler.supported_extensions(),
+                                     ['.d.ts', '.D.TS.X', '.js', '.spec.js',
+                                      '.test.js', '.ts'])
+
+    def test_search(self):
+        '''Search ranks prefix matches before similar aliases'''
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            db_path = os.path.join(temp_dir, 'plates.db')
+            catalog_path = os.path.join(temp_dir, 'plates.cat')
+
+            prepare.makeTemplates(PLATES_DIR, db_path)
+            prepare.makeCatalog(db_path, catalog_path)
+
+            for path in (db_path, catalog_path):
+                with self.subTest(path), boil.Boiler(path) as boiler:
+                    results = boiler.search('PYT')
+                    self.assertEqual(
+                        [(r.alias, r.kind, r.prefix) for r in results], [
+                            ('python', 'name', True), ('python2', 'name', True),
+                            ('python3', 'name', True),
+                            ('py', 'extension', False)])
+
+                    result = boiler.search('pyhton')[0]
+                    self.assertEqual((result.alias, result.prefix),
+                                     ('python', False))
+                    self.assertGreater(result.score, 0.5)
+
+                    self.assertEqual([r.alias for r in boiler.search('.c')],
+                                     ['c', 'cc', 'c++', 'cpp', 'cxx'])
+                    self.assertEqual(len(boiler.search('.c', limit=2)), 2)
+                    self.assertEqual(boiler.search('zzzz'), [])
+                    self.assertEqual(boiler.search(''), [])
+
+        with self.subTest('shared trigrams'), \
+                tempfile.TemporaryDirectory() as temp_dir:
+            # Every alias shares the "lang" trigrams with the terms
+            for i in range(300):
+                with open(os.path.join(temp_dir, 'lang{0}.e{0}'.format(i)),
+                          'w') as plate_file:
+                    plate_file.write(str(i))
+
+            with boil.Boiler.from_directory(temp_dir) as boiler:
+                self.assertEqual(boiler.search('lnag150')[0].alias, 'lang150')
+                self.assertEqual(boiler.search('lang199x')[0].alias, 'lang199')
+                self.assertEqual(boiler.search('.e2999')[0].alias, 'e299')
+
+    def test_lookup_precedence(self):
+        '''Languages take precedence over extensions'''
+
+        with boil.Boiler(PLATES_DB) as boiler:
+            self.assertEqual(boiler.plate(lang='java', ext='.c'),
+                             codetester.LANG['java']['default'])
+            self.assertEqual(boiler.plate(lang='asdf', ext='.c'),
+                             codetester.LANG['c']['default'])
+            self.assertEqual(boiler.plate(lang='c', ext='.java'),
+                             codetester.LANG['c']['default'])
+
+    def test_plate_cache(self):
+        '''Tests plate caching by language and extension'''
+
+        boiler = boil.Boiler(cache_size=2)
+
+        with self.subTest('normalized keys'):
+            plate = boiler.get_plate(lang='Python')
+            self.assertIs(boiler.get_plate(lang='python'), plate)
+            self.assertEqual(boiler.cache_info(), (1, 1, 2, 1))
+
+        with self.subTest('negative caching'):
+            for _ in range(3):
+                self.assertRaises(LookupError, boiler.plate, ext='.asdf')
+            self.assertEqual(boiler.cache_info(), (3, 2, 2, 2))
+
+        with self.subTest('eviction'):
+            boiler.get_plate(ext='c')
+            boiler.get_plate(lang='python')
+            self.assertEqual(boiler.cache_info(), (3, 4, 2, 2))
+
+        with self.subTest('clear'):
+            boiler.cache_clear()
+            self.assertEqual(boiler.cache_info(), (0, 0, 2, 0))
+
+    def test_plate_many(self):
+        '''Tests batch generation'''
+
+        boiler = boil.Boiler()
+
+        requests = [(tester['lang'], None, codetester.OPTIONS)
+                    for tester in codetester.LANG.values()]
+        requests.insert(2, ('asdf', None, None))
+        requests.append((None, '.c', None))
+        expected = [boiler.plate(lang, ext, options)
+                    if lang != 'asdf' else None
+                    for lang, ext, options in requests]
+
+        with self.subTest('serial'):
+            results = boiler.plate_many(requests)
+            self.assertIsInstance(results[2], LookupError)
+            results[2] = None
+            self.assertEqual(results, expected)
+
+        with self.subTest('process pool'):
+            results = boiler.plate_many(requests, max_workers=2, chunksize=1)
+            self.assertIsInstance(results[2], LookupError)
+            results[2] = None
+            self.assertEqual(results, expected)
+
+    def test_thread_safe(self):
+        '''Stress tests a Boiler shared between threads'''
+
+        testers = list(codetester.LANG.values())
+        expected = {tester['lang']: boil.Boiler().plate(
+            lang=tester['lang'], options=codetester.OPTIONS)
+                    for tester in testers}
+        errors = []
+
+        def worker(boiler, offset):
+            try:
+                for i in range(200):
+                    tester = testers[(offset + i) % len(testers)]
+                    text = boiler.plate(lang=tester['lang'],
+                                        options=codetester.OPTIONS)
+                    if text != expected[tester['lang']]:
+                        errors.append(tester['lang'])
+                    boiler.supported_extensions()
+            except Exception as exception:
+                errors.append(exception)
+
+        with boil.Boiler(PLATES_DB, cache_size=0, thread_safe=True,
+                         pool_size=4) as boiler:
+            threads = [threading.Thread(target=worker, args=(boiler, i))
+                       for i in range(16)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            self.assertEqual(errors, [])
+            self.assertLessEqual(len(boiler.catalog._pool), 4)
+
+        with self.subTest('closed'):
+            self.assertRaises(sqlite3.ProgrammingError,
+                              boiler.plate, lang='c')
+
+    def test_binary_catalog(self):
+        '''Binary catalogs match the database they were built from'''
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            db_path = os.path.join(temp_dir, 'plates.db')
+            catalog_path = os.path.join(temp_dir, 'plates.cat')
+
+            prepare.makeTemplates(PLATES_DIR, db_path)
+            prepare.makeCatalog(db_path, catalog_path)
+
+            with boil.Boiler(db_path) as database, \
+                    boil.Boiler(catalog_path) as catalog:
+                self.assertIsInstance(catalog.catalog, boil.BinaryCatalog)
+
+                self.assertEqual(catalog.supported_languages(),
+                                 database.supported_languages())
+                self.assertEqual(catalog.supported_extensions(),
+                                 database.supported_extensions())
+
+                for tester in codetester.LANG.values():
+                    with self.subTest(tester['lang']):
+                        self.assertEqual(
+                            catalog.plate(lang=tester['lang'].upper()),
+                            database.plate(lang=tester['lang']))
+                        self.assertEqual(
+                            catalog.plate(ext=tester['ext']),
+                            database.plate(ext=tester['ext']))
+
+                self.assertRaises(LookupError, catalog.plate, lang='asdf')
+                self.assertRaises(LookupError, catalog.plate, ext='asdf')
+
+    def test_from_directory(self):
+        '''Plates directories match the database built from them'''
+
+        with boil.Boiler.from_directory(PLATES_DIR) as directory, \
+                boil.Boiler(PLATES_DB) as database:
+            self.assertIsInstance(directory.catalog, boil.DirectoryCatalog)
+
+            self.assertEqual(list(directory.supported_languages()),
+                             database.supported_languages())
+            self.assertEqual(list(directory.supported_extensions()),
+                             database.supported_extensions())
+
+            for tester in codetester.LANG.values():
+                with self.subTest(tester['lang']):
+                    self.assertEqual(directory.plate(lang=tester['lang']),
+                                     database.plate(lang=tester['lang']))
+                    self.assertEqual(directory.plate(ext=tester['ext'].upper()),
+                                     database.plate(ext=tester['ext']))
+
+        self.assertRaises(NotADirectoryError, boil.Boiler.from_directory,
+                          PLATES_DB)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            os.mkdir(os.path.join(temp_dir, 'partials'))
+
+            def write(file_name, text):
+                with open(os.path.join(temp_dir, file_name), 'w') as plate_file:
+                    plate_file.write(text)
+
+            write('a.x', 'a')
+            write('b.x.=Makefile', 'b {BP_INCLUDE end}')
+            write('c.c', '{BP_INCLUDE missing}')
+            write('partials/end', 'end\n')
+
+            with boil.Boiler.from_directory(temp_dir) as boiler:
+                # Templates are read on first use
+                write('a.x', 'changed')
+
+                self.assertEqual(boiler.plate(ext='x'), 'changed')
+                self.assertEqual(boiler.plate('b'), 'b end')
+                self.assertEqual(boiler.plate(ext='makefile'), 'b end')
+                self.assertRaises(ValueError, boiler.plate, 'c')
+
+            # Files that are not plates are skipped with a warning
+            write('README', 'readme')
+            write('.DS_Store', 'store')
+            write('.c.c.swp', 'swap')
+
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter('always')
+                boiler = boil.Boiler.from_directory(temp_dir)
+
+            with boiler:
+                self.assertEqual(sorted(str(warning.message).rpartition(' ')[2]
+                                        for warning in caught),
+                                 ['.DS_Store', '.c.c.swp', 'README'])
+
+                # The swap file does not take over the "c" extension
+                self.assertRaises(ValueError, boiler.plate, ext='c')
+                self.assertEqual(list(boiler.supported_extensions()),
+                                 ['.c', '.x'])
+
+                # Deleted before the next check, so a miss
+                os.remove(os.path.join(temp_dir, 'a.x'))
+                self.assertRaises(LookupError, boiler.plate, 'a')
+                self.assertNotIn('a', boiler.supported_languages())
+
+    def test_layers(self):
+        '''Higher plate layers override lower ones'''
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            def write(directory, file_name, text):
+                os.makedirs(os.path.join(temp_dir, directory), exist_ok=True)
+                with open(os.path.join(temp_dir, directory, file_name), 'w') as plate_file:
+                    plate_file.write(text)
+
+            write('system', 'a.a', 'system a')
+            write('system', 'b.b', 'system b')
+            write('system', 'make.=Makefile', 'system make')
+            write('user', 'a.a', 'user a')
+            write('user', 'c.x', 'user c')
+            write('project', 'b,c.b', 'project b')
+
+            user_db = os.path.join(temp_dir, 'user.db')
+            prepare.makeTemplates(os.path.join(temp_dir, 'user'), user_db)
+
+            layers = [os.path.join(temp_dir, 'project'), user_db,
+                      os.path.join(temp_dir, 'system')]
+
+            for snapshot in (False, True):
+                with self.subTest(snapshot=snapshot), \
+                        boil.Boiler(layers, snapshot=snapshot) as boiler:
+                    self.assertIsInstance(boiler.catalog, boil.LayeredCatalog)
+
+                    self.assertEqual(boiler.plate('A'), 'user a')
+                    self.assertEqual(boiler.plate('b'), 'project b')
+                    self.assertEqual(boiler.plate(ext='b'), 'project b')
+                    self.assertEqual(boiler.plate('c'), 'project b')
+                    self.assertEqual(boiler.plate(ext='x'), 'user c')
+                    self.assertEqual(boiler.plate(ext='Makefile'), 'system make')
+                    self.assertRaises(LookupError, boiler.plate, 'd')
+
+                    self.assertEqual(list(boiler.supported_languages()),
+                                     ['a', 'b', 'c', 'make'])
+                    self.assertEqual(list(boiler.supported_extensions()),
+                                     ['.a', '.b', '.x'])
+                    self.assertEqual(boiler.split_filename('Makefile'),
+                                     ('Makefile', 'Makefile'))
+                    self.assertEqual(boiler.search('maek')[0].alias, 'make')
+
+            # Rebuilt snapshot layers are merged again
+            with boil.Boiler(layers, snapshot=True, check_interval=0) as boiler:
+                self.assertEqual(boiler.plate(ext='x'), 'user c')
+
+                write('user', 'b.b', 'user b')
+                write('user', 'd.x', 'user d')
+                os.remove(os.path.join(temp_dir, 'user', 'c.x'))
+                prepare.makeTemplates(os.path.join(temp_dir, 'user'), user_db)
+
+                self.assertEqual(boiler.plate(ext='x'), 'user d')
+                self.assertEqual(boiler.plate('b'), 'project b')
+                self.assertEqual(boiler.supported_languages()[-1], 'make')
+                self.assertIn('d', boiler.supported_languages())
+
+            # Changed directory layers are indexed again
+            with boil.Boiler(layers, check_interval=0) as boiler:
+                self.assertEqual(boiler.plate('b'), 'project b')
+
+                write('project', 'b,c.b', 'changed project b')
+                write('project', 'e.e', 'project e')
+
+                self.assertEqual(boiler.plate('b'), 'changed project b')
+                self.assertEqual(boiler.plate(ext='e'), 'project e')
+
+                os.remove(os.path.join(temp_dir, 'project', 'b,c.b'))
+
+                self.assertEqual(boiler.plate('b'), 'user b')
+                self.assertNotIn('c', boiler.supported_languages())
+
+    def test_plate_layers(self):
+        '''Plate layers are found in the project, user and system'''
+
+        default = boil.Boiler._get_default_plates_path()
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            def layer(*parts):
+                path = os.path.join(temp_dir, *parts)
+                os.makedirs(path)
+                return path
+
+            project = layer('repo', '.boil', 'plates')
+            nested = layer('repo', 'src', 'module')
+            user = layer('home', 'boil', 'plates')
+            first = layer('first', 'boil')
+            second = layer('second', 'boil', 'plates')
+            open(os.path.join(first, 'plates.db'), 'w').close()
+            open(os.path.join(first, 'plates.cat'), 'w').close()
+
+            environ = {
+                'XDG_DATA_HOME': os.path.join(temp_dir, 'home'),
+                'XDG_DATA_DIRS': ':'.join([os.path.join(temp_dir, 'first'),
+                                           os.path.join(temp_dir, 'missing'),
+                                           os.path.join(temp_dir, 'second')])
+            }
+
+            with mock.patch.dict(os.environ, environ):
+                os.environ.pop('BOIL_PATH', None)
+
+                self.assertEqual(boil.plate_layers(nested),
+                                 [project, user,
+                                  os.path.join(first, 'plates.cat'), second,
+                                  default])
+                self.assertEqual(boil.plate_layers(temp_dir),
+                                 [user, os.path.join(first, 'plates.cat'),
+                                  second, default])
+
+                os.environ['BOIL_PATH'] = os.pathsep.join(
+                    [second, first, default])
+                self.assertEqual(boil.plate_layers(nested),
+                                 [second, os.path.join(first, 'plates.cat'),
+                                  default])
+
+    def test_snapshot(self):
+        '''Snapshot catalogs match their database and follow its rebuilds'''
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            db_path = os.path.join(temp_dir, 'plates.db')
+
+            prepare.makeTemplates(PLATES_DIR, db_path)
+
+            with boil.Boiler(db_path) as database, \
+                    boil.Boiler(db_path, snapshot=True) as snapshot:
+                self.assertIsInstance(snapshot.catalog, boil.SnapshotCatalog)
+
+                self.assertEqual(list(snapshot.supported_languages()),
+                                 database.supported_languages())
+                self.assertEqual(list(snapshot.supported_extensions()),
+                                 database.supported_extensions())
+                self.assertEqual(snapshot.search('pyhton'),
+                                 database.search('pyhton'))
+                self.assertEqual(snapshot.search('.p'), database.search('.p'))
+
+                for tester in codetester.LANG.values():
+                    with self.subTest(tester['lang']):
+                        self.assertEqual(
+                            snapshot.plate(lang=tester['lang'].upper()),
+                            database.plate(lang=tester['lang']))
+                        self.assertEqual(
+                            snapshot.plate(ext=tester['ext']),
+                            database.plate(ext=tester['ext']))
+
+                self.assertRaises(LookupError, snapshot.plate, lang='asdf')
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            plates_path = os.path.join(temp_dir, 'plates')
+            db_path = os.path.join(temp_dir, 'plates.db')
+            os.mkdir(plates_path)
+
+            def write(file_name, text):
+                with open(os.path.join(plates_path, file_name), 'w') as plate_file:
+                    plate_file.write(text)
+
+            write('a.a', 'first')
+            prepare.makeTemplates(plates_path, db_path)
+
+            with boil.Boiler(db_path, snapshot=True, check_interval=0) as eager, \
+                    boil.Boiler(db_path, snapshot=True, check_interval=3600) as lazy:
+                self.assertEqual(eager.plate('a'), 'first')
+                self.assertEqual(lazy.plate('a'), 'first')
+                languages = eager.supported_languages()
+
+                for full in (False, True):
+                    with self.subTest(full=full):
+                        write('a.a', 'second' if full else 'changed')
+                        write('b.b', 'new')
+                        prepare.makeTemplates(plates_path, db_path, full=full)
+
+                        # Lookups made before the swap keep their snapshot
+                        self.assertEqual(languages, ('a',))
+
+                        expected = 'second' if full else 'changed'
+                        self.assertEqual(eager.plate('a'), expected)
+                        self.assertEqual(eager.plate(ext='b'), 'new')
+                        self.assertEqual(eager.supported_languages(), ('a', 'b'))
+
+                        self.assertEqual(lazy.plate('a'),
+                                         'first' if not full else 'changed')
+                        lazy.catalog.refresh(force=True)
+                        self.assertEqual(lazy.plate('a'), expected)
+
+                        os.remove(os.path.join(plates_path, 'b.b'))
+
+                self.assertEqual(eager.catalog.generation, 2)
+
+    def test_stats(self):
+        '''Tests stage timers, counters and the stats hook'''
+
+        with self.subTest('disabled'):
+            self.assertIsNone(boil.Boiler().stats())
+
+        events = []
+        boiler = boil.Boiler(stats_hook=lambda *event: events.append(event))
+
+        text = boiler.plate(lang='c', options=codetester.OPTIONS)
+        boiler.plate(lang='c')
+        self.assertRaises(LookupError, boiler.plate, lang='asdf')
+        ''.join(boiler.plate_iter(lang='c'))
+
+        stats = boiler.stats()
+        self.assertEqual(stats['counters'], {
+            'lookups': 4,
+            'cache_hits': 2,
+            'cache_misses': 2,
+            'bytes': len(text) + 2 * len(codetester.LANG['c']['default'])
+        })
+        self.assertEqual(
+            {stage: timer['calls'] for stage, timer in stats['timers'].items()},
+            {'open': 1, 'lookup': 2, 'compile': 2, 'generate': 3})
+
+        self.assertEqual(len([e for e in events if e[0] == 'timer']), 8)
+        self.assertEqual(sum(e[2] for e in events if e[1] == 'lookups'), 4)
+
+    def test_output_cache(self):
+        '''Tests the generated code cache'''
+
+        expected = boil.Boiler().plate(lang='java', options=codetester.OPTIONS)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache = boil.OutputCache(directory=temp_dir)
+            boiler = boil.Boiler(output_cache=cache)
+
+            with self.subTest('memory'):
+                for _ in range(3):
+                    self.assertEqual(
+                        boiler.plate(lang='java', options=codetester.OPTIONS),
+                        expected)
+                self.assertEqual(boiler.plate(lang='java'),
+                                 codetester.LANG['java']['default'])
+                self.assertEqual(cache.info()['hits'], 2)
+                self.assertEqual(cache.info()['entries'], 2)
+
+            with self.subTest('disk'):
+                cache = boil.OutputCache(directory=temp_dir)
+                boiler = boil.Boiler(output_cache=cache)
+                self.assertEqual(
+                    ''.join(boiler.plate_iter(lang='JAVA', ext='.c',
+                                              options=codetester.OPTIONS)),
+                    expected)
+                self.assertEqual(cache.info()['hits'], 1)
+
+        with self.subTest('size bound'):
+            cache = boil.OutputCache(max_bytes=len(expected) + 1)
+            boiler = boil.Boiler(output_cache=cache)
+            boiler.plate(lang='java', options=codetester.OPTIONS)
+            boiler.plate(lang='c', options=codetester.OPTIONS)
+            self.assertEqual(cache.info()['entries'], 1)
+            self.assertLessEqual(cache.info()['bytes'], cache.max_bytes)
+
+        with self.subTest('directory bound'), \
+                tempfile.TemporaryDirectory() as temp_dir:
+            cache = boil.OutputCache(max_bytes=100, directory=temp_dir)
+            keys = ['{0:064x}'.format(i) for i in range(4)]
+
+            for i, key in enumerate(keys):
+                cache.put(key, str(i) * 40)
+                # Older entries were used less recently
+                os.utime(cache._path(key), ns=(i, i))
+
+            self.assertEqual(sorted(os.path.basename(path) for _, _, path
+                                    in cache._entry_files()),
+                             [key[2:] for key in keys[2:]])
+
+            fresh = boil.OutputCache(directory=temp_dir)
+            self.assertIsNone(fresh.get(keys[0]))
+            self.assertEqual(fresh.get(keys[3]), '3' * 40)
+
+    def test_scaffold(self):
+        '''Tests writing a project of files'''
+
+        boiler = boil.Boiler()
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            entries = [
+                {'path': os.path.join(temp_dir, 'src', 'main.c')},
+                {'path': os.path.join(temp_dir, 'bin', 'run'),
+                 'lang': 'python3', 'exec': True},
+                {'path': os.path.join(temp_dir, 'bad.unknown')}
+            ]
+
+            results = boil.scaffold(boiler, entries)
+
+            self.assertEqual([path for path, _ in results],
+                             [entry['path'] for entry in entries])
+            self.assertIsNone(results[0][1])
+            self.assertIsNone(results[1][1])
+            self.assertIsInstance(results[2][1], LookupError)
+            self.assertFalse(os.path.exists(entries[2]['path']))
+
+            with open(entries[0]['path']) as main_file:
+                self.assertEqual(main_file.read(),
+                                 boiler.plate(ext='c', options={'name': 'main'}))
+            self.assertTrue(os.access(entries[1]['path'], os.X_OK))
+            self.assertFalse(os.access(entries[0]['path'], os.X_OK))
+
+            with self.subTest('existing'):
+                results = boil.scaffold(boiler, entries[:1])
+                self.assertIsInstance(results[0][1], FileExistsError)
+
+            with self.subTest('force'):
+                entries[0].update(ext='java', force=True)
+                self.assertIsNone(boil.scaffold(boiler, entries[:1])[0][1])
+                with open(entries[0]['path']) as main_file:
+                    self.assertEqual(
+                        main_file.read(),
+                        boiler.plate(ext='java', options={'name': 'main'}))
+
+            with self.subTest('invalid entries'):
+                run = os.path.join(temp_dir, 'bin', 'run.c')
+                results = boil.scaffold(boiler, [
+                    {'lang': 'c'}, 'main.c', {'path': 1},
+                    {'path': run, 'meth': 'abc'},
+                    {'path': run + 'pp', 'meth': {'a': 1}}])
+
+                self.assertEqual([path for path, _ in results],
+                                 [None, None, 1, run, run + 'pp'])
+                for _, error in results[:3] + results[4:]:
+                    self.assertIsInstance(error, ValueError)
+                self.assertIsNone(results[3][1])
+
+                with open(run) as run_file:
+                    self.assertEqual(run_file.read(), boiler.plate(
+                        ext='c', options={'name': 'run', 'funcs': ['abc']}))
+
+            self.assertEqual(sorted(os.listdir(os.path.join(temp_dir, 'src'))),
+                             ['main.c'])
+
+    def test_write_file(self):
+        '''Overwriting keeps links and permissions of the existing file'''
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            def path(name):
+                return os.path.join(temp_dir, name)
+
+            def read(name):
+                with open(path(name)) as text_file:
+                    return text_file.read()
+
+            boil.write_file(path('a.c'), 'a')
+            os.chmod(path('a.c'), 0o640)
+            os.symlink('a.c', path('link.c'))
+
+            with self.subTest('symbolic link'):
+                boil.write_file(path('link.c'), 'b', force=True)
+                self.assertTrue(os.path.islink(path('link.c')))
+                self.assertEqual(read('a.c'), 'b')
+
+            with self.subTest('mode'):
+                self.assertEqual(os.stat(path('a.c')).st_mode & 0o777, 0o640)
+                boil.write_file(path('a.c'), 'c', force=True, executable=True)
+                self.assertEqual(os.stat(path('a.c')).st_mode & 0o777, 0o740)
+
+            with self.subTest('hard link'):
+                os.link(path('a.c'), path('hard.c'))
+                boil.write_file(path('hard.c'), 'd', force=True)
+                self.assertEqual(read('a.c'), 'd')
+
+            with self.subTest('no hard links'):
+                with mock.patch('os.link', side_effect=PermissionError(
+                        errno.EPERM, 'Operation not permitted')):
+                    boil.write_file(path('e.c'), 'e', executable=True)
+                    self.assertRaises(FileExistsError, boil.write_file,
+                                      path('e.c'), 'f')
+
+                self.assertEqual(read('e.c'), 'e')
+                self.assertTrue(os.access(path('e.c'), os.X_OK))
+
+            self.assertEqual(sorted(os.listdir(temp_dir)),
+                             ['a.c', 'e.c', 'hard.c', 'link.c'])
+
+    def test_lazy_imports(self):
+        '''Generating code does not import the server, async, scaffold
+        or search modules'''
+
+        def loaded(code):
+            script = 'import sys, boil\n{0}\nprint(" ".join(sys.modules))'
+            result = subprocess.run(
+                [sys.executable, '-c', script.format(code)], cwd=ROOT_DIR,
+                stdout=subprocess.PIPE, check=True, universal_newlines=True)
+            return set(result.stdout.split())
+
+        modules = loaded('boil.Boiler().plate(lang="python")')
+        self.assertIn('boil.core', modules)
+        for name in ('boil.server', 'boil.aio', 'boil.scaffold', 'boil.search',
+                     'asyncio', 'http.server', 'urllib.parse'):
+            self.assertNotIn(name, modules)
+
+        self.assertIn('boil.search', loaded('boil.Boiler().search("pyton")'))
+
+
+class TestAsyncBoiler(unittest.TestCase):
+    '''asyncio interface tests'''
+
+    def test_async_boiler(self):
+        '''Async results match Boiler and identical lookups are coalesced'''
+
+        boiler = boil.Boiler()
+        big = dict(codetester.OPTIONS, funcs=['f{0}'.format(i) for i in range(300)])
+
+        async def run():
+            async with boil.AsyncBoiler(stats=True) as async_boiler:
+                texts = await asyncio.gather(*[
+                    async_boiler.plate(lang='java', options=codetester.OPTIONS)
+                    for _ in range(20)])
+                self.assertEqual(texts, [boiler.plate(
+                    lang='java', options=codetester.OPTIONS)] * 20)
+
+                # One database query for all concurrent lookups
+                stats = async_boiler.boiler.stats()
+                self.assertEqual(stats['timers']['lookup']['calls'], 1)
+
+                # Generation is recorded like Boiler.plate
+                self.assertEqual(stats['timers']['generate']['calls'], 20)
+                self.assertEqual(stats['counters']['bytes'],
+                                 20 * len(texts[0].encode('utf-8')))
+
+                self.assertEqual(await async_boiler.plate(lang='c', options=big),
+                                 boiler.plate(lang='c', options=big))
+
+                with self.assertRaises(LookupError):
+                    await async_boiler.plate(lang='asdf')
+
+                results = await async_boiler.plate_many(
+                    [('c', None, None), ('asdf', None, None)])
+                self.assertEqual(results[0], boiler.plate(lang='c'))
+                self.assertIsInstance(results[1], LookupError)
+
+                self.assertEqual(await async_boiler.supported_languages(),
+                                 boiler.supported_languages())
+                self.assertEqual(await async_boiler.supported_extensions(),
+                                 boiler.supported_extensions())
+                self.assertEqual(await async_boiler.search('jav'),
+                                 boiler.search('jav'))
+
+            # Snapshot catalogs are checked for changes off the loop
+            async with boil.AsyncBoiler(snapshot=True,
+                                        check_interval=0) as async_boiler:
+                threads = []
+                refresh = async_boiler.boiler._refresh_catalog
+
+                def record():
+                    threads.append(threading.get_ident())
+                    refresh()
+
+                with mock.patch.object(async_boiler.boiler, '_refresh_catalog',
+                                       record):
+                    for _ in range(2):
+                        self.assertEqual(await async_boiler.plate(lang='c'),
+                                         boiler.plate(lang='c'))
+
+                self.assertEqual(len(threads), 2)
+                self.assertNotIn(threading.get_ident(), threads)
+
+        asyncio.run(run())
+
+        async def close():
+            ticks = []
+
+            async def tick():
+                while True:
+                    ticks.append(None)
+                    await asyncio.sleep(0.01)
+
+            ticker = asyncio.ensure_future(tick())
+            async with boil.AsyncBoiler() as async_boiler:
+                async_boiler._run(threading.Event().wait, 0.2)
+            ticker.cancel()
+
+            # The loop kept running while the pool finished
+            self.assertGreater(len(ticks), 5)
+
+        asyncio.run(close())
+
+    def test_async_output_cache(self):
+        '''Async plates share the Boiler's output cache'''
+
+        expected = boil.Boiler().plate(lang='java', options=codetester.OPTIONS)
+
+        async def run(cache):
+            async with boil.AsyncBoiler(output_cache=cache) as async_boiler:
+                for _ in range(3):
+                    self.assertEqual(await async_boiler.plate(
+                        lang='java', options=codetester.OPTIONS), expected)
+
+            self.assertEqual(cache.info()['hits'], 2)
+            self.assertEqual(cache.info()['misses'], 1)
+
+        asyncio.run(run(boil.OutputCache()))
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            asyncio.run(run(boil.OutputCache(directory=temp_dir)))
+            self.assertEqual(len(os.listdir(temp_dir)), 1)
+
+
+class TestDaemon(unittest.TestCase):
+    '''Unix socket daemon tests'''
+
+    def test_daemon(self):
+        '''Daemon responses match a local Boiler'''
+
+        boiler = boil.Boiler()
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'boil.sock')
+            server = boil.boil.make_server(path)
+            thread = threading.Thread(target=server.serve_forever)
+            thread.start()
+
+            try:
+                with boil.boil.BoilClient.connect(path) as client:
+                    for tester in codetester.LANG.values():
+                        with self.subTest(tester['lang']):
+                            self.assertEqual(
+                                client.plate(lang=tester['lang'],
+                                             options=codetester.OPTIONS),
+                                boiler.plate(lang=tester['lang'],
+                                             options=codetester.OPTIONS))
+
+                    self.assertEqual(client.supported_languages(),
+                                     boiler.supported_languages())
+                    self.assertEqual(client.supported_extensions(),
+                                     boiler.supported_extensions())
+                    self.assertRaises(LookupError, client.plate, lang='asdf')
+                    self.assertRaises(LookupError, client.plate)
+                    self.assertEqual(client.search('jav'), boiler.search('jav'))
+                    self.assertEqual(client.split_filename('x.c++'), ('x', 'c++'))
+
+                with self.subTest('already running'):
+                    self.assertRaises(OSError, boil.boil.make_server, path)
+
+                with self.subTest('other layers'):
+                    layers = server.boiler.plates_path
+                    with boil.boil.BoilClient.connect(path, layers=layers) as client:
+                        self.assertEqual(client.layers(),
+                                         [os.path.abspath(layer) for layer in layers])
+                    self.assertIsNone(boil.boil.BoilClient.connect(
+                        path, layers=[temp_dir] + layers))
+
+                with self.subTest('shared socket'):
+                    os.chmod(path, 0o666)
+                    self.assertIsNone(boil.boil.BoilClient.connect(path))
+                    os.chmod(path, 0o600)
+                    boil.boil.BoilClient.connect(path).close()
+
+                with self.subTest('command line'):
+                    # The daemon answers before any catalog code is imported
+                    result = subprocess.run(
+                        [sys.executable, '-X', 'importtime',
+                         os.path.join(ROOT_DIR, 'boil', 'boil.py'), '-l', 'python'],
+                        env=dict(os.environ, BOIL_SOCKET=path),
+                        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                        check=True, universal_newlines=True)
+                    self.assertEqual(result.stdout, boiler.plate(lang='python'))
+                    self.assertIn('boil.client', result.stderr)
+                    self.assertNotIn('boil.core', result.stderr)
+            finally:
+                server.shutdown()
+                server.server_close()
+                thread.join()
+
+            self.assertFalse(os.path.exists(path))
+            self.assertIsNone(boil.boil.BoilClient.connect(path))
+
+    def test_socket_directory(self):
+        '''The fallback socket is kept in a private directory'''
+
+        with mock.patch.dict(os.environ):
+            os.environ.pop('BOIL_SOCKET', None)
+            os.environ.pop('XDG_RUNTIME_DIR', None)
+            self.assertEqual(boil.boil.default_socket_path(),
+                             '/tmp/boil-{0}/boil.sock'.format(os.getuid()))
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            private = os.path.join(temp_dir, 'private')
+            boil.boil._private_directory(private)
+            self.assertEqual(os.stat(private).st_mode & 0o777, 0o700)
+            boil.boil._private_directory(private)
+
+            os.chmod(private, 0o755)
+            self.assertRaises(PermissionError, boil.boil._private_directory, private)
+
+
+class TestHTTP(unittest.TestCase):
+    '''HTTP API tests'''
+
+    def test_http(self):
+        '''HTTP responses match a local Boiler over one connection'''
+
+        boiler = boil.Boiler()
+        server = boil.boil.make_http_server(('localhost', 0), max_workers=2)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+
+        con = http.client.HTTPConnection(*server.server_address[:2])
+
+        def get(path, headers={}):
+            con.request('GET', path, headers=headers)
+            response = con.getresponse()
+            return response, response.read().decode('utf-8')
+
+        try:
+            response, body = get(
+                '/plate?lang=python2&title=Blue&meth=green&line=1&space=2')
+            self.assertEqual(response.status, 200)
+            self.assertEqual(body, boiler.plate(lang='python2',
+                                                options=codetester.OPTIONS))
+
+            response, body = get('/plate?ext=.c')
+            self.assertEqual(body, codetester.LANG['c']['default'])
+
+            with self.subTest('listings'):
+                response, body = get('/languages')
+                self.assertEqual(json.loads(body), boiler.supported_languages())
+                etag = response.getheader('ETag')
+
+                response, body = get('/languages', {'If-None-Match': etag})
+                self.assertEqual((response.status, body), (304, ''))
+
+                response, body = get('/extensions')
+                self.assertEqual(json.loads(body), boiler.supported_extensions())
+
+                response, body = get('/search?q=jav&limit=1')
+                self.assertEqual(json.loads(body),
+                                 [boiler.search('jav', 1)[0]._asdict()])
+
+            with self.subTest('errors'):
+                self.assertEqual(get('/plate?lang=asdf')[0].status, 404)
+                self.assertEqual(get('/plate')[0].status, 400)
+                self.assertEqual(get('/plate?lang=c&space=x')[0].status, 400)
+                self.assertEqual(get('/search?q=jav&limit=-1')[0].status, 400)
+                self.assertEqual(get('/search?q=jav&limit=0')[0].status, 400)
+                self.assertEqual(get('/search?q=jav&limit=x')[0].status, 400)
+                self.assertEqual(get('/asdf')[0].status, 404)
+
+            with self.subTest('idle connections'):
+                # Idle kept-alive connections do not hold the 2 workers
+                idle = [http.client.HTTPConnection(*server.server_address[:2],
+                                                   timeout=1)
+                        for _ in range(3)]
+                try:
+                    for other in idle:
+                        other.request('GET', '/plate?ext=.c')
+                        self.assertEqual(other.getresponse().read().decode('utf-8'),
+                                         codetester.LANG['c']['default'])
+                    self.assertEqual(get('/plate?ext=.c')[0].status, 200)
+                finally:
+                    for other in idle:
+                        other.close()
+
+            with self.subTest('silent connections'):
+                # Connections that have not sent a request hold no worker
+                silent = [socket.create_connection(server.server_address[:2])
+                          for _ in range(3)]
+                try:
+                    quick = http.client.HTTPConnection(*server.server_address[:2],
+                                                       timeout=1)
+                    quick.request('GET', '/languages')
+                    self.assertEqual(quick.getresponse().status, 200)
+                    quick.close()
+                finally:
+                    for connection in silent:
+                        connection.close()
+
+            with self.subTest('pipelined requests'):
+                with socket.create_connection(server.server_address[:2],
+                                              timeout=1) as pipe:
+                    pipe.sendall(b'GET /languages HTTP/1.1\r\nHost: x\r\n\r\n'
+                                 b'GET /asdf HTTP/1.1\r\nHost: x\r\n'
+                                 b'Connection: close\r\n\r\n')
+                    with pipe.makefile('rb') as replies:
+                        statuses = re.findall(rb'HTTP/1\.1 (\d+)', replies.read())
+                    self.assertEqual(statuses, [b'200', b'404'])
+        finally:
+            con.close()
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+
+class TestPrepare(unittest.TestCase):
+    '''Plate database build tests'''
+
+    @staticmethod
+    def dump(db_path):
+        '''Returns the plates in a database by language and extension.'''
+
+        with boil.Boiler(db_path) as boiler:
+            return {alias: boiler.plate(lang=alias, ext=alias)
+                    for alias in boiler.supported_languages()
+                    + boiler.supported_extensions()}
+
+    def test_schema_version(self):
+        '''Databases with another layout are refused with a clear error'''
+
+        self.assertEqual(prepare.SCHEMA_VERSION, boil.SQLiteCatalog.SCHEMA_VERSION)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            db_path = os.path.join(temp_dir, 'plates.db')
+            prepare.makeTemplates(PLATES_DIR, db_path)
+
+            con = sqlite3.connect(db_path)
+            con.execute('PRAGMA user_version = 1')
+            con.commit()
+            con.close()
+
+            with self.assertRaisesRegex(ValueError, 'prepare.py'):
+                boil.Boiler(db_path)
+
+    def test_incremental(self):
+        '''Incremental builds match full builds'''
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            plates_path = os.path.join(temp_dir, 'plates')
+            db_path = os.path.join(temp_dir, 'plates.db')
+            full_path = os.path.join(temp_dir, 'full.db')
+            shutil.copytree(PLATES_DIR, plates_path)
+
+            self.assertEqual(prepare.makeTemplates(plates_path, db_path),
+                             (8, 0, 0))
+
+            with self.subTest('unchanged'):
+                with mock.patch('prepare.readPlate') as read_plate:
+                    self.assertEqual(
+                        prepare.makeTemplates(plates_path, db_path), (0, 0, 0))
+                    read_plate.assert_not_called()
+
+            # Change, add and remove plates
+            with open(os.path.join(plates_path, 'c.c'), 'a') as plate_file:
+                plate_file.write('/* changed */\n')
+            with open(os.path.join(plates_path, 'go,golang.go'), 'w') as plate_file:
+                plate_file.write('package main\n')
+            os.remove(os.path.join(plates_path, 'python2.py'))
+            os.rename(os.path.join(plates_path, 'python.py'),
+                      os.path.join(plates_path, 'py.py'))
+
+            with self.subTest('changed'):
+                self.assertEqual(prepare.makeTemplates(plates_path, db_path),
+                                 (2, 1, 2))
+
+                prepare.makeTemplates(plates_path, full_path, full=True)
+                self.assertEqual(self.dump(db_path), self.dump(full_path))
+                self.assertIn('golang', self.dump(db_path))
+                self.assertNotIn('python2', self.dump(db_path))
+
+                # Search indexes match too
+                for table in ('trigrams', 'trigram_counts'):
+                    rows = []
+                    for path in (db_path, full_path):
+                        con = sqlite3.connect(path)
+                        rows.append(con.execute(
+                            'SELECT * FROM {0} ORDER BY 1, 2'.format(table)).fetchall())
+                        con.close()
+                    self.assertEqual(rows[0], rows[1])
+
+    def test_compression(self):
+        '''Compressed databases match plain databases'''
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            plain_path = os.path.join(temp_dir, 'plain.db')
+            db_path = os.path.join(temp_dir, 'plates.db')
+
+            prepare.makeTemplates(PLATES_DIR, plain_path)
+            expected = self.dump(plain_path)
+
+            for codec in prepare.CODECS:
+                with self.subTest(codec):
+                    self.assertEqual(
+                        prepare.makeTemplates(PLATES_DIR, db_path, codec=codec),
+                        (8, 0, 0))
+                    self.assertEqual(self.dump(db_path), expected)
+
+                    con = sqlite3.connect(db_path)
+                    self.assertEqual(
+                        con.execute('SELECT DISTINCT typeof(template), codec'
+                                    ' FROM templates').fetchall(),
+                        [('blob', codec)])
+                    con.close()
+
+                    # Incremental builds keep the codec
+                    self.assertEqual(
+                        prepare.makeTemplates(PLATES_DIR, db_path, codec=codec),
+                        (0, 0, 0))
+
+    def test_partials(self):
+        '''Templates are stored once and partials are resolved'''
+
+        def write(file_name, text):
+            with open(os.path.join(plates_path, file_name), 'w') as plate_file:
+                plate_file.write(text)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            plates_path = os.path.join(temp_dir, 'plates')
+            db_path = os.path.join(temp_dir, 'plates.db')
+            os.makedirs(os.path.join(plates_path, 'partials'))
+
+            write('a.a', '# a\n{BP_INCLUDE body}\n')
+            write('b.b', '# b\n{BP_INCLUDE body}\n')
+            write('c.c', 'same\n')
+            write('d.d', 'same\n')
+            write('partials/body', 'class {BP_NAME}:\n{BP_INCLUDE end}\n')
+            write('partials/end', '\tpass\n')
+
+            prepare.makeTemplates(plates_path, db_path)
+
+            with boil.Boiler(db_path) as boiler:
+                self.assertEqual(boiler.plate(lang='a', options={'name': 'X'}),
+                                 '# a\nclass X:\n\tpass\n')
+                self.assertEqual(boiler.plate(lang='c'), 'same\n')
+                self.assertIs(boiler.get_plate(lang='c'),
+                              boiler.get_plate(lang='d'))
+
+            con = sqlite3.connect(db_path)
+            self.assertEqual(con.execute('SELECT COUNT(*) FROM templates').fetchone(),
+                             (5,))
+            con.close()
+
+            with self.subTest('changed partial'):
+                write('partials/end', '\treturn\n')
+                self.assertEqual(prepare.makeTemplates(plates_path, db_path),
+                                 (0, 1, 0))
+                with boil.Boiler(db_path) as boiler:
+                    self.assertEqual(boiler.plate(lang='b'),
+                                     '# b\nclass DEFAULT_NAME:\n\treturn\n')
+
+            with self.subTest('catalog'):
+                catalog_path = os.path.join(temp_dir, 'plates.cat')
+                prepare.makeCatalog(db_path, catalog_path)
+                with boil.Boiler(db_path) as database, \
+                        boil.Boiler(catalog_path) as catalog:
+                    for lang in 'abcd':
+                        self.assertEqual(catalog.plate(lang=lang),
+                                         database.plate(lang=lang))
+
+            for text in ('{BP_INCLUDE missing}', '{BP_INCLUDE body}'):
+                with self.subTest(text):
+                    write('partials/end', text)
+                    self.assertRaises(ValueError, prepare.makeTemplates,
+                                      plates_path, db_path)
+                    with boil.Boiler(db_path) as boiler:
+                        self.assertTrue(boiler.plate(lang='a').endswith('\treturn\n'))
+
+    def test_alias_collisions(self):
+        '''Alias collisions are reported individually'''
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            plates_path = os.path.join(temp_dir, 'plates')
+            db_path = os.path.join(temp_dir, 'plates.db')
+            os.mkdir(plates_path)
+
+            for file_name in ('a,b.x.y', 'B,c.Y.z', 'd,a.w'):
+                with open(os.path.join(plates_path, file_name), 'w') as plate_file:
+                    plate_file.write(file_name)
+
+            errors = io.StringIO()
+            with contextlib.redirect_stderr(errors):
+                prepare.makeTemplates(plates_path, db_path)
+
+            self.assertEqual(errors.getvalue().splitlines(), [
+                'Alias "b" of a,b.x.y is already used by B,c.Y.z',
+                'Alias "y" of a,b.x.y is already used by B,c.Y.z',
+                'Alias "a" of d,a.w is already used by a,b.x.y'])
+
+            with boil.Boiler(db_path) as boiler:
+                self.assertEqual(boiler.plate(lang='c'), 'B,c.Y.z')
+                self.assertEqual(boiler.plate(ext='z'), 'B,c.Y.z')
+                self.assertEqual(boiler.plate(lang='b'), 'B,c.Y.z')
+                self.assertEqual(boiler.plate(ext='y'), 'B,c.Y.z')
+                self.assertEqual(boiler.plate(ext='x'), 'a,b.x.y')
+
+
+class TestPlate(unittest.TestCase):
+    '''Compiled plate tests'''
+
+    @staticmethod
+    def regex_generate(plate, name=None, funcs=None, newlines=False, spaces=0):
+        '''Generates a template with the original regex pipeline.'''
+
+        template = plate.new_template(name)
+        template = plate.insert_functions(template, funcs if funcs else [])
+        template = plate.insert_breaks(template, newlines=newlines)
+        if spaces:
+            template = plate.replace_tabs(template, spaces)
+
+        return template
+
+    @staticmethod
+    def plates():
+        '''Yields each plate file name and its text with includes resolved.'''
+
+        def partial(name):
+            with open(os.path.join(PLATES_DIR, 'partials', name)) as plate_file:
+                return plate_file.read()
+
+        for file_name in sorted(os.listdir(PLATES_DIR)):
+            path = os.path.join(PLATES_DIR, file_name)
+            if os.path.isfile(path):
+                with open(path) as plate_file:
+                    yield file_name, boil.boil.resolve_includes(
+                        plate_file.read(), partial)
+
+    def test_regex_equivalence(self):
+        '''Compiled output matches the regex pipeline for every plate'''
+
+        cases = list(itertools.product(
+            [None, 'Blue'],
+            [None, [], ['green'], ['f{0}'.format(i) for i in range(50)]],
+            [False, True],
+            [0, 2, 4]))
+
+        for file_name, template in self.plates():
+            plate = boil.Plate(template)
+
+            for name, funcs, newlines, spaces in cases:
+                with self.subTest(file_name, name=name, funcs=funcs,
+                                  newlines=newlines, spaces=spaces):
+                    self.assertEqual(
+                        plate.generate(name, funcs, newlines, spaces),
+                        self.regex_generate(plate, name, funcs, newlines, spaces))
+
+    def test_generate_iter(self):
+        '''Streamed output matches generate for every plate'''
+
+        cases = list(itertools.product(
+            [[], ['green'], ['f{0}'.format(i) for i in range(50)]],
+            [False, True],
+            [0, 3, 4]))
+
+        for file_name, template in self.plates():
+            plate = boil.Plate(template)
+
+            for funcs, newlines, spaces in cases:
+                with self.subTest(file_name, funcs=funcs,
+                                  newlines=newlines, spaces=spaces):
+                    expected = plate.generate('Blue', funcs, newlines, spaces)
+
+                    self.assertEqual(''.join(plate.generate_iter(
+                        'Blue', iter(funcs), newlines, spaces)), expected)
+
+                    output = io.StringIO()
+                    plate.generate_to(output, 'Blue', funcs, newlines, spaces)
+                    self.assertEqual(output.getvalue(), expected)
+
+    def test_expand_tabs(self):
+        '''Tabs are expanded by column across chunks'''
+
+        chunks = ['a\t', 'bc\td', '\n\t', 'x\r\ty', '\t']
+
+        for spaces in (-1, 0, 1, 3, 8):
+            with self.subTest(spaces=spaces):
+                self.assertEqual(
+                    ''.join(boil.Plate._expand_tabs(chunks, spaces)),
+                    ''.join(chunks).expandtabs(spaces))
+
+    def test_literal_names(self):
+        '''Names are inserted literally'''
+
+        plate = boil.Plate('{BP_NAME} {BP_FUNC_BEG}{BP_FNAME}{BP_FUNC_END}')
+
+        self.assertEqual(plate.generate(name='a\\1', funcs=['b\\n']),
+                         'a\\1 b\\n')
+
+    def test_shared(self):
+        '''Plates are shared by template text while they are in use'''
+
+        import gc
+        import pickle
+
+        template = '{BP_NAME} shared'
+
+        with boil.Boiler(PLATES_DB) as first, boil.Boiler(PLATES_DB) as second:
+            self.assertIs(first.get_plate(lang='python'),
+                          second.get_plate(ext='py'))
+
+        plate = boil.Plate.shared(template)
+        self.assertIs(boil.Plate.shared(''.join(['{BP_NAME}', ' shared'])), plate)
+        self.assertIs(pickle.loads(pickle.dumps(plate)), plate)
+        self.assertFalse(hasattr(plate, '__dict__'))
+
+        # Shared compiled parts cannot be modified in place
+        for parts in plate._parts + plate._function_parts:
+            self.assertIsInstance(parts, tuple)
+
+        del plate
+        gc.collect()
+        self.assertNotIn(template, boil.Plate._registry)
+
 if __name__ == '__main__':
     unittest.main()